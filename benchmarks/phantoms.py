@@ -0,0 +1,92 @@
+import os
+
+import nibabel as nib
+import numpy as np
+
+# Grid sizes of the synthetic scans
+SIZES = {
+    "small": (128, 128, 64),
+    "medium": (256, 256, 128),
+    "large": (512, 512, 160),
+}
+SPACING = (0.8, 0.8, 2.0)
+
+
+def _ellipsoid(shape, center, radii):
+    """Bounding box slices and the voxels inside an ellipsoid (centre and radii in voxels)."""
+    box = tuple(
+        slice(max(int(c - r) - 1, 0), min(int(c + r) + 2, n))
+        for c, r, n in zip(center, radii, shape)
+    )
+    coords = np.ogrid[box]
+    inside = sum(((x - c) / r) ** 2 for x, c, r in zip(coords, center, radii)) <= 1.0
+    return box, inside
+
+
+def phantom(shape, n_labels, seed=0):
+    """
+    Deterministic synthetic abdomen: an elliptic body of soft tissue with
+    n_labels ellipsoid organs of different densities, plus noise.
+    Returns (ct int16 in HU, labels).
+    """
+    rng = np.random.default_rng(seed)
+    nx, ny, nz = shape
+    x, y = np.ogrid[:nx, :ny]
+    body = (((x - nx / 2) / (0.45 * nx)) ** 2 + ((y - ny / 2) / (0.35 * ny)) ** 2) <= 1.0
+    ct = np.full(shape, -1000, dtype=np.int16)
+    ct[body] = 40
+    labels = np.zeros(shape, dtype=np.uint8 if n_labels < 256 else np.uint16)
+    # Organs shrink as there are more of them, so they still fit in the body
+    scale = 0.25 * max(n_labels, 1) ** (-1 / 3)
+    for label in range(1, n_labels + 1):
+        center = (
+            nx / 2 + rng.uniform(-0.3, 0.3) * nx,
+            ny / 2 + rng.uniform(-0.2, 0.2) * ny,
+            rng.uniform(0.2, 0.8) * nz,
+        )
+        radii = tuple(rng.uniform(0.5, 1.0) * scale * n for n in (nx, ny, nz))
+        box, inside = _ellipsoid(shape, center, radii)
+        # Organs never overlap, the first one keeps a contested voxel
+        inside = inside & (labels[box] == 0) & body[box[:2]][..., None]
+        labels[box][inside] = label
+        ct[box][inside] = rng.integers(30, 200)
+    ct += rng.normal(0, 15, size=shape).astype(np.int16)
+    return ct, labels
+
+
+def prediction(labels, label):
+    """A plausible imperfect prediction of one label: the organ shifted by one voxel."""
+    return np.roll(labels == label, 1, axis=label % 3)
+
+
+def phantom_dir(work_dir, size, n_labels, seed=0):
+    return os.path.join(work_dir, f"{size}_{n_labels}labels_seed{seed}")
+
+
+def write_phantom(work_dir, size, n_labels, seed=0):
+    """
+    Write a phantom as NIfTI files (scan.nii.gz, gt/organ_XX.nii.gz and
+    pred/organ_XX.nii.gz) unless they already exist, and return their paths
+    as {"scan": path, "gt": {name: path}, "pred": {name: path}}.
+    """
+    folder = phantom_dir(work_dir, size, n_labels, seed)
+    names = [f"organ_{label:02d}" for label in range(1, n_labels + 1)]
+    paths = {
+        "scan": os.path.join(folder, "scan.nii.gz"),
+        "gt": {name: os.path.join(folder, "gt", name + ".nii.gz") for name in names},
+        "pred": {name: os.path.join(folder, "pred", name + ".nii.gz") for name in names},
+    }
+    done = os.path.join(folder, ".complete")
+    if os.path.exists(done):
+        return paths
+    os.makedirs(os.path.join(folder, "gt"), exist_ok=True)
+    os.makedirs(os.path.join(folder, "pred"), exist_ok=True)
+    ct, labels = phantom(SIZES[size], n_labels, seed)
+    affine = np.diag([*SPACING, 1.0])
+    nib.save(nib.Nifti1Image(ct, affine), paths["scan"])
+    for label, name in enumerate(names, start=1):
+        nib.save(nib.Nifti1Image((labels == label).astype(np.uint8), affine), paths["gt"][name])
+        nib.save(nib.Nifti1Image(prediction(labels, label).astype(np.uint8), affine), paths["pred"][name])
+    # Marks a fully written phantom, an interrupted run writes it again
+    open(done, "w").close()
+    return paths
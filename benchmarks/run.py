@@ -0,0 +1,230 @@
+"""
+Timings of the loading, meshing, slice rendering and evaluation hot paths
+on synthetic phantoms, no patient data needed. Run from the repository root:
+
+    python -m benchmarks.run --save bench.json
+    python -m benchmarks.run --baseline bench.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Slice viewers are Qt widgets, draw them without a display
+if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.phantoms import SIZES, write_phantom
+
+WORK_DIR = os.path.join(tempfile.gettempdir(), "mis_benchmark_phantoms")
+BENCHMARKS = ("load", "slabs", "surfaces_fast", "surfaces_balanced", "lods", "slice_sweep", "slice_sweep_draw", "metrics")
+# Relative change that counts as a regression against the baseline
+TOLERANCE = 0.2
+
+
+def bench_load(paths):
+    """Decode the scan and every mask into a fresh registry."""
+    from volume_registry import VolumeRegistry
+    registry = VolumeRegistry()
+
+    def run():
+        registry.clear()
+        registry.array(paths["scan"])
+        for path in paths["gt"].values():
+            registry.mask(path)
+    return run
+
+
+def bench_slabs(paths):
+    """First, middle and last plane along every axis of a freshly opened scan, as the slice viewers read them."""
+    from volume_registry import VolumeRegistry
+    registry = VolumeRegistry()
+    # Builds the chunk cache, the runs measure reads from it
+    registry.lazy(paths["scan"])
+
+    def run():
+        registry.clear()
+        scan = registry.lazy(paths["scan"])
+        for axis, n in enumerate(scan.shape):
+            for idx in (0, n // 2, n - 1):
+                index = [slice(None)] * 3
+                index[axis] = idx
+                scan[tuple(index)]
+    return run
+
+
+def bench_surfaces(paths, preset):
+    """OrgansViewer contour + smooth stage for all structures, masks already loaded."""
+    from surface_builder import build_surfaces
+    sources = {name: (path, None) for name, path in paths["gt"].items()}
+    build_surfaces(sources, preset)
+    return lambda: build_surfaces(sources, preset)
+
+
+def bench_lods(paths):
+    """Surfaces plus their levels of detail, as the mesh worker builds them."""
+    from mesh_builder import build_lods
+    sources = {name: (path, None) for name, path in paths["gt"].items()}
+    return lambda: build_lods(sources)
+
+
+def _slice_viewer(paths):
+    from PySide6 import QtWidgets
+    from slicer import SliceViewer
+    from volume_registry import get_registry
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    registry = get_registry()
+    masks = {name: registry.mask(path) for name, path in paths["gt"].items()}
+    indices = {name: registry.index(path) for name, path in paths["gt"].items()}
+    return SliceViewer(registry.array(paths["scan"]), masks, orientation="axial", mask_indices=indices)
+
+
+def bench_slice_sweep(paths, draw=False):
+    """SliceViewer.update_slice over every axial slice, optionally with a full canvas draw each time."""
+    viewer = _slice_viewer(paths)
+
+    def run():
+        viewer.prefetcher.invalidate()
+        for idx in range(viewer.max_idx + 1):
+            viewer.update_slice(idx)
+            if draw:
+                viewer.canvas.draw()
+    return run
+
+
+def bench_metrics(paths):
+    """evaluation.csv metrics (overlap and surface) of every predicted structure."""
+    from evaluate import score_pair
+    return lambda: [score_pair(paths["pred"][name], gt) for name, gt in paths["gt"].items()]
+
+
+def setup(name, paths):
+    if name == "load":
+        return bench_load(paths)
+    if name == "slabs":
+        return bench_slabs(paths)
+    if name.startswith("surfaces_"):
+        return bench_surfaces(paths, name.split("_", 1)[1])
+    if name == "lods":
+        return bench_lods(paths)
+    if name == "slice_sweep":
+        return bench_slice_sweep(paths)
+    if name == "slice_sweep_draw":
+        return bench_slice_sweep(paths, draw=True)
+    if name == "metrics":
+        return bench_metrics(paths)
+    raise ValueError(f"unknown benchmark {name}")
+
+
+def measure(run, repeat):
+    """Median wall time over repeat runs, then one extra traced run for the peak of Python/numpy allocations."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": statistics.median(times), "runs": times, "peak_mb": peak / 2 ** 20}
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def run_all(sizes, label_counts, benchmarks, repeat=3, seed=0, work_dir=WORK_DIR):
+    results = {}
+    for size in sizes:
+        for n_labels in label_counts:
+            paths = write_phantom(work_dir, size, n_labels, seed)
+            for name in benchmarks:
+                key = f"{name}/{size}/{n_labels}"
+                try:
+                    result = measure(setup(name, paths), repeat)
+                except Exception as e:
+                    print(f"[warn] {key} failed: {e}")
+                    continue
+                results[key] = result
+                print(f"{key:<36} {result['seconds'] * 1000:10.1f} ms  peak {result['peak_mb']:8.1f} MB")
+    return {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+            "max_rss_mb": max_rss_mb(),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Print each result against the baseline, return the keys that got slower than tolerance allows."""
+    slower = []
+    print(f"\n{'benchmark':<36} {'baseline':>10} {'now':>10} {'change':>8}")
+    for key, result in report["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        change = result["seconds"] / base["seconds"] - 1.0 if base["seconds"] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  slower"
+            slower.append(key)
+        elif change < -tolerance:
+            flag = "  faster"
+        print(f"{key:<36} {base['seconds'] * 1000:8.1f}ms {result['seconds'] * 1000:8.1f}ms {change * 100:+7.1f}%{flag}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading, meshing, slice rendering and metrics on synthetic phantoms")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(SIZES))
+    parser.add_argument("--labels", nargs="+", type=int, default=[4, 16], help="organ counts of the phantoms")
+    parser.add_argument("--only", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=WORK_DIR, help="where the phantoms are written (reused between runs)")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --save to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    report = run_all(args.sizes, args.labels, args.only, args.repeat, args.seed, args.work_dir)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(report, baseline, args.tolerance)
+        if slower:
+            print(f"{len(slower)} benchmark(s) slower than the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import nibabel as nib
+import numpy as np
+from scipy import ndimage
+
+from evaluate import MODEL_FOLDERS, ROOT, load_mask, normalize_case
+from label_volume import PACKED_SUFFIX, case_id, is_nifti, read_label_table, structure_name
+from mask_index import MaskIndex
+
+# Kept in the root folder it describes
+CATALOG_NAME = ".catalog.sqlite"
+# Organ folders the app shows, one sub-folder per model
+VIEW_FOLDERS = ("kidney", "liver", "stomach")
+# Other spellings of structures, mapped to the names used in evaluation.csv
+ORGAN_ALIASES = {
+    "ivc": "IVC",
+    "inferior_vena_cava": "IVC",
+    "portal_vein_and_splenic_vein": "vein_portal",
+    "portal_vein": "vein_portal",
+    "left_kidney": "kidney_left",
+    "right_kidney": "kidney_right",
+    "left_adrenal_gland": "adrenal_left",
+    "right_adrenal_gland": "adrenal_right",
+    "adrenal_gland_left": "adrenal_left",
+    "adrenal_gland_right": "adrenal_right",
+    "gall_bladder": "gallbladder",
+    "oesophagus": "esophagus",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    collection TEXT,
+    model TEXT,
+    case_id TEXT,
+    kind TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    shape TEXT,
+    spacing TEXT,
+    affine TEXT,
+    dtype TEXT,
+    indexed INTEGER
+);
+CREATE TABLE IF NOT EXISTS structures (
+    path TEXT,
+    label INTEGER,
+    name TEXT,
+    voxel_count INTEGER,
+    bbox TEXT,
+    PRIMARY KEY (path, label)
+);
+CREATE INDEX IF NOT EXISTS files_by_model ON files (collection, model);
+"""
+
+
+def normalize_organ(name):
+    """Structure name of a file or label, with the spellings of the different models unified."""
+    name = structure_name(name).strip().replace(" ", "_").replace("-", "_").lower()
+    return ORGAN_ALIASES.get(name, name)
+
+
+def watched_folders(root):
+    folders = [os.path.join(root, folder) for folder in MODEL_FOLDERS.values()]
+    folders += [os.path.join(root, folder) for folder in VIEW_FOLDERS]
+    return [folder for folder in folders if os.path.isdir(folder)]
+
+
+def snapshot(folders):
+    """{path: (size, mtime_ns)} of every NIfTI file below folders."""
+    files = {}
+    for folder in folders:
+        for dirpath, dirnames, filenames in os.walk(folder):
+            for f in filenames:
+                if not is_nifti(f):
+                    continue
+                path = os.path.join(dirpath, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Removed between listing and stat
+                    continue
+                files[path] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def locate(path, root):
+    """(collection, model, case) of a file below root: its top folder, model folder and case, if any."""
+    parts = os.path.relpath(path, root).split(os.sep)
+    collection = parts[0] if len(parts) > 1 else None
+    model = None
+    case = case_id(path)
+    if collection in VIEW_FOLDERS and len(parts) == 3:
+        model = parts[1]
+    elif collection in MODEL_FOLDERS.values():
+        model = next(m for m, folder in MODEL_FOLDERS.items() if folder == collection)
+        if len(parts) == 3:
+            case = parts[1]
+    return collection, model, normalize_case(case) if case is not None else None
+
+
+def index_file(path, root=ROOT, decode=True):
+    """
+    Catalog record of one segmentation file: header fields, plus voxel
+    count and bounding box of each structure when decode is set (that
+    reads the whole volume). Worker entry point of Catalog.refresh.
+    """
+    st = os.stat(path)
+    img = nib.load(path)
+    collection, model, case = locate(path, root)
+    record = {
+        "path": path,
+        "collection": collection,
+        "model": model,
+        "case_id": case,
+        "kind": "packed" if path.endswith(PACKED_SUFFIX) else "mask",
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "shape": [int(n) for n in img.shape[:3]],
+        "spacing": [float(z) for z in img.header.get_zooms()[:3]],
+        "affine": img.affine.tolist(),
+        "dtype": str(img.header.get_data_dtype()),
+        "indexed": decode,
+        "structures": [],
+    }
+    if record["kind"] == "packed":
+        table = read_label_table(path)
+        counts = objects = None
+        if decode:
+            labels = np.asanyarray(img.dataobj)
+            counts = np.bincount(labels.ravel(), minlength=max(table) + 1)
+            objects = ndimage.find_objects(labels, max_label=max(table))
+        for label, name in sorted(table.items()):
+            box = objects[label - 1] if objects is not None else None
+            record["structures"].append({
+                "label": label,
+                "name": normalize_organ(name),
+                "voxel_count": int(counts[label]) if counts is not None else None,
+                "bbox": [[s.start, s.stop] for s in box] if box is not None else None,
+            })
+    else:
+        voxel_count = bbox = None
+        if decode:
+            index = MaskIndex.from_mask(load_mask(path))
+            voxel_count = index.voxel_count
+            bbox = [list(b) for b in index.bbox] if not index.empty else None
+        record["structures"].append({"label": 0, "name": normalize_organ(path), "voxel_count": voxel_count, "bbox": bbox})
+    return record
+
+
+class Catalog:
+    """
+    SQLite catalog of the segmentation files below root: header fields of
+    every file and name, voxel count and bounding box of every structure.
+    refresh() only re-reads files whose size or mtime changed, so screens
+    and batch tools query it instead of listing folders and decoding headers.
+    """
+    def __init__(self, root=ROOT, path=None):
+        self.root = root
+        self.path = path or os.path.join(root, CATALOG_NAME)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        # Watcher and app write from different processes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def refresh(self, folders=None, decode=True, workers=1):
+        """Bring the catalog up to date with folders (all watched folders by default). Returns the number of files (re)read."""
+        folders = watched_folders(self.root) if folders is None else [f for f in folders if os.path.isdir(f)]
+        current = snapshot(folders)
+        with self.lock:
+            rows = self.db.execute("SELECT path, size, mtime_ns, indexed FROM files").fetchall()
+        known = {row["path"]: row for row in rows if any(row["path"].startswith(os.path.join(f, "")) for f in folders)}
+        stale = [
+            path for path, (size, mtime_ns) in current.items()
+            if path not in known or (known[path]["size"], known[path]["mtime_ns"]) != (size, mtime_ns)
+            or (decode and not known[path]["indexed"])
+        ]
+        self.remove(set(known) - set(current))
+        if not stale:
+            return 0
+        if workers == 1 or len(stale) == 1:
+            for path in stale:
+                self.put(_safe_index(path, self.root, decode))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for record in pool.map(_safe_index, stale, [self.root] * len(stale), [decode] * len(stale)):
+                    self.put(record)
+        return len(stale)
+
+    def put(self, record):
+        """Store one index_file record, replacing what was known about its file."""
+        if record is None:
+            return
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM structures WHERE path = ?", (record["path"],))
+            self.db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["path"], record["collection"], record["model"], record["case_id"], record["kind"], record["size"], record["mtime_ns"],
+                 json.dumps(record["shape"]), json.dumps(record["spacing"]), json.dumps(record["affine"]), record["dtype"], int(record["indexed"])),
+            )
+            self.db.executemany(
+                "INSERT INTO structures VALUES (?, ?, ?, ?, ?)",
+                [(record["path"], s["label"], s["name"], s["voxel_count"], json.dumps(s["bbox"])) for s in record["structures"]],
+            )
+
+    def remove(self, paths):
+        if not paths:
+            return
+        with self.lock, self.db:
+            for path in paths:
+                self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+                self.db.execute("DELETE FROM structures WHERE path = ?", (path,))
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+    def models(self, collection):
+        """Model folders of a collection, e.g. the models of the 'kidney' screen."""
+        return [row["model"] for row in self._query(
+            "SELECT DISTINCT model FROM files WHERE collection = ? AND model IS NOT NULL ORDER BY model", (collection,))]
+
+    def _structures(self, collection, model):
+        """(entry, path, label, name) of one model: per mask file, or per structure of its packed label volume."""
+        rows = self._query(
+            "SELECT f.path, f.kind, s.label, s.name FROM files f JOIN structures s ON s.path = f.path "
+            "WHERE f.collection = ? AND f.model = ? ORDER BY f.path, s.label", (collection, model))
+        packed = [row for row in rows if row["kind"] == "packed"]
+        if packed:
+            first = packed[0]["path"]
+            return [(row["name"], row["path"], row["label"], row["name"]) for row in packed if row["path"] == first]
+        return [(os.path.basename(row["path"]), row["path"], None, row["name"]) for row in rows]
+
+    def sources(self, collection, model):
+        """Mesh sources of one model as {entry: (path, label)}, label None for mask files."""
+        return {entry: (path, label) for entry, path, label, _ in self._structures(collection, model)}
+
+    def names(self, collection, model):
+        """Normalised structure name of every entry of sources()."""
+        return {entry: name for entry, _, _, name in self._structures(collection, model)}
+
+    def predictions(self, model, default_case=None):
+        """(case, organ, path) of every mask of a model's segmentation folder, like evaluate.discover_predictions."""
+        rows = self._query(
+            "SELECT f.path, f.case_id, s.name FROM files f JOIN structures s ON s.path = f.path "
+            "WHERE f.collection = ? AND f.kind = 'mask' ORDER BY f.path", (MODEL_FOLDERS[model],))
+        for row in rows:
+            case = row["case_id"] or (normalize_case(default_case) if default_case is not None else None)
+            if case is not None:
+                yield case, row["name"], row["path"]
+
+    def structure(self, path, label=0):
+        """Name, voxel count and bounding box of one structure, or None."""
+        rows = self._query("SELECT name, voxel_count, bbox FROM structures WHERE path = ? AND label = ?", (path, label))
+        if not rows:
+            return None
+        return {"name": rows[0]["name"], "voxel_count": rows[0]["voxel_count"], "bbox": json.loads(rows[0]["bbox"])}
+
+    def header(self, path):
+        """Shape, spacing, affine and dtype of a file, or None unless the catalog is current for it."""
+        rows = self._query("SELECT size, mtime_ns, shape, spacing, affine, dtype FROM files WHERE path = ?", (path,))
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not rows or (rows[0]["size"], rows[0]["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+            return None
+        row = rows[0]
+        return {
+            "shape": tuple(json.loads(row["shape"])),
+            "spacing": tuple(json.loads(row["spacing"])),
+            "affine": np.array(json.loads(row["affine"])),
+            "dtype": np.dtype(row["dtype"]),
+        }
+
+    def summary(self):
+        return self._query(
+            # Structures are counted per file first, so a packed file with many structures is still one file
+            "SELECT f.collection, f.model, COUNT(*) AS files, SUM(s.structures) AS structures, SUM(f.indexed) AS indexed "
+            "FROM files f JOIN (SELECT path, COUNT(*) AS structures FROM structures GROUP BY path) s ON s.path = f.path "
+            "GROUP BY f.collection, f.model ORDER BY f.collection, f.model")
+
+    def close(self):
+        self.db.close()
+
+
+def _safe_index(path, root, decode):
+    try:
+        return index_file(path, root, decode)
+    except Exception as e:
+        print(f"[warn] could not catalog {path}: {e}")
+        return None
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(root=ROOT):
+    """Process-wide catalog of root."""
+    root = os.path.abspath(root)
+    with _catalogs_lock:
+        catalog = _catalogs.get(root)
+        if catalog is None:
+            catalog = _catalogs[root] = Catalog(root)
+        return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the catalog of segmentation files")
+    parser.add_argument("--root", default=ROOT, help="folder holding the segmented_organs_by_* and organ folders")
+    parser.add_argument("--db", help=f"catalog file, {CATALOG_NAME} in the root folder by default")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--headers-only", action="store_true", help="skip voxel counts and bounding boxes (no volume decoding)")
+    args = parser.parse_args()
+    catalog = Catalog(args.root, args.db)
+    updated = catalog.refresh(decode=not args.headers_only, workers=args.workers)
+    print(f"{updated} file(s) read")
+    for row in catalog.summary():
+        print(f"{row['collection']:<34} {row['model'] or '-':<20} {row['files']:5d} files {row['structures']:5d} structures {row['indexed']:5d} indexed")
+
+
+if __name__ == "__main__":
+    main()
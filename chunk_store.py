@@ -0,0 +1,430 @@
+import base64
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+import nibabel as nib
+import numpy as np
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_DIR = os.path.join(os.path.dirname(__file__), ".chunk_cache")
+# MIS_CHUNK_CACHE=0 reads every .nii.gz straight through nibabel again
+ENABLED = os.environ.get("MIS_CHUNK_CACHE", "1") != "0"
+CHUNK_SIZE = int(os.environ.get("MIS_CHUNK_SIZE", 32))
+MAX_CACHE_BYTES = int(os.environ.get("MIS_CHUNK_CACHE_MB", 2048)) * 1024 * 1024
+# Decoded chunks kept per volume, so scrolling through neighbouring slices decodes each chunk once
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+MAGIC = b"MISCHNK2"
+# Chunks that do not compress below this fraction of their size are stored raw, reading those is a plain copy
+RAW_RATIO = 0.75
+
+# name -> (compress, decompress); all of them release the GIL, so chunks are coded on threads
+CODECS = {"zlib": (lambda data: zlib.compress(data, 1), zlib.decompress)}
+if lz4_frame is not None:
+    CODECS["lz4"] = (lz4_frame.compress, lz4_frame.decompress)
+if zstandard is not None:
+    CODECS["zstd"] = (lambda data: zstandard.compress(data, 3), zstandard.decompress)
+# Fastest codec installed, unless MIS_CHUNK_CODEC picks one
+DEFAULT_CODEC = os.environ.get("MIS_CHUNK_CODEC") or next(c for c in ("lz4", "zstd", "zlib") if c in CODECS)
+
+# Chunks are coded in this many batches at once
+CHUNK_THREADS = min(8, os.cpu_count() or 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def chunk_executor():
+    """Threads shared by every chunked volume for coding chunks."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CHUNK_THREADS, thread_name_prefix="chunks")
+        return _executor
+
+
+def _forget_executor():
+    global _executor
+    _executor = None
+
+
+# A forked worker does not inherit the threads, it starts its own pool
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _in_batches(fn, items):
+    """fn applied to contiguous batches of items, one batch per chunk thread; a thread per chunk costs more than small chunks take."""
+    size = max(1, -(-len(items) // CHUNK_THREADS))
+    batches = [items[i:i + size] for i in range(0, len(items), size)]
+    if len(batches) <= 1:
+        return [fn(batch) for batch in batches]
+    return list(chunk_executor().map(fn, batches))
+
+
+def _chunk_region(index, chunks, shape):
+    return tuple(slice(i * c, min((i + 1) * c, n)) for i, c, n in zip(index, chunks, shape))
+
+
+def _shuffle(block):
+    """Bytes of block grouped by significance (all low bytes, then all high bytes), which compresses better."""
+    block = np.ascontiguousarray(block)
+    if block.dtype.itemsize == 1:
+        return block.tobytes()
+    return block.view(np.uint8).reshape(-1, block.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(buffer, dtype, shape):
+    if dtype.itemsize == 1:
+        return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+    planes = np.frombuffer(buffer, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    block = np.empty(shape, dtype=dtype)
+    # One strided copy per byte plane, much cheaper than transposing the whole buffer
+    interleaved = block.reshape(-1).view(np.uint8).reshape(-1, dtype.itemsize)
+    for i in range(dtype.itemsize):
+        interleaved[:, i] = planes[i]
+    return block
+
+
+def write_chunked(data, out_path, affine, header, chunk_size=CHUNK_SIZE, codec=DEFAULT_CODEC, source=None):
+    """
+    Store a volume as chunk_size^3 chunks, each byte-shuffled and
+    compressed on its own with codec (or kept raw where that saves little),
+    followed by a JSON index of the chunks and the NIfTI affine and header.
+    All-zero chunks are not stored at all.
+    """
+    if codec not in CODECS:
+        print(f"[warn] chunk codec {codec} is not installed, using zlib")
+        codec = "zlib"
+    compress = CODECS[codec][0]
+    data = np.ascontiguousarray(data)
+    chunks = (chunk_size,) * 3
+    grid = [range(-(-n // c)) for n, c in zip(data.shape, chunks)]
+
+    def encode(index):
+        block = data[_chunk_region(index, chunks, data.shape)]
+        if not block.any():
+            return b"", False
+        packed = compress(_shuffle(block))
+        if len(packed) > RAW_RATIO * block.nbytes:
+            return np.ascontiguousarray(block).tobytes(), True
+        return packed, False
+
+    offsets = []
+    # Written to a temp file first so a concurrent reader never sees a partial volume
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            for batch in _in_batches(lambda batch: [encode(index) for index in batch], list(product(*grid))):
+                for blob, raw in batch:
+                    offsets.append((f.tell(), len(blob), raw))
+                    f.write(blob)
+            meta = {
+                "shape": list(data.shape),
+                "dtype": data.dtype.str,
+                "chunks": list(chunks),
+                "codec": codec,
+                "affine": np.asarray(affine).tolist(),
+                "header_class": type(header).__name__,
+                "header": base64.b64encode(header.binaryblock).decode("ascii"),
+                "source": source,
+                "offsets": offsets,
+            }
+            index = json.dumps(meta).encode()
+            f.write(index)
+            f.write(struct.pack("<Q", len(index)))
+        os.replace(tmp, out_path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return out_path
+
+
+class ChunkedVolume:
+    """
+    Random-access view of a volume written by write_chunked. A region
+    decodes only the chunks it touches, in parallel, and recently decoded
+    chunks are kept in a small LRU. Drop-in for LazyVolume: single planes
+    (vol[:, :, k] and friends) and any box of plain slices are read this
+    way, other indexing decodes the whole volume first.
+    """
+    random_access = True
+
+    def __init__(self, path, max_bytes=MAX_DECODED_BYTES):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a chunked volume")
+            f.seek(-8, os.SEEK_END)
+            size = struct.unpack("<Q", f.read(8))[0]
+            f.seek(-8 - size, os.SEEK_END)
+            meta = json.loads(f.read(size))
+        if meta["codec"] not in CODECS:
+            raise ValueError(f"{path} needs the {meta['codec']} codec, which is not installed")
+        self.shape = tuple(meta["shape"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.chunks = tuple(meta["chunks"])
+        self.grid = tuple(-(-n // c) for n, c in zip(self.shape, self.chunks))
+        self.offsets = meta["offsets"]
+        self.decompress = CODECS[meta["codec"]][1]
+        self.affine = np.array(meta["affine"])
+        header_class = getattr(nib, meta.get("header_class", "Nifti1Header"), nib.Nifti1Header)
+        self.header = header_class(base64.b64decode(meta["header"]))
+        self.zooms = self.header.get_zooms()[:3]
+        self.source = meta.get("source")
+        self.file = open(path, "rb")
+        self.file_lock = threading.Lock()
+        self.data = None
+        self.max_bytes = max_bytes
+        self.decoded = OrderedDict()
+        # Chunks may be requested from prefetch threads as well as the GUI thread
+        self.lock = threading.Lock()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Set by the registry, called after the caches grew so it can re-check its budget
+        self.on_grow = None
+
+    @property
+    def ndim(self):
+        return 3
+
+    def _flat(self, index):
+        return (index[0] * self.grid[1] + index[1]) * self.grid[2] + index[2]
+
+    def _decode(self, index):
+        """One chunk as an array, or None where it is all zero."""
+        offset, length, raw = self.offsets[self._flat(index)]
+        if not length:
+            return None
+        with self.file_lock:
+            # Reopened after close(), a volume evicted from the registry may still be read
+            if self.file is None:
+                self.file = open(self.path, "rb")
+            self.file.seek(offset)
+            blob = self.file.read(length)
+        shape = tuple(s.stop - s.start for s in _chunk_region(index, self.chunks, self.shape))
+        if raw:
+            return np.frombuffer(blob, dtype=self.dtype).reshape(shape)
+        return _unshuffle(self.decompress(blob), self.dtype, shape)
+
+    def _chunk(self, index):
+        with self.lock:
+            if index in self.decoded:
+                self.decoded.move_to_end(index)
+                self.hits += 1
+                return self.decoded[index]
+            self.misses += 1
+        block = self._decode(index)
+        with self.lock:
+            grew = index not in self.decoded
+            if grew:
+                self.decoded[index] = block
+                self.cached_bytes += block.nbytes if block is not None else 0
+            while self.cached_bytes > self.max_bytes and len(self.decoded) > 1:
+                _, old = self.decoded.popitem(last=False)
+                self.cached_bytes -= old.nbytes if old is not None else 0
+        if grew:
+            self._grew()
+        return block
+
+    def _grew(self):
+        # Never called with the lock held, the registry may clear this volume
+        if self.on_grow is not None:
+            self.on_grow()
+
+    def read(self, region, cache=True):
+        """Box of plain slices (start/stop within the volume) as a new array."""
+        out = np.zeros(tuple(s.stop - s.start for s in region), dtype=self.dtype)
+        ranges = [range(s.start // c, -(-s.stop // c)) for s, c in zip(region, self.chunks)]
+        # All-zero chunks are left as they are in out
+        indices = [index for index in product(*ranges) if self.offsets[self._flat(index)][1]]
+        decode = self._chunk if cache else self._decode
+
+        def place(batch):
+            # Chunks cover disjoint parts of out, so the threads copy in place
+            for index in batch:
+                block = decode(index)
+                chunk = _chunk_region(index, self.chunks, self.shape)
+                lo = [max(s.start, c.start) for s, c in zip(region, chunk)]
+                hi = [min(s.stop, c.stop) for s, c in zip(region, chunk)]
+                out[tuple(slice(l - s.start, h - s.start) for l, h, s in zip(lo, hi, region))] = \
+                    block[tuple(slice(l - c.start, h - c.start) for l, h, c in zip(lo, hi, chunk))]
+
+        _in_batches(place, indices)
+        return out
+
+    def slab(self, axis, idx):
+        region = [slice(0, n) for n in self.shape]
+        region[axis] = slice(idx, idx + 1)
+        if self.data is not None:
+            return self.data[tuple(region)].squeeze(axis)
+        plane = self.read(region).squeeze(axis)
+        plane.flags.writeable = False
+        return plane
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if self.data is None and len(key) == 3 and all(isinstance(k, (int, np.integer, slice)) for k in key):
+            region = []
+            squeeze = []
+            for axis, (k, n) in enumerate(zip(key, self.shape)):
+                if isinstance(k, slice):
+                    start, stop, step = k.indices(n)
+                    if step != 1:
+                        break
+                    region.append(slice(start, max(start, stop)))
+                else:
+                    k = int(k) + n if k < 0 else int(k)
+                    if not 0 <= k < n:
+                        raise IndexError(f"index {k} is out of bounds for axis {axis} with size {n}")
+                    region.append(slice(k, k + 1))
+                    squeeze.append(axis)
+            else:
+                return self.read(region).squeeze(tuple(squeeze))
+        return np.asarray(self)[key]
+
+    def full(self):
+        """Whole volume decoded once and kept, like LazyVolume.full."""
+        with self.lock:
+            if self.data is not None:
+                self.hits += 1
+                return self.data
+        data = self.read([slice(0, n) for n in self.shape], cache=False)
+        data.flags.writeable = False
+        with self.lock:
+            self.data = data
+            self.decoded.clear()
+            self.cached_bytes = data.nbytes
+            self.misses += 1
+        self._grew()
+        return data
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.data if self.data is not None else self.read([slice(0, n) for n in self.shape], cache=False)
+        return data if dtype is None else data.astype(dtype)
+
+    def clear(self):
+        with self.lock:
+            self.decoded.clear()
+            self.data = None
+            self.cached_bytes = 0
+
+    def close(self):
+        """Release the file handle and the decoded chunks; a later read opens the file again."""
+        self.clear()
+        with self.file_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def cache_path(source, cache_dir=CHUNK_DIR):
+    """Cache file of a source volume, keyed by its path, size and mtime."""
+    source = os.path.abspath(source)
+    st = os.stat(source)
+    key = hashlib.sha1(f"{source}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}.chunks")
+
+
+def cacheable(source):
+    # Uncompressed .nii is memory-mapped by nibabel already
+    return ENABLED and source.endswith(".gz")
+
+
+def store(source, data=None, img=None, cache_dir=CHUNK_DIR):
+    """Re-encode source (decoded as data, if that is at hand) into the cache. Returns the cache path, or None on failure."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        img = img or nib.load(source)
+        if data is None:
+            data = np.asanyarray(img.dataobj)
+        st = os.stat(source)
+        path = write_chunked(data, cache_path(source, cache_dir), img.affine, img.header,
+                             source={"path": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    except Exception as e:
+        print(f"[warn] could not cache chunks of {source}: {e}")
+        return None
+    evict(cache_dir)
+    return path
+
+
+def open_chunked(source, build=True, cache_dir=CHUNK_DIR):
+    """
+    ChunkedVolume of a .nii.gz source from the cache, re-encoded from the
+    source first when it is not cached yet and build is set. None when
+    the cache is off or source is not gzipped.
+    """
+    if not cacheable(source):
+        return None
+    path = cache_path(source, cache_dir)
+    if os.path.exists(path):
+        try:
+            volume = ChunkedVolume(path)
+            os.utime(path)
+            return volume
+        except (OSError, ValueError) as e:
+            print(f"[warn] dropping unreadable chunk cache {path}: {e}")
+            os.remove(path)
+    if not build or store(source, cache_dir=cache_dir) is None:
+        return None
+    return ChunkedVolume(path)
+
+
+def read_volume(source, cache_dir=CHUNK_DIR):
+    """
+    Whole volume as np.asanyarray(nib.load(source).dataobj) gives it, read
+    from the chunk cache when it is there and added to it otherwise.
+    """
+    if not cacheable(source):
+        return np.asanyarray(nib.load(source).dataobj)
+    volume = open_chunked(source, build=False, cache_dir=cache_dir)
+    if volume is not None:
+        data = np.asarray(volume)
+        volume.close()
+        return data
+    img = nib.load(source)
+    data = np.asanyarray(img.dataobj)
+    store(source, data, img, cache_dir)
+    return data
+
+
+def evict(cache_dir=CHUNK_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Drop the least recently opened volumes once the cache grows past max_bytes."""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".chunks"):
+            continue
+        p = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+        total += st.st_size
+    entries.sort()
+    while total > max_bytes and entries:
+        _, size, p = entries.pop(0)
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+        total -= size
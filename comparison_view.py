@@ -0,0 +1,48 @@
+import math
+import os
+
+from pyvistaqt import QtInteractor
+
+# Set MIS_COMPARISON_VIEW=1 to draw all models of an organ in one render window
+COMPARISON_VIEW = os.environ.get("MIS_COMPARISON_VIEW", "0") == "1"
+# Viewports per row before the comparison wraps onto another row
+MAX_COLUMNS = 4
+
+
+class ComparisonView(QtInteractor):
+    """
+    One render window with a viewport per model. All viewports share a
+    single camera, so rotating any model moves every model in the same
+    render pass, and there is only one OpenGL context however many models
+    are compared.
+    """
+    def __init__(self, models, parent=None):
+        self.models = list(models)
+        n = max(len(self.models), 1)
+        self.columns = min(n, MAX_COLUMNS)
+        rows = math.ceil(n / self.columns)
+        super().__init__(parent, shape=(rows, self.columns), border=True)
+        for i, model in enumerate(self.models):
+            self.subplot(*self.position(i))
+            self.add_text(model, font_size=10, color="white", name="model_name")
+        self.link_views()
+
+    def position(self, i):
+        return divmod(i, self.columns)
+
+    def viewport(self, model):
+        return Viewport(self, self.position(self.models.index(model)))
+
+
+class Viewport:
+    """The part of a ComparisonView that belongs to one model; stands in for its own plotter."""
+    def __init__(self, view, position):
+        self.view = view
+        self.position = position
+
+    def add_mesh(self, mesh, **kwargs):
+        self.view.subplot(*self.position)
+        return self.view.add_mesh(mesh, **kwargs)
+
+    def render(self):
+        self.view.render()
@@ -0,0 +1,253 @@
+import argparse
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import nibabel as nib
+import numpy as np
+
+from chunk_store import read_volume
+from label_volume import case_id, is_nifti, structure_name
+from mask_index import MaskIndex
+from surface_metrics import SURFACE_COLUMNS, surface_metrics
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EVALUATION_CSV = os.path.join(ROOT, "evaluation.csv")
+BASE_COLUMNS = ["Model", "Patient_ID", "Organ", "Dice", "IoU", "Pred_Volume", "GT_Volume"]
+COLUMNS = BASE_COLUMNS + SURFACE_COLUMNS
+
+# Model abbreviation used in evaluation.csv -> folder with that model's segmentations
+MODEL_FOLDERS = {
+    "ts": "segmented_organs_by_ts",
+    "wbct": "segmented_organs_by_wbct",
+    "swin": "segmented_organs_by_Swin UNETR",
+}
+# Model names shown in the app -> abbreviation used in evaluation.csv
+MODEL_ABBREVIATIONS = {
+    "Total Segmentator": "ts",
+    "Swin UNETR": "swin",
+    "Whole Body CT": "wbct",
+}
+
+
+def normalize_case(case):
+    """'img0005' and '0005' name the same case; evaluation.csv uses the digits."""
+    match = re.fullmatch(r"img(\d+)", case)
+    return match.group(1) if match else case
+
+
+def discover_predictions(folder, default_case=None):
+    """
+    Yield (case, organ, path) for a model's segmentation folder. Supports
+    flat folders ('liver.nii.gz' or 'img0005.nii.gz_liver.nii.gz') and one
+    sub-folder per case.
+    """
+    for entry in sorted(os.listdir(folder)):
+        path = os.path.join(folder, entry)
+        if os.path.isdir(path):
+            for f in sorted(os.listdir(path)):
+                if is_nifti(f):
+                    yield normalize_case(entry), structure_name(f), os.path.join(path, f)
+        elif is_nifti(entry):
+            case = case_id(entry) or default_case
+            if case is None:
+                continue
+            yield normalize_case(case), structure_name(entry), path
+
+
+def find_ground_truth(gt_dir, case, organ):
+    candidates = []
+    for case_dir in (case, f"img{case}"):
+        for ext in (".nii.gz", ".nii"):
+            candidates.append(os.path.join(gt_dir, case_dir, organ + ext))
+            candidates.append(os.path.join(gt_dir, f"{case_dir}.nii.gz_{organ}{ext}"))
+    for ext in (".nii.gz", ".nii"):
+        candidates.append(os.path.join(gt_dir, organ + ext))
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_mask(path):
+    # Through the chunk cache, a second evaluation run does not gunzip every mask again
+    return read_volume(path) > 0.5
+
+
+def overlap_metrics(pred, gt):
+    """Dice, IoU and voxel volumes, counted only inside the union bounding box."""
+    if pred.shape != gt.shape:
+        raise ValueError(f"shape mismatch {pred.shape} vs {gt.shape}")
+    pred_index = MaskIndex.from_mask(pred)
+    gt_index = MaskIndex.from_mask(gt)
+    pred_volume = pred_index.voxel_count
+    gt_volume = gt_index.voxel_count
+    if pred_volume == 0 and gt_volume == 0:
+        return {"Dice": float("nan"), "IoU": float("nan"), "Pred_Volume": 0, "GT_Volume": 0}
+    boxes = [index.bbox for index in (pred_index, gt_index) if not index.empty]
+    crop = tuple(slice(min(b[a][0] for b in boxes), max(b[a][1] for b in boxes)) for a in range(3))
+    intersection = int(np.count_nonzero(pred[crop] & gt[crop]))
+    union = pred_volume + gt_volume - intersection
+    return {
+        "Dice": 2.0 * intersection / (pred_volume + gt_volume),
+        "IoU": intersection / union,
+        "Pred_Volume": pred_volume,
+        "GT_Volume": gt_volume,
+    }
+
+
+def score_masks(pred, gt_path, surface=True):
+    """Metrics of a prediction mask against the ground truth in gt_path."""
+    gt = load_mask(gt_path)
+    metrics = overlap_metrics(pred, gt)
+    if surface:
+        spacing = nib.load(gt_path).header.get_zooms()[:3]
+        metrics.update(surface_metrics(pred, gt, spacing))
+    return metrics
+
+
+def score_pair(pred_path, gt_path, surface=True):
+    """Worker entry point: metrics of one prediction against its ground truth."""
+    return score_masks(load_mask(pred_path), gt_path, surface)
+
+
+def row_key(row):
+    return row["Model"], normalize_case(row["Patient_ID"]), row["Organ"]
+
+
+def read_rows(csv_path):
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+        return [], None
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        return list(reader), reader.fieldnames
+
+
+def finished_rows(csv_path, required=BASE_COLUMNS):
+    """(Model, Patient_ID, Organ) keys in csv_path that have every required column filled."""
+    rows, _ = read_rows(csv_path)
+    return {row_key(row) for row in rows if all(row.get(c) not in (None, "") for c in required)}
+
+
+def rewrite_rows(csv_path, columns):
+    """
+    Rewrite csv_path with the given header, keeping only the last row of
+    every (Model, Patient_ID, Organ), e.g. after re-scoring rows that were
+    missing the surface metrics.
+    """
+    rows, _ = read_rows(csv_path)
+    latest = {}
+    for row in rows:
+        latest[row_key(row)] = row
+    tmp = csv_path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(latest.values())
+    os.replace(tmp, csv_path)
+
+
+def append_rows(csv_path, rows, surface=True):
+    """
+    Add score rows to csv_path, replacing older rows of the same model, case
+    and organ, e.g. when a segmentation was written again.
+    """
+    columns = COLUMNS if surface else BASE_COLUMNS
+    _, header = read_rows(csv_path)
+    if header is not None:
+        if not set(columns) <= set(header):
+            columns = header + [c for c in columns if c not in header]
+            rewrite_rows(csv_path, columns)
+        else:
+            columns = header
+    with open(csv_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        if header is None:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow({k: f"{v:.8g}" if isinstance(v, float) else v for k, v in row.items()})
+    rewrite_rows(csv_path, columns)
+
+
+def collect_jobs(root, gt_dir, models, default_case=None, skip=()):
+    from catalog import get_catalog
+    catalog = get_catalog(root)
+    jobs = []
+    for model in models:
+        folder = os.path.join(root, MODEL_FOLDERS[model])
+        if not os.path.isdir(folder):
+            print(f"[warn] no segmentation folder for {model}: {folder}")
+            continue
+        catalog.refresh([folder], decode=False)
+        # Organ names are normalised by the catalog, ground truth may still use the file's own spelling
+        for case, organ, pred_path in catalog.predictions(model, default_case):
+            if (model, case, organ) in skip:
+                continue
+            gt_path = find_ground_truth(gt_dir, case, organ) or find_ground_truth(gt_dir, case, structure_name(pred_path))
+            if gt_path is None:
+                continue
+            jobs.append((model, case, organ, pred_path, gt_path))
+    return jobs
+
+
+def evaluate(root, gt_dir, out_csv=EVALUATION_CSV, models=tuple(MODEL_FOLDERS), default_case=None, workers=None, surface=True):
+    """
+    Score every prediction that has a ground truth and append the rows to
+    out_csv as they finish. Rows already in out_csv are not recomputed,
+    except to fill in surface metrics they are missing.
+    """
+    columns = COLUMNS if surface else BASE_COLUMNS
+    _, header = read_rows(out_csv)
+    if header is not None and not set(columns) <= set(header):
+        # Older file without the surface metric columns: widen the header first
+        columns = header + [c for c in columns if c not in header]
+        rewrite_rows(out_csv, columns)
+    elif header is not None:
+        columns = header
+    jobs = collect_jobs(root, gt_dir, models, default_case, skip=finished_rows(out_csv, COLUMNS if surface else BASE_COLUMNS))
+    if not jobs:
+        print("Nothing to evaluate")
+        return 0
+    rescored = finished_rows(out_csv) & {(model, case, organ) for model, case, organ, _, _ in jobs}
+    new_file = header is None
+    written = 0
+    with open(out_csv, "a", newline="") as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        futures = {pool.submit(score_pair, pred, gt, surface): (model, case, organ) for model, case, organ, pred, gt in jobs}
+        for future in as_completed(futures):
+            model, case, organ = futures[future]
+            try:
+                metrics = future.result()
+            except Exception as e:
+                print(f"[warn] {model} {case} {organ} failed: {e}")
+                continue
+            values = {k: f"{v:.8g}" if isinstance(v, float) else v for k, v in metrics.items()}
+            writer.writerow({"Model": model, "Patient_ID": case, "Organ": organ, **values})
+            # Flush every row so an interrupted run can resume where it stopped
+            f.flush()
+            written += 1
+            print(f"[{written}/{len(jobs)}] {model} {case} {organ} dice={metrics['Dice']:.3f}")
+    if rescored:
+        # Drop the older, incomplete copies of rows that were scored again
+        rewrite_rows(out_csv, columns)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the segmentation folders against ground truth into evaluation.csv")
+    parser.add_argument("--gt-dir", required=True, help="ground truth masks, <case>/<organ>.nii.gz or <organ>.nii.gz")
+    parser.add_argument("--root", default=ROOT, help="folder holding the segmented_organs_by_* folders")
+    parser.add_argument("--out", default=EVALUATION_CSV, help="CSV to append to (resumes from existing rows)")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FOLDERS), choices=list(MODEL_FOLDERS))
+    parser.add_argument("--case", help="case id for files without a case prefix, e.g. 0005")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-surface", action="store_true", help="skip HD95, ASSD and surface Dice")
+    args = parser.parse_args()
+    evaluate(args.root, args.gt_dir, args.out, args.models, args.case, args.workers, surface=not args.no_surface)
+
+
+if __name__ == "__main__":
+    main()
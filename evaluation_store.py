@@ -0,0 +1,108 @@
+import csv
+import math
+import os
+import threading
+
+from evaluate import EVALUATION_CSV, normalize_case
+
+METRICS = ("Dice", "IoU", "Volume Similarity")
+SURFACE_METRICS = ("HD95", "ASSD", "Surface_Dice")
+
+
+def volume_similarity(pred_volume, gt_volume):
+    total = pred_volume + gt_volume
+    return 1.0 - abs(pred_volume - gt_volume) / total if total else float("nan")
+
+
+def _stats(values):
+    """(mean, std, n) ignoring NaNs."""
+    values = [v for v in values if not math.isnan(v)]
+    n = len(values)
+    if n == 0:
+        return float("nan"), float("nan"), 0
+    mean = sum(values) / n
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / n)
+    return mean, std, n
+
+
+class EvaluationStore:
+    """
+    evaluation.csv indexed by (model, organ, case), with per-organ and
+    per-model aggregates (mean, std, count) computed once at load time.
+    """
+    def __init__(self, rows, columns=()):
+        self.rows = {}
+        self.columns = tuple(columns)
+        by_organ = {}
+        by_model = {}
+        for row in rows:
+            model, organ, case = row["Model"], row["Organ"], normalize_case(str(row["Patient_ID"]))
+            pred_volume, gt_volume = float(row["Pred_Volume"]), float(row["GT_Volume"])
+            metrics = {
+                "Dice": float(row["Dice"]),
+                "IoU": float(row["IoU"]),
+                "Volume Similarity": volume_similarity(pred_volume, gt_volume),
+            }
+            # Any extra numeric columns (e.g. surface metrics) ride along
+            for key, value in row.items():
+                if key not in ("Model", "Patient_ID", "Organ", "Dice", "IoU") and key not in metrics:
+                    try:
+                        metrics[key] = float(value)
+                    except (TypeError, ValueError):
+                        metrics[key] = float("nan")
+            # The last row of a (model, organ, case) wins
+            self.rows[(model, organ, case)] = metrics
+        for (model, organ, case), metrics in self.rows.items():
+            by_organ.setdefault((model, organ), []).append(metrics)
+            by_model.setdefault(model, []).append(metrics)
+        self.organ_stats = {key: self._aggregate(group) for key, group in by_organ.items()}
+        self.model_stats = {key: self._aggregate(group) for key, group in by_model.items()}
+
+    @staticmethod
+    def _aggregate(group):
+        keys = {k for metrics in group for k in metrics}
+        return {k: _stats([metrics.get(k, float("nan")) for metrics in group]) for k in keys}
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            return cls(list(reader), reader.fieldnames or ())
+
+    def has(self, column):
+        return column in self.columns
+
+    def get(self, model, organ, case):
+        return self.rows.get((model, organ, normalize_case(case)))
+
+    def organ(self, model, organ):
+        """{metric: (mean, std, n)} over all cases of one organ, or None."""
+        return self.organ_stats.get((model, organ))
+
+    def model(self, model):
+        """{metric: (mean, std, n)} over all organs and cases of one model, or None."""
+        return self.model_stats.get(model)
+
+    @staticmethod
+    def format(stat):
+        mean, std, n = stat
+        if n == 0:
+            return ""
+        return f"{mean:.2f}" if n == 1 else f"{mean:.2f} ± {std:.2f}"
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=EVALUATION_CSV):
+    """Process-wide store for path, re-read only when the file changes."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _stores_lock:
+        cached = _stores.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, EvaluationStore.from_csv(path))
+            _stores[path] = cached
+        return cached[1]
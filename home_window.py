@@ -1,9 +1,30 @@
+import threading
+import time
+
+APP_START = time.perf_counter()
+
 from PySide6.QtWidgets import (
-    QWidget, QHBoxLayout, QVBoxLayout, QLabel, QApplication, QFrame
+    QWidget, QHBoxLayout, QVBoxLayout, QLabel, QApplication, QFrame, QStackedLayout
 )
 from PySide6.QtGui import QPixmap, QFont, QCursor
-from PySide6.QtCore import Qt
-from organs_viewer import OrgansViewer
+from PySide6.QtCore import Qt, QTimer
+
+import tracing
+
+# The organ screens pull in nibabel, VTK and matplotlib, they are imported
+# on first use (or warmed in the background once the home screen is idle)
+HEAVY_MODULES = ("organs_viewer", "slicer", "mesh_cache", "volume_registry")
+
+
+def warm_imports(modules=HEAVY_MODULES):
+    start = time.perf_counter()
+    for name in modules:
+        try:
+            __import__(name)
+        except Exception as e:
+            print(f"[warn] could not preload {name}: {e}")
+    print(f"[startup] viewer modules preloaded in {time.perf_counter() - start:.2f} s")
+
 
 class ClickableFrame(QFrame):
     def __init__(self, text, image_path, click_callback):
@@ -73,7 +94,13 @@ class HomeWindow(QWidget):
         super().__init__()
         self.setWindowTitle("Medical Segmentation App")
         self.setStyleSheet("background: #202933;")
-        layout = QHBoxLayout()
+        # Shared on-disk mesh cache, created with the first organ screen
+        self.mesh_cache = None
+        # Organ screens are built on first use and kept for the next visit
+        self.organ_viewers = {}
+        self.stack = QStackedLayout(self)
+        self.home_page = QWidget(self)
+        layout = QHBoxLayout(self.home_page)
         layout.setSpacing(32)  # horizontal space between frames
         layout.setContentsMargins(100, 48, 100, 48)  # top and bottom vertical padding
         self.frames = []
@@ -86,50 +113,58 @@ class HomeWindow(QWidget):
             frame = ClickableFrame(text, img, self.on_frame_clicked)
             layout.addWidget(frame)
             self.frames.append(frame)
-        self.setLayout(layout)
+        self.stack.addWidget(self.home_page)
         # self.setFixedSize(800, 400)
+        # Frame times and slow stages on top of every screen (MIS_TRACE=1 MIS_TRACE_OVERLAY=1)
+        if tracing.OVERLAY:
+            self.trace_overlay = tracing.install_overlay(self)
+
+    def warm_up(self):
+        """Import the viewer stack on a background thread while the home screen sits idle."""
+        threading.Thread(target=warm_imports, name="warm-imports", daemon=True).start()
 
     def on_frame_clicked(self, frame_text):
         print(f"Frame clicked: {frame_text}")
-        # Remove all frames from layout
-        for frame in self.frames:
-            frame.setParent(None)
-        # Remove old layout before setting new one
-        old_layout = self.layout()
-        if old_layout is not None:
-            QWidget().setLayout(old_layout)
-        # Replace with OrgansViewer, passing selected organ
-        self.organs_viewer = OrgansViewer(selected_organ=frame_text.lower(), return_callback=self.show_home)
-        main_layout = QVBoxLayout(self)
-        main_layout.addWidget(self.organs_viewer)
-        self.setLayout(main_layout)
+        organ = frame_text.lower()
+        viewer = self.organ_viewers.get(organ)
+        if viewer is None:
+            from organs_viewer import OrgansViewer
+            from mesh_cache import MeshCache
+            if self.mesh_cache is None:
+                # Warm opens skip marching cubes entirely
+                self.mesh_cache = MeshCache()
+            start = time.perf_counter()
+            viewer = OrgansViewer(selected_organ=organ, return_callback=self.show_home, mesh_cache=self.mesh_cache)
+            print(f"[startup] {organ} screen built in {time.perf_counter() - start:.2f} s")
+            self.organ_viewers[organ] = viewer
+            self.stack.addWidget(viewer)
+        else:
+            viewer.resume_meshes()
+        self.organs_viewer = viewer
+        self.stack.setCurrentWidget(viewer)
 
     def show_home(self):
-        # Remove organs_viewer and restore home layout
-        if hasattr(self, 'organs_viewer'):
-            self.organs_viewer.setParent(None)
-        old_layout = self.layout()
-        if old_layout is not None:
-            QWidget().setLayout(old_layout)
-        layout = QHBoxLayout()
-        layout.setSpacing(32)
-        layout.setContentsMargins(100, 48, 100, 48)
-        self.frames = []
-        frame_data = [
-            ("kidney", "appImages/kidney.jpg"),
-            ("stomach", "appImages/stomach.jpg"),
-            ("Liver", "appImages/liver.jpg"),
-        ]
-        for text, img in frame_data:
-            frame = ClickableFrame(text, img, self.on_frame_clicked)
-            layout.addWidget(frame)
-            self.frames.append(frame)
-        self.setLayout(layout)
+        from volume_registry import get_registry
+        print(get_registry().report())
+        # The organ screen is only hidden, its meshes and tables stay ready for the next visit
+        self.stack.setCurrentWidget(self.home_page)
+
+    def closeEvent(self, event):
+        for viewer in self.organ_viewers.values():
+            viewer.mesh_builder.cancel()
+        super().closeEvent(event)
+
+
+def report_startup():
+    print(f"[startup] home window interactive {time.perf_counter() - APP_START:.2f} s after launch")
+
 
-        
 if __name__ == "__main__":
     import sys
     app = QApplication(sys.argv)
     win = HomeWindow()
     win.showMaximized()
+    # Runs on the first turn of the event loop, once the window can take input
+    QTimer.singleShot(0, report_startup)
+    QTimer.singleShot(0, win.warm_up)
     sys.exit(app.exec_())
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+
+import nibabel as nib
+import numpy as np
+
+from volume_registry import get_registry
+
+PACKED_SUFFIX = ".labels.nii.gz"
+TABLE_SUFFIX = ".labels.json"
+
+
+def is_nifti(file):
+    return file.endswith('.nii') or file.endswith('.nii.gz')
+
+
+def structure_name(file):
+    """
+    Organ name for a mask file name, for both 'liver.nii.gz' and the
+    Swin UNETR style 'img0005.nii.gz_liver.nii.gz'.
+    """
+    name = os.path.basename(file)
+    if '.nii.gz_' in name:
+        name = name.split('.nii.gz_', 1)[1]
+    elif '.nii_' in name:
+        name = name.split('.nii_', 1)[1]
+    for ext in ('.nii.gz', '.nii'):
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def case_id(file):
+    """Case prefix of a Swin UNETR style file name, or None."""
+    name = os.path.basename(file)
+    if '.nii.gz_' in name:
+        return name.split('.nii.gz_', 1)[0]
+    return None
+
+
+def table_path(packed_path):
+    if packed_path.endswith(PACKED_SUFFIX):
+        return packed_path[:-len(PACKED_SUFFIX)] + TABLE_SUFFIX
+    return packed_path + ".json"
+
+
+def read_label_table(packed_path):
+    with open(table_path(packed_path)) as f:
+        return {int(k): v for k, v in json.load(f)["labels"].items()}
+
+
+def find_packed_volume(folder):
+    """Path of the packed label volume stored in folder, or None."""
+    if not os.path.isdir(folder):
+        return None
+    for f in sorted(os.listdir(folder)):
+        path = os.path.join(folder, f)
+        if f.endswith(PACKED_SUFFIX) and os.path.exists(table_path(path)):
+            return path
+    return None
+
+
+def mask_files_in(folder):
+    """Per-organ mask files in folder as {structure name: path}, skipping packed volumes."""
+    files = {}
+    for f in sorted(os.listdir(folder)):
+        if is_nifti(f) and not f.endswith(PACKED_SUFFIX):
+            files[structure_name(f)] = os.path.join(folder, f)
+    return files
+
+
+def pack_masks(mask_files, out_path):
+    """
+    Pack binary masks ({name: path}) into one uint8/uint16 label map plus a
+    JSON label table. Where masks overlap the later one wins.
+    """
+    names = list(mask_files)
+    dtype = np.uint8 if len(names) < 256 else np.uint16
+    labels = None
+    affine = header = None
+    for label_id, name in enumerate(names, start=1):
+        img = nib.load(mask_files[name])
+        mask = np.asanyarray(img.dataobj) > 0.5
+        if labels is None:
+            labels = np.zeros(mask.shape, dtype=dtype)
+            affine, header = img.affine, img.header.copy()
+        elif mask.shape != labels.shape:
+            raise ValueError(f"{mask_files[name]} has shape {mask.shape}, expected {labels.shape}")
+        labels[mask] = label_id
+    if labels is None:
+        raise ValueError("no masks to pack")
+    header.set_data_dtype(dtype)
+    header.set_slope_inter(1, 0)
+    nib.save(nib.Nifti1Image(labels, affine, header), out_path)
+    table = {
+        "labels": {str(i): name for i, name in enumerate(names, start=1)},
+        "sources": {name: os.path.basename(path) for name, path in mask_files.items()},
+    }
+    with open(table_path(out_path), "w") as f:
+        json.dump(table, f, indent=2)
+    return out_path
+
+
+class LabelVolume:
+    """
+    A packed label map with its label table (id -> structure name). The
+    table stored next to the file is used unless one is given, e.g. the
+    catalog's {label: entry} so structures go by their catalog entry names.
+    """
+    def __init__(self, labels, affine, zooms, table, path=None):
+        self.labels = labels
+        self.affine = affine
+        self.zooms = zooms
+        self.table = table
+        self.ids = {name: label_id for label_id, name in table.items()}
+        self.path = path
+
+    @classmethod
+    def load(cls, path, lazy=False, table=None):
+        img = nib.load(path)
+        # Keep the on-disk integer dtype, no float64 expansion, shared through the registry
+        registry = get_registry()
+        labels = registry.lazy(path) if lazy else registry.array(path)
+        return cls(labels, img.affine, img.header.get_zooms()[:3], table or read_label_table(path), path=path)
+
+    @classmethod
+    def load_header(cls, path, table=None):
+        """Affine, zooms and label table of a packed volume, without reading its labels (labels is None)."""
+        img = nib.load(path)
+        return cls(None, img.affine, img.header.get_zooms()[:3], table or read_label_table(path), path=path)
+
+    @property
+    def shape(self):
+        return self.labels.shape
+
+    @property
+    def names(self):
+        return [self.table[i] for i in sorted(self.table)]
+
+    def mask(self, name):
+        return np.asarray(self.labels) == self.ids[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack per-organ NIfTI masks into one label map")
+    parser.add_argument("mask_dir", help="folder with one binary mask per structure")
+    parser.add_argument("out", help=f"output file, should end with {PACKED_SUFFIX}")
+    parser.add_argument("--case", help="only pack files of this case prefix (e.g. img0005)")
+    args = parser.parse_args()
+
+    mask_files = {}
+    for name, path in mask_files_in(args.mask_dir).items():
+        if args.case is None or case_id(path) in (None, args.case):
+            mask_files[name] = path
+    pack_masks(mask_files, args.out)
+    print(f"Packed {len(mask_files)} masks into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
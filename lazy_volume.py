@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+import nibabel as nib
+import numpy as np
+
+try:
+    import indexed_gzip  # noqa: F401  lets nibabel seek inside .nii.gz files
+    HAVE_INDEXED_GZIP = True
+except ImportError:
+    HAVE_INDEXED_GZIP = False
+
+MAX_SLAB_BYTES = 64 * 1024 * 1024
+
+
+class LazyVolume:
+    """
+    Slice-on-demand view of a NIfTI volume backed by nibabel's array proxy.
+    Indexing with one integer and two full slices (vol[:, :, k], vol[k, :, :],
+    vol[:, k, :]) decodes only that plane and keeps it in a small LRU, any
+    other indexing goes straight to the proxy. Nothing is read up front.
+    Plain gzip cannot seek, so without indexed_gzip a .nii.gz volume is
+    decoded once, in its native dtype, on first access instead.
+    """
+    def __init__(self, source, max_bytes=MAX_SLAB_BYTES):
+        if isinstance(source, str):
+            self.img = nib.load(source, keep_file_open=True) if HAVE_INDEXED_GZIP else nib.load(source)
+        else:
+            self.img = source
+        filename = self.img.get_filename() or ""
+        self.random_access = HAVE_INDEXED_GZIP or not filename.endswith(".gz")
+        self.data = None
+        self.proxy = self.img.dataobj
+        self.shape = tuple(self.img.shape[:3])
+        self.affine = self.img.affine
+        self.zooms = self.img.header.get_zooms()[:3]
+        self.max_bytes = max_bytes
+        self.slabs = OrderedDict()
+        # Slabs may be requested from prefetch threads as well as the GUI thread
+        self.lock = threading.Lock()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Set by the registry, called after the caches grew so it can re-check its budget
+        self.on_grow = None
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def dtype(self):
+        return self.img.get_data_dtype()
+
+    def slab(self, axis, idx):
+        index = [slice(None)] * 3
+        index[axis] = idx
+        if not self.random_access:
+            return self.full()[tuple(index)]
+        key = (axis, idx)
+        with self.lock:
+            plane = self.slabs.get(key)
+            if plane is not None:
+                self.slabs.move_to_end(key)
+                self.hits += 1
+                return plane
+            self.misses += 1
+        plane = np.asanyarray(self.proxy[tuple(index)])
+        plane.flags.writeable = False
+        with self.lock:
+            grew = key not in self.slabs
+            if grew:
+                self.slabs[key] = plane
+                self.cached_bytes += plane.nbytes
+            while self.cached_bytes > self.max_bytes and len(self.slabs) > 1:
+                _, old = self.slabs.popitem(last=False)
+                self.cached_bytes -= old.nbytes
+        if grew:
+            self._grew()
+        return plane
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 3:
+            ints = [i for i, k in enumerate(key) if isinstance(k, (int, np.integer))]
+            full = all(k == slice(None) for i, k in enumerate(key) if i not in ints)
+            if len(ints) == 1 and full:
+                axis = ints[0]
+                idx = int(key[axis])
+                if idx < 0:
+                    idx += self.shape[axis]
+                return self.slab(axis, idx)
+        return np.asanyarray(self.proxy[key])
+
+    def full(self):
+        # One native-dtype decode for volumes that cannot be read slab by slab
+        with self.lock:
+            if self.data is not None:
+                self.hits += 1
+                return self.data
+            data = self.data = np.asanyarray(self.proxy)
+            data.flags.writeable = False
+            self.cached_bytes = data.nbytes
+            self.misses += 1
+        self._grew()
+        return data
+
+    def _grew(self):
+        # Never called with the lock held, the registry may clear this volume
+        if self.on_grow is not None:
+            self.on_grow()
+
+    def __array__(self, dtype=None, copy=None):
+        # Full materialisation, only for callers that really need the whole volume
+        data = self.data if self.data is not None else np.asanyarray(self.proxy)
+        return data if dtype is None else data.astype(dtype)
+
+    def clear(self):
+        with self.lock:
+            self.slabs.clear()
+            self.data = None
+            self.cached_bytes = 0
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class MaskIndex:
+    """
+    Bounding box, occupied slices per axis and voxel count of one binary
+    mask, so renderers and mesh extraction can skip the empty parts.
+    """
+    def __init__(self, shape, occupied, voxel_count):
+        self.shape = tuple(shape)
+        # occupied[axis] is a bool array: does slice i along axis contain the mask
+        self.occupied = occupied
+        self.voxel_count = int(voxel_count)
+        self.bbox = tuple(
+            (int(np.argmax(occ)), int(len(occ) - np.argmax(occ[::-1]))) if occ.any() else (0, 0)
+            for occ in occupied
+        )
+
+    @classmethod
+    def from_mask(cls, mask):
+        mask = np.asarray(mask)
+        if mask.dtype != bool:
+            mask = mask > 0.5
+        occupied = [
+            mask.any(axis=(1, 2)),
+            mask.any(axis=(0, 2)),
+            mask.any(axis=(0, 1)),
+        ]
+        # Count only inside the bounding box, usually a small fraction of the grid
+        index = cls(mask.shape, occupied, 0)
+        index.voxel_count = int(np.count_nonzero(mask[index.crop()])) if not index.empty else 0
+        return index
+
+    @property
+    def empty(self):
+        return not self.occupied[0].any()
+
+    @property
+    def nbytes(self):
+        return sum(occ.nbytes for occ in self.occupied)
+
+    def present(self, axis, idx):
+        return 0 <= idx < len(self.occupied[axis]) and bool(self.occupied[axis][idx])
+
+    def occupied_slices(self, axis):
+        return np.flatnonzero(self.occupied[axis])
+
+    def crop(self, margin=0):
+        """Slices selecting the bounding box grown by margin voxels (clipped to the grid)."""
+        return tuple(
+            slice(max(lo - margin, 0), min(hi + margin, n))
+            for (lo, hi), n in zip(self.bbox, self.shape)
+        )
+
+    def plane_region(self, axis):
+        """Bounding box of the mask within a plane cut along axis (unrotated)."""
+        return tuple(s for a, s in enumerate(self.crop()) if a != axis)
@@ -0,0 +1,189 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PySide6 import QtCore
+
+import tracing
+from mesh_cache import MeshCache
+from mesh_lod import MeshLOD
+from surface_builder import DEFAULT_PRESET, SURFACE_PRESETS, build_surfaces
+
+
+def mesh_params(preset=DEFAULT_PRESET):
+    """Extraction settings, also part of the mesh cache key."""
+    if preset not in SURFACE_PRESETS:
+        raise ValueError(f"unknown mesh preset {preset!r}, expected one of {', '.join(SURFACE_PRESETS)}")
+    # The preset's settings rather than only its name, so retuning a preset misses the old entries
+    return {"method": "surface_nets", "preset": preset, **SURFACE_PRESETS[preset]}
+
+
+def build_lods(sources, cache=None, preset=DEFAULT_PRESET):
+    """
+    Surfaces of mesh sources {entry: (path, label)} from a single pass over
+    their label map, each with its levels of detail, stored in cache.
+    Entries whose mask is empty are left out.
+    """
+    params = mesh_params(preset)
+    lods = {}
+    with tracing.span("build surfaces", cat="mesh", structures=len(sources), preset=preset):
+        surfaces = build_surfaces(sources, preset)
+    for entry, mesh in surfaces.items():
+        path, label = sources[entry]
+        with tracing.span("levels of detail", cat="mesh", entry=str(entry)):
+            lod = MeshLOD.build(mesh)
+        if cache is not None:
+            try:
+                cache.put_lod(path, lod, label=label, **params)
+            except Exception as e:
+                print(f"[warn] could not cache mesh for {path}: {e}")
+        lods[entry] = lod
+    return lods
+
+
+def load_lods(sources, cache=None, preset=DEFAULT_PRESET):
+    """Like build_lods, but structures already in the cache are read from it instead of rebuilt."""
+    params = mesh_params(preset)
+    lods = {}
+    missing = {}
+    for entry, (path, label) in sources.items():
+        lod = None
+        if cache is not None:
+            try:
+                lod = cache.get_lod(path, label=label, **params)
+            except Exception as e:
+                print(f"[warn] mesh cache lookup failed for {path}: {e}")
+        if lod is not None:
+            lods[entry] = lod
+        else:
+            missing[entry] = (path, label)
+    if missing:
+        lods.update(build_lods(missing, cache, preset))
+    return lods
+
+
+def build_meshes(sources, cache_dir=None, preset=DEFAULT_PRESET):
+    """Worker entry point: build_lods as raw arrays so the result can be sent back from a worker process."""
+    cache = MeshCache(cache_dir) if cache_dir is not None else None
+    return {entry: lod.to_arrays() for entry, lod in build_lods(sources, cache, preset).items()}
+
+
+class MeshBuilder(QtCore.QObject):
+    """
+    Builds meshes for NIfTI masks in a process pool and streams them back
+    to the GUI thread as each group of structures finishes.
+    """
+    mesh_ready = QtCore.Signal(str, str, object)   # model, file, MeshLOD
+    mesh_failed = QtCore.Signal(str, str, str)     # model, file, error
+    progress = QtCore.Signal(str, int, int)        # model, done, total
+    _job_done = QtCore.Signal(object)
+
+    def __init__(self, max_workers=None, cache=None, preset=DEFAULT_PRESET, parent=None):
+        super().__init__(parent)
+        if max_workers is None:
+            max_workers = max(1, min(8, (os.cpu_count() or 2) - 1))
+        self.max_workers = max_workers
+        self.cache = cache
+        self.preset = preset
+        # The pool is only started once a cache miss actually needs it
+        self.executor = None
+        self.futures = {}
+        self.totals = {}
+        self.done = {}
+        self.cancelled = False
+        self._job_done.connect(self._on_job_done)
+
+    def submit(self, model, sources):
+        """Queue the mesh sources {entry: (path, label)} of one model."""
+        if self.cancelled:
+            return
+        self.totals[model] = self.totals.get(model, 0) + len(sources)
+        self.done.setdefault(model, 0)
+        params = mesh_params(self.preset)
+        missing = {}
+        for file, (nii_path, label) in sources.items():
+            mesh = None
+            if self.cache is not None:
+                try:
+                    mesh = self.cache.get_lod(nii_path, label=label, **params)
+                except Exception as e:
+                    print(f"[warn] mesh cache lookup failed for {nii_path}: {e}")
+            if mesh is not None:
+                # Deliver on the next event loop turn so callers can finish wiring up signals
+                QtCore.QTimer.singleShot(0, lambda file=file, mesh=mesh: self._deliver(model, file, mesh))
+            else:
+                missing[file] = (nii_path, label)
+        if not missing:
+            return
+        if self.executor is None:
+            # spawn instead of fork: forking a process that already runs Qt is unsafe
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        cache_dir = self.cache.cache_dir if self.cache is not None else None
+        # Each job meshes whole source files, so a packed volume is contoured once; enough jobs to keep every worker busy.
+        # Surfaces do not depend on how files are grouped into jobs.
+        by_path = {}
+        for file, source in missing.items():
+            by_path.setdefault(source[0], {})[file] = source
+        paths = list(by_path)
+        size = math.ceil(len(paths) / self.max_workers)
+        for i in range(0, len(paths), size):
+            group = {file: source for path in paths[i:i + size] for file, source in by_path[path].items()}
+            future = self.executor.submit(build_meshes, group, cache_dir, self.preset)
+            self.futures[future] = (model, list(group), tracing.now())
+            # done callbacks run on an executor thread, the signal hops back to the GUI thread
+            future.add_done_callback(self._job_done.emit)
+
+    def _deliver(self, model, file, mesh):
+        if self.cancelled:
+            return
+        self.done[model] += 1
+        self.mesh_ready.emit(model, file, mesh)
+        self.progress.emit(model, self.done[model], self.totals[model])
+
+    def _on_job_done(self, future):
+        job = self.futures.pop(future, None)
+        if job is None or self.cancelled or future.cancelled():
+            return
+        model, files, submitted = job
+        # Worker processes do not export spans, the job is timed from here
+        tracing.record("mesh job", submitted, tracing.now(), "mesh", {"model": model, "structures": len(files)})
+        try:
+            results = future.result()
+        except Exception as e:
+            results, error = {}, str(e)
+        else:
+            error = "mask is empty"
+        for file in files:
+            self.done[model] += 1
+            if file in results:
+                self.mesh_ready.emit(model, file, MeshLOD.from_arrays(results[file]))
+            else:
+                self.mesh_failed.emit(model, file, error)
+            self.progress.emit(model, self.done[model], self.totals[model])
+
+    def cancel_pending(self):
+        """Drop the jobs that have not started yet, the builder stays usable. Returns {model: [files]} of the dropped jobs."""
+        dropped = {}
+        for future, (model, files, _) in list(self.futures.items()):
+            # The done callback may already drop the job from futures
+            if future.cancel():
+                self.futures.pop(future, None)
+                self.totals[model] -= len(files)
+                dropped.setdefault(model, []).extend(files)
+        return dropped
+
+    def building(self, model):
+        """Files of a model whose job is queued or running."""
+        return {file for m, files, _ in self.futures.values() if m == model for file in files}
+
+    def is_finished(self):
+        return all(self.done[m] >= self.totals[m] for m in self.totals)
+
+    def cancel(self):
+        self.cancelled = True
+        for future in list(self.futures):
+            future.cancel()
+        self.futures.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
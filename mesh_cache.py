@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pyvista as pv
+
+from mesh_lod import LOD_LEVELS, MeshLOD
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), ".mesh_cache")
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Part of every key; bumped when extraction changes what a key stands for.
+# Version 1 entries could hold surfaces meshed together with other files.
+KEY_VERSION = 2
+
+
+class MeshCache:
+    """
+    Content-addressed on-disk cache of extracted surfaces (.vtp).
+    Entries are keyed by the source file's content hash plus the extraction
+    parameters, so a changed source file never hits a stale mesh. Only
+    surfaces that depend on nothing else may be stored: build_surfaces
+    meshes every file on its own for that reason. The least
+    recently used entries are evicted once the cache grows past max_bytes.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hash_index_path = os.path.join(self.cache_dir, "hashes.json")
+        self.hash_index = self._read_hash_index()
+
+    def _read_hash_index(self):
+        try:
+            with open(self.hash_index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_hash_index(self):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.hash_index, f)
+        os.replace(tmp, self.hash_index_path)
+
+    def file_hash(self, path):
+        # Only re-hash a file when its size or mtime changed since the last time we saw it
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = self.hash_index.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self.hash_index[path] = [stamp, digest]
+        self._write_hash_index()
+        return digest
+
+    def key(self, path, **params):
+        params_str = json.dumps(params, sort_keys=True)
+        return hashlib.sha1(f"{KEY_VERSION}:{self.file_hash(path)}:{params_str}".encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".vtp")
+
+    def get(self, path, **params):
+        entry = self._entry_path(self.key(path, **params))
+        if not os.path.exists(entry):
+            self.misses += 1
+            return None
+        try:
+            mesh = pv.read(entry)
+        except Exception as e:
+            print(f"[warn] dropping unreadable cache entry {entry}: {e}")
+            os.remove(entry)
+            self.misses += 1
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(entry)
+        self.hits += 1
+        return mesh
+
+    def put(self, path, mesh, **params):
+        entry = self._entry_path(self.key(path, **params))
+        # Write to a temp file first so concurrent readers never see a partial mesh
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".vtp")
+        os.close(fd)
+        mesh.save(tmp, binary=True)
+        os.replace(tmp, entry)
+        self.evict()
+
+    def get_lod(self, path, fractions=LOD_LEVELS, **params):
+        """All levels of detail of a surface, or None unless every level is cached."""
+        levels = []
+        for fraction in fractions:
+            mesh = self.get(path, lod=fraction, **params)
+            if mesh is None:
+                return None
+            levels.append(mesh)
+        return MeshLOD(levels, fractions)
+
+    def put_lod(self, path, lod, **params):
+        for fraction, level in zip(lod.fractions, lod.levels):
+            self.put(path, level, lod=fraction, **params)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".vtp"):
+                continue
+            p = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, p = entries.pop(0)
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".vtp"):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,84 @@
+import numpy as np
+import pyvista as pv
+
+# Fractions of the full triangle count kept by each level, finest first
+LOD_LEVELS = (1.0, 0.25, 0.05)
+# While the camera moves each structure draws its finest level under this many triangles
+INTERACTIVE_TRIANGLES = 20000
+
+
+class MeshLOD:
+    """One structure's surface at several levels of detail, finest first."""
+    def __init__(self, levels, fractions=LOD_LEVELS):
+        self.levels = list(levels)
+        self.fractions = tuple(fractions)[:len(self.levels)]
+
+    @classmethod
+    def build(cls, mesh, fractions=LOD_LEVELS):
+        mesh = mesh.triangulate()
+        levels = []
+        previous, kept = mesh, 1.0
+        for fraction in fractions:
+            if fraction >= kept or previous.n_cells < 100:
+                levels.append(previous)
+                continue
+            # Decimate from the previous level rather than the full mesh; it is far cheaper
+            previous = previous.decimate(1.0 - fraction / kept)
+            kept = fraction
+            levels.append(previous)
+        return cls(levels, fractions)
+
+    @property
+    def full(self):
+        return self.levels[0]
+
+    @property
+    def triangle_counts(self):
+        return [level.n_cells for level in self.levels]
+
+    def interactive_level(self, budget=INTERACTIVE_TRIANGLES):
+        for level in self.levels:
+            if level.n_cells <= budget:
+                return level
+        return self.levels[-1]
+
+    def describe(self):
+        return ", ".join(f"{int(f * 100)}%: {n:,} tris" for f, n in zip(self.fractions, self.triangle_counts))
+
+    def to_arrays(self):
+        return [(np.asarray(level.points, dtype=np.float32), np.asarray(level.faces)) for level in self.levels]
+
+    @classmethod
+    def from_arrays(cls, arrays, fractions=LOD_LEVELS):
+        return cls([pv.PolyData(points, faces) for points, faces in arrays], fractions)
+
+
+class LODSwitcher:
+    """
+    Draws every registered actor at its coarse level while the camera is
+    being moved in a plotter and switches back to full resolution once the
+    interaction ends.
+    """
+    def __init__(self, plotter):
+        self.plotter = plotter
+        self.actors = {}
+        self.interacting = False
+        iren = plotter.iren
+        iren.add_observer("StartInteractionEvent", lambda *args: self.set_interacting(True))
+        iren.add_observer("EndInteractionEvent", lambda *args: self.set_interacting(False))
+
+    def add(self, name, actor, lod):
+        self.actors[name] = (actor, lod)
+
+    def set_interacting(self, interacting):
+        if interacting == self.interacting:
+            return
+        self.interacting = interacting
+        for actor, lod in self.actors.values():
+            mesh = lod.interactive_level() if interacting else lod.full
+            actor.GetMapper().SetInputData(mesh)
+        if not interacting:
+            self.plotter.render()
+
+    def triangle_counts(self):
+        return {name: lod.triangle_counts for name, (actor, lod) in self.actors.items()}
@@ -0,0 +1,228 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import nibabel as nib
+import numpy as np
+
+from catalog import get_catalog
+from evaluate import MODEL_FOLDERS, ROOT
+from label_volume import PACKED_SUFFIX, TABLE_SUFFIX, table_path
+from packed_mask import PackedMask, consensus, majority, pairwise, union
+from volume_registry import get_registry
+
+AGREEMENT_DIR = os.path.join(ROOT, ".agreement_cache")
+AGREEMENT_CSV = os.path.join(ROOT, "model_agreement.csv")
+# Labels of an agreement volume, per structure: voxels every model, most models, or only some models put in it
+AGREEMENT_LEVELS = ("all models", "majority", "minority")
+AGREEMENT_COLORS = {
+    "all models": (0.0, 0.8, 0.3, 0.45),
+    "majority": (1.0, 0.75, 0.0, 0.45),
+    "minority": (0.9, 0.1, 0.1, 0.45),
+}
+PAIR_COLUMNS = ["Patient_ID", "Organ", "Model_A", "Model_B", "Dice", "IoU", "Volume_A", "Volume_B"]
+
+
+def load_packed(path, label=None):
+    """PackedMask of a mask file, or of one label of a packed label volume."""
+    if label is None:
+        return get_registry().packed(path)
+    return PackedMask.from_mask(np.asarray(get_registry().array(path)) == label)
+
+
+def grid_shape(path):
+    header = get_catalog().header(os.path.abspath(path))
+    if header is not None:
+        return header["shape"]
+    return tuple(nib.load(path).shape[:3])
+
+
+def agreement_masks(masks):
+    """{level: PackedMask} of AGREEMENT_LEVELS for the masks of one structure, the levels do not overlap."""
+    masks = list(masks)
+    everyone = consensus(masks)
+    most = majority(masks)
+    return {
+        "all models": everyone,
+        "majority": most & ~everyone,
+        "minority": union(masks) & ~most,
+    }
+
+
+def level_of(name):
+    """Agreement level of an agreement volume label name, e.g. 'liver: majority' -> 'majority'."""
+    return name.rsplit(": ", 1)[-1]
+
+
+def structure_sources(collection, catalog=None):
+    """{structure: {model: (path, label)}} of the structures of a collection segmented by more than one model."""
+    catalog = catalog or get_catalog()
+    structures = {}
+    for model in catalog.models(collection):
+        names = catalog.names(collection, model)
+        for entry, source in catalog.sources(collection, model).items():
+            structures.setdefault(names[entry], {})[model] = source
+    return {name: models for name, models in structures.items() if len(models) > 1}
+
+
+def build_agreement(structures, out_path):
+    """
+    Agreement label volume of {structure: {model: (path, label)}} written
+    like label_volume.pack_masks, one label per non-empty agreement level
+    of each structure. Only models on the grid most of the inputs share
+    take part, the others are skipped. Returns the label table, or None when no structure has two models on it.
+    """
+    shapes = {(name, model): grid_shape(path) for name, models in structures.items() for model, (path, _) in models.items()}
+    if not shapes:
+        return None
+    grid = Counter(shapes.values()).most_common(1)[0][0]
+    labels = None
+    table = {}
+    models_used = {}
+    reference = None
+    for name, models in structures.items():
+        kept = {model: source for model, source in models.items() if shapes[name, model] == grid}
+        for model in set(models) - set(kept):
+            print(f"[warn] {model} {name} is on a {shapes[name, model]} grid, not {grid}; left out of the agreement")
+        if len(kept) < 2:
+            continue
+        if labels is None:
+            labels = np.zeros(grid, dtype=np.uint8 if 3 * len(structures) < 256 else np.uint16)
+            reference = next(iter(kept.values()))[0]
+        levels = agreement_masks(load_packed(path, label) for path, label in kept.values())
+        for level in AGREEMENT_LEVELS:
+            # With two models nothing is majority-only, empty levels get no label
+            if not levels[level].voxel_count:
+                continue
+            label_id = len(table) + 1
+            table[label_id] = f"{name}: {level}"
+            labels[levels[level].unpack()] = label_id
+        models_used[name] = sorted(kept)
+    if labels is None:
+        return None
+    img = nib.load(reference)
+    header = img.header.copy()
+    header.set_data_dtype(labels.dtype)
+    header.set_slope_inter(1, 0)
+    nib.save(nib.Nifti1Image(labels, img.affine, header), out_path)
+    with open(table_path(out_path), "w") as f:
+        json.dump({"labels": {str(i): name for i, name in table.items()}, "models": models_used}, f, indent=2)
+    return table
+
+
+def agreement_volume(collection, catalog=None, cache_dir=AGREEMENT_DIR):
+    """
+    Path of the agreement label volume of the models of a collection (e.g.
+    'liver'), built on first use and cached until one of its inputs
+    changes. None when the models share no structure on a common grid.
+    """
+    structures = structure_sources(collection, catalog)
+    key = hashlib.sha1()
+    for name in sorted(structures):
+        for model, (path, label) in sorted(structures[name].items()):
+            st = os.stat(path)
+            key.update(f"{name}|{model}|{path}|{label}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    prefix = f"{collection}."
+    out_path = os.path.join(cache_dir, prefix + key.hexdigest()[:16] + PACKED_SUFFIX)
+    if os.path.exists(out_path) and os.path.exists(table_path(out_path)):
+        return out_path
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written under a temporary name, so a viewer never opens half a volume
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=PACKED_SUFFIX)
+    os.close(fd)
+    try:
+        table = build_agreement(structures, tmp)
+        if table is None:
+            return None
+        os.replace(table_path(tmp), table_path(out_path))
+        os.replace(tmp, out_path)
+    finally:
+        for path in (tmp, table_path(tmp)):
+            if os.path.exists(path):
+                os.remove(path)
+    # Older agreement volumes of the collection are stale now
+    for f in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, f)
+        if f.startswith(prefix) and path not in (out_path, table_path(out_path)) and f.endswith((PACKED_SUFFIX, TABLE_SUFFIX)):
+            os.remove(path)
+    return out_path
+
+
+def compare_structure(case, organ, paths):
+    """Worker entry point: pairwise overlap rows of the models' masks {model: path} of one case and organ."""
+    registry = get_registry()
+    masks = {model: registry.packed(path) for model, path in sorted(paths.items())}
+    grid = Counter(mask.shape for mask in masks.values()).most_common(1)[0][0]
+    skipped = [model for model, mask in masks.items() if mask.shape != grid]
+    masks = {model: mask for model, mask in masks.items() if mask.shape == grid}
+    rows = [
+        {"Patient_ID": case, "Organ": organ, "Model_A": a, "Model_B": b, **metrics}
+        for (a, b), metrics in pairwise(masks).items()
+    ]
+    # Pool workers live on, do not let them sit on the packed masks
+    registry.clear()
+    return rows, skipped
+
+
+def compare_models(root=ROOT, models=tuple(MODEL_FOLDERS), default_case=None, out_csv=AGREEMENT_CSV, workers=None):
+    """Pairwise Dice and IoU between the models' predictions of every case and organ, written to out_csv."""
+    catalog = get_catalog(root)
+    predictions = {}
+    for model in models:
+        folder = os.path.join(root, MODEL_FOLDERS[model])
+        if not os.path.isdir(folder):
+            print(f"[warn] no segmentation folder for {model}: {folder}")
+            continue
+        catalog.refresh([folder], decode=False)
+        for case, organ, path in catalog.predictions(model, default_case):
+            predictions.setdefault((case, organ), {})[model] = path
+    jobs = {key: paths for key, paths in predictions.items() if len(paths) > 1}
+    if not jobs:
+        print("Nothing to compare")
+        return 0
+    written = 0
+    with open(out_csv, "w", newline="") as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=PAIR_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        futures = {pool.submit(compare_structure, case, organ, paths): (case, organ) for (case, organ), paths in jobs.items()}
+        for future in as_completed(futures):
+            case, organ = futures[future]
+            try:
+                rows, skipped = future.result()
+            except Exception as e:
+                print(f"[warn] {case} {organ} failed: {e}")
+                continue
+            if skipped:
+                print(f"[warn] {case} {organ}: {', '.join(skipped)} on another grid, not compared")
+            for row in rows:
+                writer.writerow({k: f"{v:.8g}" if isinstance(v, float) else v for k, v in row.items()})
+            written += len(rows)
+    print(f"{written} model pairs compared over {len(jobs)} structures, written to {out_csv}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dice and IoU between the models' segmentations, computed on bit-packed masks")
+    parser.add_argument("--root", default=ROOT, help="folder holding the segmented_organs_by_* and organ folders")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FOLDERS), choices=list(MODEL_FOLDERS))
+    parser.add_argument("--case", help="case id for files without a case prefix, e.g. 0005")
+    parser.add_argument("--out", default=AGREEMENT_CSV)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--view", help="instead build the agreement volume of an organ folder, e.g. liver")
+    args = parser.parse_args()
+    if args.view:
+        catalog = get_catalog(args.root)
+        catalog.refresh([os.path.join(args.root, args.view)], decode=False)
+        path = agreement_volume(args.view, catalog)
+        print(path or f"No structure of {args.view} has two models on a common grid")
+        return
+    compare_models(args.root, args.models, args.case, args.out, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,29 @@
 import os
-import nibabel as nib
-import pyvista as pv
-import matplotlib as plt
+import random
 from pyvistaqt import QtInteractor
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QFrame, QLabel, QPushButton, QTreeWidget, QTreeWidgetItem, QSlider, QColorDialog, QCheckBox
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QFrame, QLabel, QPushButton, QTreeWidget, QTreeWidgetItem, QSlider, QColorDialog, QCheckBox, QProgressBar, QTableWidget, QTableWidgetItem
 from PySide6.QtCore import Qt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+import tracing
+from mesh_builder import MeshBuilder
+from mesh_lod import LODSwitcher
+from comparison_view import COMPARISON_VIEW, ComparisonView
+from catalog import VIEW_FOLDERS, get_catalog
+from evaluate import MODEL_ABBREVIATIONS, ROOT
+from evaluation_store import METRICS, SURFACE_METRICS, EvaluationStore, get_store
+from label_volume import read_label_table
+from model_agreement import AGREEMENT_COLORS, agreement_volume, level_of
+
+
+SURFACE_HEADERS = {"HD95": "HD95 (mm)", "ASSD": "ASSD (mm)", "Surface_Dice": "Surface Dice"}
 
 
 class OrgansViewer(QWidget):
-    def __init__(self, selected_organ=None, return_callback=None):
+    def __init__(self, selected_organ=None, return_callback=None, mesh_cache=None, comparison=None):
         super().__init__()
+        stages = tracing.stages("OrgansViewer.__init__", organ=selected_organ)
+        self.mesh_cache = mesh_cache
+        # Comparison mode draws every model into one shared render window
+        self.comparison = COMPARISON_VIEW if comparison is None else comparison
         if selected_organ is None:
             self.selected_organ = 'kidney'
         else:
@@ -26,32 +39,28 @@ class OrgansViewer(QWidget):
         self.return_btn = QPushButton("←", sidebar)
         self.return_btn.setFixedSize(48, 48)
         self.return_btn.setStyleSheet("font-size: 28px; color: #fff; background: #0078d7; border-radius: 24px;")
-        if return_callback:
-            self.return_btn.clicked.connect(return_callback)
+        self.return_callback = return_callback
+        self.return_btn.clicked.connect(self.on_return)
         self.sidebar_layout.addWidget(self.return_btn)
     # Organ title label (only once at the top)
         self.organ_label_widget = QLabel(self.selected_organ.capitalize(), sidebar)
         self.organ_label_widget.setStyleSheet("color: #fff; font-size: 24px; font-weight: bold; margin: 16px 0 8px 0;")
         self.organ_label_widget.setAlignment(Qt.AlignCenter)
         self.sidebar_layout.addWidget(self.organ_label_widget)
-        # Models tree views
-        organs = {
-            'kidney': os.listdir(os.path.join(os.path.dirname(__file__), 'kidney')),
-            'stomach': os.listdir(os.path.join(os.path.dirname(__file__), 'stomach')),
-            'liver': os.listdir(os.path.join(os.path.dirname(__file__), 'liver')),
-        }
-        organ_files = {
-            'kidney': {},
-            'stomach': {},
-            'liver': {}
-        }
-        # enter the files dynamicaly
-        for organ in organs:
-            for model in organs[organ]:
-                model_path = os.path.join(os.path.dirname(__file__), organ, model)
-                if os.path.isdir(model_path):
-                    organ_files[organ].update({model : [f for f in os.listdir(model_path) if f.endswith('.nii') or f.endswith('.nii.gz')]})
-
+        # Models and their files come from the catalog, only files that changed since the last visit are read
+        self.catalog = get_catalog()
+        self.catalog.refresh([os.path.join(ROOT, self.selected_organ)], decode=False)
+        organs = {organ: self.catalog.models(organ) for organ in VIEW_FOLDERS}
+        organ_files = {organ: {} for organ in VIEW_FOLDERS}
+        self.mesh_sources = {}
+        # Normalised structure name of every entry, for labels and evaluation lookups
+        self.structure_names = {}
+        for model in organs.get(self.selected_organ, []):
+            sources = self.catalog.sources(self.selected_organ, model)
+            organ_files[self.selected_organ][model] = list(sources)
+            self.mesh_sources[model] = sources
+            self.structure_names[model] = self.catalog.names(self.selected_organ, model)
+        stages.mark("catalog")
 
         self.pv_widgets = {}
         self.pv_actors = {}
@@ -76,7 +85,7 @@ class OrgansViewer(QWidget):
                     controls_widget = QWidget()
                     controls_layout = QHBoxLayout(controls_widget)
                     controls_layout.setContentsMargins(0,0,0,0)
-                    part_label = QLabel(file[:file.find('.')])
+                    part_label = QLabel(self.structure_names[model][file])
                     part_label.setStyleSheet("color: #fff; font-size: 12px; margin-right: 8px; margin-left: 0px;")
                     controls_layout.addWidget(part_label)
                     view_checkbox = QCheckBox("View")
@@ -106,10 +115,33 @@ class OrgansViewer(QWidget):
         for model in organs[self.selected_organ]:
             self.sidebar_layout.addWidget(self.sidebar_trees[model])
             self.model_tree_widgets.append((None, self.sidebar_trees[model]))
+        stages.mark("sidebar")
         # Main 3D view area for selected organ
         view_layout = QVBoxLayout()
         models_area = QHBoxLayout()
         self.model_widgets = []
+        self.progress_bars = {}
+        self.lod_switchers = {}
+        self.mesh_lods = {}
+        # Evaluation results are loaded and aggregated once per process
+        try:
+            evaluation = get_store()
+        except OSError as e:
+            print(f"Could not read evaluation results: {e}")
+            evaluation = None
+        stages.mark("evaluation store")
+        self.mesh_builder = MeshBuilder(cache=mesh_cache, parent=self)
+        self.mesh_builder.mesh_ready.connect(self.on_mesh_ready)
+        self.mesh_builder.mesh_failed.connect(self.on_mesh_failed)
+        self.failed_meshes = set()
+        self.mesh_builder.progress.connect(self.on_mesh_progress)
+        self.comparison_view = None
+        if self.comparison:
+            self.comparison_view = ComparisonView(organs[self.selected_organ], self)
+            comparison_switcher = LODSwitcher(self.comparison_view)
+            view_layout.addWidget(self.comparison_view, 3)
+            self.model_widgets.append(self.comparison_view)
+            stages.mark("comparison view")
         for model in organs[self.selected_organ]:
             # Create a vertical layout for each model
             model_vbox = QVBoxLayout()
@@ -118,60 +150,52 @@ class OrgansViewer(QWidget):
             model_label.setStyleSheet("color: #fff; font-size: 18px; font-weight: bold; margin-bottom: 8px;")
             model_label.setAlignment(Qt.AlignCenter)
             model_vbox.addWidget(model_label)
+            # Per-model mesh loading progress
+            progress_bar = QProgressBar(self)
+            progress_bar.setFormat("Loading meshes %v/%m")
+            progress_bar.setStyleSheet("color: #fff; font-size: 12px;")
+            self.progress_bars[model] = progress_bar
+            model_vbox.addWidget(progress_bar)
             # Add 3D viewer
-            pv_widget = QtInteractor(self)
-            self.pv_widgets[model] = pv_widget
-            model_vbox.addWidget(pv_widget, 1)
+            if self.comparison_view is not None:
+                self.pv_widgets[model] = self.comparison_view.viewport(model)
+                self.lod_switchers[model] = comparison_switcher
+            else:
+                pv_widget = QtInteractor(self)
+                self.pv_widgets[model] = pv_widget
+                # Coarse meshes while the camera moves, full resolution once it stops
+                self.lod_switchers[model] = LODSwitcher(pv_widget)
+                model_vbox.addWidget(pv_widget, 1)
+            self.mesh_lods[model] = {}
+            stages.mark("3D view", model=model)
 
             # Add evaluation table below viewer
-            from PySide6.QtWidgets import QTableWidget, QTableWidgetItem; import pandas as pd
-            if model == "Total Segmentator": 
-                model_abberviation = "ts"
-            elif model == "Swin UNETR":
-                model_abberviation = "swin"
-            elif model == "Whole Body CT":
-                model_abberviation = "wbct"
-
-            organs_col = os.listdir(os.path.dirname(__file__)+"/"+ self.selected_organ+"/"+ model)
-            table = QTableWidget(len(organs_col)+1, 3, self)
-            table.setHorizontalHeaderLabels(["Dice", "IoU", "Volume Similarity"])
-            row_labels = [file[:file.index(".")] for file in organs_col] + ["Average"]
+            model_abberviation = MODEL_ABBREVIATIONS.get(model, model)
+            organs_col = organ_files[self.selected_organ][model]
+            # Surface metric columns only show up once evaluation.csv has them
+            columns = list(METRICS) + [c for c in SURFACE_METRICS if evaluation and evaluation.has(c)]
+            table = QTableWidget(len(organs_col)+1, len(columns), self)
+            table.setHorizontalHeaderLabels([SURFACE_HEADERS.get(c, c) for c in columns])
+            row_labels = [self.structure_names[model][file] for file in organs_col] + ["Average"]
             table.setVerticalHeaderLabels(row_labels)
-            
-
-            # Reading csv and visualizing evaluation matrix data on the app
-            df = pd.read_csv("evaluation.csv", header=0)
-            df.columns = ["Model", "case", "Organ", "Dice", "IoU", "Pred_Volume", "GT_Volume"]
 
-            vol_similarity = []
+            # Visualizing evaluation matrix data on the app, mean (± std over cases) per organ
             i = 0
             for organ in organs_col:
-                organ_name = organ.split(".")[0]  # extracting organ name from the file name
-
-                dice = df.query(f'Model == "{model_abberviation}" and Organ == "{organ_name}"')["Dice"].values
-                iou  = df.query(f'Model == "{model_abberviation}" and Organ == "{organ_name}"')["IoU"].values
-                vs1  = df.query(f'Model == "{model_abberviation}" and Organ == "{organ_name}"')["Pred_Volume"].values
-                vs2  = df.query(f'Model == "{model_abberviation}" and Organ == "{organ_name}"')["GT_Volume"].values
-
-                try:
-                    table.setItem(i, 0, QTableWidgetItem(f"{float(dice[0]):.2f}"))
-                    table.setItem(i, 1, QTableWidgetItem(f"{float(iou[0]):.2f}"))
-                    vs = (float(1 - abs(vs1[0] - vs2[0])/(vs1[0] + vs2[0])))
-                    vol_similarity.append(vs)
-                    table.setItem(i, 2, QTableWidgetItem(f"{vs:.2f}"))
-                except:
-                    print(model_abberviation, organ, dice, iou)
+                organ_name = self.structure_names[model][organ]
+                stats = evaluation.organ(model_abberviation, organ_name) if evaluation else None
+                if stats is None:
+                    print(f"No evaluation for {model_abberviation} {organ_name}")
+                else:
+                    for col, metric in enumerate(columns):
+                        table.setItem(i, col, QTableWidgetItem(EvaluationStore.format(stats[metric])))
                 i += 1
 
             # Average row
-            avg_dice = df.query(f"Model == '{model_abberviation}'")["Dice"].mean()
-            avg_iou = df.query(f"Model == '{model_abberviation}'")["IoU"].mean()
-            avg_vs1 = df.query(f"Model == '{model_abberviation}'")["Pred_Volume"].mean()
-            avg_vs2 = df.query(f"Model == '{model_abberviation}'")["GT_Volume"].mean()
-            table.setItem(i, 0, QTableWidgetItem(f"{avg_dice:.2f}"))
-            table.setItem(i, 1, QTableWidgetItem(f"{avg_iou:.2f}"))
-            
-            table.setItem(i, 2, QTableWidgetItem(f"{(sum(vol_similarity)/len(vol_similarity)):.2f}"))
+            stats = evaluation.model(model_abberviation) if evaluation else None
+            if stats is not None:
+                for col, metric in enumerate(columns):
+                    table.setItem(i, col, QTableWidgetItem(EvaluationStore.format(stats[metric])))
 
             table.resizeColumnsToContents()
             table.setStyleSheet("color: #fff; background: #232946; font-size: 12px; padding")
@@ -181,36 +205,29 @@ class OrgansViewer(QWidget):
             model_widget.setLayout(model_vbox)
             models_area.addWidget(model_widget, 1)
             self.model_widgets.append(model_widget)
-            # Load and show all files for this model
-            for file in organ_files[self.selected_organ][model]:
-                nii_path = os.path.join(os.path.dirname(__file__), self.selected_organ, model, file)
-                if os.path.exists(nii_path):
-                    img = nib.load(nii_path)
-                    data = img.get_fdata()
-                    # Use ImageData for volumetric grid
-                    grid = pv.ImageData()
-                    grid.dimensions = data.shape
-                    grid.spacing = img.header.get_zooms()
-                    grid.origin = tuple(img.affine[:3, 3])
-                    grid['values'] = data.flatten(order='F')
-                    # Extract mesh using marching cubes (threshold: mean value)
-                    try:
-                        threshold = data.mean()
-                        mesh = grid.contour([threshold], scalars='values')
-                        mesh = mesh.smooth(n_iter=50, relaxation_factor=0.1)
-                        # Assign a unique color for each actor
-                        import random
-                        default_color = [random.random(), random.random(), random.random()]
-                        actor = pv_widget.add_mesh(mesh, name=file, color=default_color, show_scalar_bar=False)
-                        self.pv_actors[model][file] = actor
-                    except Exception as e:
-                        print(f"Mesh extraction failed for {file}: {e}")
+            stages.mark("evaluation table", model=model)
+            # Queue all files for this model, meshes are added as they finish
+            self.mesh_builder.submit(model, {
+                file: (nii_path, label)
+                for file, (nii_path, label) in self.mesh_sources[model].items()
+                if os.path.exists(nii_path)
+            })
+            if not self.mesh_builder.totals.get(model):
+                progress_bar.hide()
+            stages.mark("submit meshes", model=model)
             # Add 'View slices' button under each model
             btn = QPushButton("View slices")
             btn.setStyleSheet("margin-top: 8px; font-size: 14px; background: #0078d7; color: #fff; border-radius: 8px; padding: 4px 12px;")
             btn.clicked.connect(lambda checked, organ=self.selected_organ, m=model: self.show_slices_view(organ, m))
             model_vbox.addWidget(btn)
         view_layout.addLayout(models_area, 1)
+        if len(organs[self.selected_organ]) > 1:
+            # Voxel-wise agreement between the models, as slices and contours
+            agreement_btn = QPushButton("Model agreement")
+            agreement_btn.setStyleSheet("margin-top: 8px; font-size: 14px; background: #0078d7; color: #fff; border-radius: 8px; padding: 4px 12px;")
+            agreement_btn.clicked.connect(lambda checked, organ=self.selected_organ: self.show_agreement_view(organ))
+            view_layout.addWidget(agreement_btn)
+            self.model_widgets.append(agreement_btn)
         self.models_area = models_area
         self.view_layout = view_layout
         main_layout.addWidget(sidebar)
@@ -219,12 +236,65 @@ class OrgansViewer(QWidget):
 
         self.slice_viewer = None
         self.slice_viewer_model = None
+        stages.done()
+
+    def on_return(self):
+        # The screen is kept for the next visit; meshes nobody will look at meanwhile are not built,
+        # resume_meshes queues them again
+        self.mesh_builder.cancel_pending()
+        if self.return_callback:
+            self.return_callback()
+
+    def resume_meshes(self):
+        """Queue the meshes that were dropped when the screen was left."""
+        for model, sources in self.mesh_sources.items():
+            building = self.mesh_builder.building(model)
+            missing = {
+                file: source for file, source in sources.items()
+                if file not in self.mesh_lods[model] and file not in building
+                and (model, file) not in self.failed_meshes and os.path.exists(source[0])
+            }
+            if missing:
+                self.progress_bars[model].show()
+                self.mesh_builder.submit(model, missing)
+
+    def on_mesh_failed(self, model, file, error):
+        print(f"Mesh extraction failed for {file}: {error}")
+        self.failed_meshes.add((model, file))
+
+    def on_mesh_ready(self, model, file, lod):
+        pv_widget = self.pv_widgets.get(model)
+        if pv_widget is None:
+            return
+        # Assign a unique color for each actor
+        default_color = [random.random(), random.random(), random.random()]
+        with tracing.span("add mesh", cat="render", model=model, file=file):
+            actor = pv_widget.add_mesh(lod.full, name=file, color=default_color, show_scalar_bar=False)
+        self.pv_actors[model][file] = actor
+        self.mesh_lods[model][file] = lod
+        self.lod_switchers[model].add((model, file), actor, lod)
+        # Apply whatever the user already set on the controls while the mesh was loading
+        for part_label, view_checkbox, opacity_slider, color_btn, f in self.sidebar_controls.get(model, []):
+            if f == file:
+                actor.SetVisibility(view_checkbox.isChecked())
+                actor.GetProperty().SetOpacity(opacity_slider.value() / 100.0)
+                # Triangle budget per structure
+                part_label.setText(f"{self.structure_names[model][file]} ({lod.triangle_counts[0] / 1000:.0f}k)")
+                part_label.setToolTip(lod.describe())
+
+    def on_mesh_progress(self, model, done, total):
+        progress_bar = self.progress_bars.get(model)
+        if progress_bar is None:
+            return
+        progress_bar.setMaximum(total)
+        progress_bar.setValue(done)
+        if done >= total:
+            progress_bar.hide()
 
     def toggle_actor(self, model, file, checked):
         actor = self.pv_actors.get(model, {}).get(file)
         if actor:
             actor.SetVisibility(checked)
-            self.view_checkbox.stateChanged
 
     def set_opacity(self, model, file, value):
         actor = self.pv_actors.get(model, {}).get(file)
@@ -240,6 +310,71 @@ class OrgansViewer(QWidget):
                 actor.GetProperty().SetColor([c/255.0 for c in rgb])
 
     def show_slices_view(self, organ, model):
+        stages = tracing.stages("show_slices_view", organ=organ, model=model)
+        # Collect all .nii/.nii.gz files for the selected model as organs
+        organ_files = {}
+        packed = None
+        label_table = {}
+        for f, (path, label) in self.catalog.sources(organ, model).items():
+            organ_files[f] = path
+            if label is not None:
+                packed = path
+                label_table[label] = f
+        # A packed label volume is handed to the slice viewer as a single file, its labels named by catalog entry
+        seg_source = packed if packed is not None else organ_files
+        stages.mark("list segmentation")
+
+        # Gather meshes and mesh_properties from pv_actors
+        meshes = {}
+        mesh_properties = {}
+        colors = {}
+        opacities = {}
+        actors = self.pv_actors.get(model, {})
+        for file in organ_files:
+            actor = actors.get(file)
+            if actor is None:
+                # Mesh not streamed in yet or failed: default look, the slices view contours it itself
+                colors[file] = (0, 0.5, 1, 0.45)
+                opacities[file] = 0.5
+                continue
+            # Hand over all levels of detail, not whatever level the mapper shows right now
+            mesh = self.mesh_lods[model][file]
+            color = actor.GetProperty().GetColor()
+            opacity = actor.GetProperty().GetOpacity()
+            meshes[file] = mesh
+            mesh_properties[file] = {
+                'color': color,
+                'opacity': opacity
+            }
+            colors[file] = (*color, 0.45)
+            opacities[file] = opacity
+        stages.mark("gather meshes")
+        part_names = {f: self.structure_names[model].get(f, f) for f in organ_files}
+        # With a slice server configured, slices and meshes come from it instead of the local files
+        remote = None
+        if os.environ.get("MIS_SERVER_URL"):
+            from slice_server import RemoteSegmentation, SliceClient
+            try:
+                remote = RemoteSegmentation(SliceClient(), organ, model)
+            except (KeyError, ValueError, OSError) as e:
+                print(f"[warn] slice server unavailable, reading {model} locally: {e}")
+        self.open_slices_view(model, seg_source, part_names, colors, opacities, meshes, mesh_properties, stages, remote, label_table or None)
+
+    def show_agreement_view(self, organ):
+        """Slices and contours of where the models agree on each structure, and where only some of them found it."""
+        stages = tracing.stages("show_agreement_view", organ=organ)
+        path = agreement_volume(organ, self.catalog)
+        if path is None:
+            print(f"[warn] no structure of {organ} is segmented by two models on a common grid")
+            return
+        stages.mark("agreement volume")
+        names = list(read_label_table(path).values())
+        colors = {name: AGREEMENT_COLORS[level_of(name)] for name in names}
+        opacities = {name: 0.5 for name in names}
+        # No meshes handed over: the viewer contours every agreement level itself
+        self.open_slices_view("Model agreement", path, {name: name for name in names}, colors, opacities, None, None, stages)
+
+    def open_slices_view(self, title, seg_source, part_names, colors, opacities, meshes, mesh_properties, stages, remote=None, label_table=None):
         # Hide all model viewers
         for w in self.model_widgets:
             w.hide()
@@ -251,48 +386,19 @@ class OrgansViewer(QWidget):
 
         # Use fixed scan file
         scan_file = os.path.join(os.path.dirname(__file__), "scan.nii.gz")
-        # Collect all .nii/.nii.gz files for the selected model as organs
-        organ_files = {}
-        model_dir = os.path.join(os.path.dirname(__file__), organ, model)
-        for f in os.listdir(model_dir):
-            if f.endswith('.nii') or f.endswith('.nii.gz'):
-                organ_files[f] = os.path.join(model_dir, f)
-
-        # Gather meshes and mesh_properties from pv_actors
-        meshes = {}
-        mesh_properties = {}
-        colors = {}
-        opacities = {}
-        if hasattr(self, 'pv_actors') and model in self.pv_actors:
-            for file, actor in self.pv_actors[model].items():
-                mesh = actor.GetMapper().GetInputAsDataSet()
-                color = actor.GetProperty().GetColor()
-                opacity = actor.GetProperty().GetOpacity()
-                meshes[file] = mesh
-                mesh_properties[file] = {
-                    'color': color,
-                    'opacity': opacity
-                }
-                colors[file] = (*color, 0.45)
-                opacities[file] = opacity
-        else:
-            # fallback default color/opacity
-            for f in organ_files:
-                colors[f] = (0, 0.5, 1, 1)
-                opacities[f] = 0.5
-
         from slicer import SegmentationViewer
         self.slice_viewer = QWidget(self)
         layout = QHBoxLayout(self.slice_viewer)
         # Slices viewer with meshes and mesh_properties
-        seg_viewer = SegmentationViewer(scan_file, organ_files, colors, opacities, meshes=meshes, mesh_properties=mesh_properties)
+        seg_viewer = SegmentationViewer(scan_file, seg_source, colors, opacities, meshes=meshes, mesh_properties=mesh_properties, mesh_cache=self.mesh_cache, remote=remote, label_table=label_table)
         layout.addWidget(seg_viewer, 2)
+        stages.mark("SegmentationViewer")
         # Add back button
         back_btn = QPushButton("        ← Back to models        ", self.slice_viewer)
         back_btn.setStyleSheet("font-size: 16px; color: #fff; background: #0078d7; border-radius: 8px; margin-bottom: 8px;")
         back_btn.clicked.connect(self.hide_slices_view)
         layout.addWidget(back_btn, )
-        self.slice_viewer_model = model
+        self.slice_viewer_model = title
         self.view_layout.addWidget(self.slice_viewer)
         self.slice_viewer.show()
         # Update sidebar for slice view: organ label, model label, and part controls directly (no tree/dropdown)
@@ -304,14 +410,14 @@ class OrgansViewer(QWidget):
         organ_label.setStyleSheet("color: #fff; font-size: 24px; font-weight: bold; margin: 16px 0 8px 0;")
         organ_label.setAlignment(Qt.AlignCenter)
         self.sidebar_layout.addWidget(organ_label)
-        model_label = QLabel(model.capitalize(), self)
+        model_label = QLabel(title.capitalize(), self)
         model_label.setStyleSheet("color: #fff; font-size: 20px; font-weight: bold; margin: 8px 0 8px 0;")
         model_label.setAlignment(Qt.AlignCenter)
         self.sidebar_layout.addWidget(model_label)
         # Add part controls directly for this model, but connect to slice view's SegmentationViewer
         controls = []
-        for file in organ_files:
-            part_label = QLabel(file[:file.find('.')])
+        for file, part_name in part_names.items():
+            part_label = QLabel(part_name)
             part_label.setStyleSheet("color: #fff; font-size: 12px; margin-right: 8px; margin-left: 0px;")
             view_checkbox = QCheckBox("View")
             view_checkbox.setChecked(True)
@@ -343,8 +449,7 @@ class OrgansViewer(QWidget):
                         rgba = tuple([c/255.0 for c in rgb] + [0.45])
                         seg_viewer.colors[f] = rgba
                         for sv in [seg_viewer.axial_view, seg_viewer.sagittal_view, seg_viewer.coronal_view]:
-                            sv.mask_colors[f] = rgba
-                            sv.update_slice(sv.slider.value())
+                            sv.set_mask_color(f, rgba)
             view_checkbox.stateChanged.connect(lambda checked, f=file: toggle_slice_actor(checked, f))
             opacity_slider.valueChanged.connect(lambda val, f=file: set_slice_opacity(val, f))
             color_btn.clicked.connect(lambda _, f=file, btn=color_btn: pick_slice_color(_, f, btn))
@@ -356,6 +461,8 @@ class OrgansViewer(QWidget):
             row_layout.addWidget(opacity_slider)
             row_layout.addWidget(color_btn)
             self.sidebar_layout.addWidget(row)
+        stages.mark("sidebar")
+        stages.done()
 
     def hide_slices_view(self):
         if self.slice_viewer:
@@ -0,0 +1,183 @@
+from itertools import combinations
+
+import numpy as np
+
+# Per-byte popcount for numpy versions without np.bitwise_count (< 2.0)
+_BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """Number of set bits in an array of packed words."""
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(_BYTE_COUNTS[words.view(np.uint8)].sum(dtype=np.int64))
+
+
+class PackedMask:
+    """
+    Binary mask stored as bits, 8 voxels per byte (1/64 of a float64
+    volume), held as uint64 words so overlaps and votes between masks are
+    bitwise operations on whole words and counts are popcounts.
+    Voxels are packed in C order; the bits past the last voxel stay zero.
+    """
+    def __init__(self, shape, words):
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape))
+        self.words = words
+        self._count = None
+
+    @classmethod
+    def from_mask(cls, mask):
+        mask = np.asarray(mask)
+        if mask.dtype != bool:
+            mask = mask > 0.5
+        bits = np.packbits(mask.reshape(-1))
+        # Round up to whole 64-bit words
+        pad = -len(bits) % 8
+        if pad:
+            bits = np.concatenate([bits, np.zeros(pad, dtype=np.uint8)])
+        return cls(mask.shape, bits.view(np.uint64))
+
+    @classmethod
+    def empty(cls, shape):
+        size = int(np.prod(shape))
+        return cls(shape, np.zeros(-(-size // 64), dtype=np.uint64))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return np.dtype(bool)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    @property
+    def voxel_count(self):
+        if self._count is None:
+            self._count = popcount(self.words)
+        return self._count
+
+    def _check(self, other):
+        if other.shape != self.shape:
+            raise ValueError(f"shape mismatch {self.shape} vs {other.shape}")
+
+    def __and__(self, other):
+        self._check(other)
+        return PackedMask(self.shape, self.words & other.words)
+
+    def __or__(self, other):
+        self._check(other)
+        return PackedMask(self.shape, self.words | other.words)
+
+    def __xor__(self, other):
+        self._check(other)
+        return PackedMask(self.shape, self.words ^ other.words)
+
+    def __invert__(self):
+        words = ~self.words
+        # Clear the padding bits again, packbits puts the first voxel in the highest bit of a byte
+        tail = words.view(np.uint8)
+        used = -(-self.size // 8)
+        tail[used:] = 0
+        if self.size % 8:
+            tail[used - 1] &= np.uint8((0xFF << (8 - self.size % 8)) & 0xFF)
+        return PackedMask(self.shape, words)
+
+    def unpack(self):
+        """Dense bool volume."""
+        bits = np.unpackbits(self.words.view(np.uint8), count=self.size)
+        return bits.view(bool).reshape(self.shape)
+
+    def __array__(self, dtype=None, copy=None):
+        volume = self.unpack()
+        return volume if dtype is None else volume.astype(dtype)
+
+
+def overlap(a, b):
+    """Voxel counts, Dice and IoU of two packed masks on the same grid."""
+    intersection = popcount(a.words & b.words)
+    total = a.voxel_count + b.voxel_count
+    union = total - intersection
+    return {
+        "Dice": 2.0 * intersection / total if total else float("nan"),
+        "IoU": intersection / union if union else float("nan"),
+        "Intersection": intersection,
+        "Volume_A": a.voxel_count,
+        "Volume_B": b.voxel_count,
+    }
+
+
+def pairwise(masks):
+    """overlap() of every pair of {name: PackedMask}, as {(name_a, name_b): metrics}."""
+    return {(a, b): overlap(masks[a], masks[b]) for a, b in combinations(masks, 2)}
+
+
+def vote_counts(masks):
+    """
+    Per-voxel number of masks that contain it, bit-sliced: a list of word
+    arrays, least significant bit first. Each mask is added with a ripple
+    carry over the words, so n masks cost O(n log n) word operations.
+    """
+    masks = list(masks)
+    planes = []
+    for added, mask in enumerate(masks, start=1):
+        masks[0]._check(mask)
+        carry = mask.words
+        for i, plane in enumerate(planes):
+            planes[i] = plane ^ carry
+            carry = plane & carry
+        # carry is only non-zero when the count needs another bit
+        if len(planes) < added.bit_length():
+            planes.append(carry)
+    return planes
+
+
+def at_least(masks, k):
+    """Voxels contained in at least k of the masks."""
+    masks = list(masks)
+    if not masks:
+        raise ValueError("no masks")
+    shape = masks[0].shape
+    if k <= 0:
+        return ~PackedMask.empty(shape)
+    planes = vote_counts(masks)
+    if k >= 2 ** len(planes):
+        return PackedMask.empty(shape)
+    # count >= k, compared bit by bit from the most significant one
+    greater = np.zeros_like(planes[0])
+    equal = ~greater
+    for bit in reversed(range(len(planes))):
+        if k >> bit & 1:
+            equal = equal & planes[bit]
+        else:
+            greater = greater | (equal & planes[bit])
+            equal = equal & ~planes[bit]
+    return PackedMask(shape, greater | equal)
+
+
+def majority(masks):
+    """Voxels contained in more than half of the masks."""
+    masks = list(masks)
+    return at_least(masks, len(masks) // 2 + 1)
+
+
+def consensus(masks):
+    """Voxels contained in every mask."""
+    masks = list(masks)
+    result = masks[0]
+    for mask in masks[1:]:
+        result = result & mask
+    return result
+
+
+def union(masks):
+    """Voxels contained in any mask."""
+    masks = list(masks)
+    result = masks[0]
+    for mask in masks[1:]:
+        result = result | mask
+    return result
@@ -0,0 +1,151 @@
+import numpy as np
+
+from sparse_mask import SparseMask, SparsePlane
+
+ORIENTATION_AXES = {"axial": 2, "sagittal": 0, "coronal": 1}
+DEFAULT_MASK_COLOR = (1.0, 0.0, 0.0, 0.35)
+
+
+def take_plane(volume, orientation, idx):
+    """2D plane of volume at idx for the given orientation (unrotated); a SparsePlane for a SparseMask."""
+    if isinstance(volume, SparseMask):
+        return volume.plane(ORIENTATION_AXES[orientation], idx)
+    if orientation == "axial":
+        return volume[:, :, idx]
+    elif orientation == "sagittal":
+        return volume[idx, :, :]
+    elif orientation == "coronal":
+        return volume[:, idx, :]
+    raise ValueError("orientation must be 'axial'|'sagittal'|'coronal'")
+
+
+def fit_plane(plane, shape):
+    """plane cropped or zero-padded at the origin to shape, as label_plane does for mask planes."""
+    if plane.shape == tuple(shape):
+        return plane
+    fitted = np.zeros(shape, dtype=plane.dtype)
+    h, w = min(shape[0], plane.shape[0]), min(shape[1], plane.shape[1])
+    fitted[:h, :w] = plane[:h, :w]
+    return fitted
+
+
+def to_display(plane):
+    # Slices are shown rotated by 90 degrees with origin="lower"
+    return np.rot90(plane)
+
+
+def level_planes(level, orientation, idx, compositor):
+    """
+    Display-oriented image plane and label-id plane at full resolution
+    index idx of a level (volume, masks, labels, mask_indices, factor).
+    """
+    volume, masks, labels, mask_indices, factor = level
+    axis = ORIENTATION_AXES[orientation]
+    idx = min(idx // factor, volume.shape[axis] - 1)
+    img = take_plane(volume, orientation, idx)
+    if labels is not None:
+        # A label volume on another grid than the scan is cut off or padded, like separate masks
+        if idx < labels.shape[axis]:
+            label_plane = fit_plane(take_plane(labels.labels, orientation, idx), img.shape)
+        else:
+            label_plane = np.zeros(img.shape, dtype=np.uint8)
+    else:
+        mask_planes = {}
+        regions = {}
+        for name, mask in masks.items():
+            index = mask_indices.get(name)
+            if index is not None:
+                if not index.present(axis, idx):
+                    continue
+                regions[name] = index.plane_region(axis)
+            mask_planes[name] = take_plane(mask, orientation, idx)
+        label_plane = compositor.label_plane(mask_planes, img.shape, regions)
+    return to_display(img), to_display(label_plane)
+
+
+class OverlayCompositor:
+    """
+    Turns a plane of label ids into an RGBA overlay with a single lookup
+    table gather. Colour or opacity changes only rewrite the LUT.
+    table maps label id -> structure name; for separate binary masks the
+    ids are simply 1..N in mask order, where later masks win on overlap.
+    """
+    def __init__(self, table, colors=None):
+        self.table = dict(table)
+        self.ids = {name: label_id for label_id, name in self.table.items()}
+        self.lut = np.zeros((max(self.table, default=0) + 1, 4), dtype=np.uint8)
+        colors = colors or {}
+        for label_id, name in self.table.items():
+            self.lut[label_id] = self._rgba8(colors.get(name, DEFAULT_MASK_COLOR))
+        self._blend_lut = None
+
+    @classmethod
+    def for_masks(cls, names, colors=None):
+        return cls({i: name for i, name in enumerate(names, start=1)}, colors)
+
+    @staticmethod
+    def _rgba8(color):
+        if len(color) == 3:
+            color = (*color, DEFAULT_MASK_COLOR[3])
+        return np.round(np.clip(color, 0.0, 1.0) * 255).astype(np.uint8)
+
+    def set_color(self, name, color):
+        label_id = self.ids.get(name)
+        if label_id is not None:
+            self.lut[label_id] = self._rgba8(color)
+            self._blend_lut = None
+
+    def label_plane(self, mask_planes, shape, regions=None):
+        """
+        Flatten {name: binary plane} into one plane of label ids of the given
+        shape. Planes of a different size are cropped/padded at the origin.
+        regions optionally limits each mask to its (rows, cols) bounding box.
+        """
+        dtype = np.uint8 if len(self.lut) <= 256 else np.uint16
+        plane = np.zeros(shape, dtype=dtype)
+        h, w = shape
+        regions = regions or {}
+        for name, ms in mask_planes.items():
+            label_id = self.ids.get(name)
+            if label_id is None:
+                continue
+            if isinstance(ms, SparsePlane):
+                # Run-length encoded planes write their label directly
+                ms.paint(plane, label_id)
+                continue
+            mh, mw = ms.shape
+            rows, cols = regions.get(name, (slice(0, mh), slice(0, mw)))
+            rows = slice(rows.start, min(rows.stop, h, mh))
+            cols = slice(cols.start, min(cols.stop, w, mw))
+            hit = ms[rows, cols] > 0.5
+            plane[rows, cols][hit] = label_id
+        return plane
+
+    def compose(self, label_plane):
+        """RGBA uint8 overlay, fully transparent where label_plane is 0."""
+        return self.lut[label_plane]
+
+    def blend_lut(self):
+        """
+        (label id, grey level) -> blended RGBA table, so blending a whole
+        slice is one gather. Rebuilt lazily after a colour change.
+        """
+        if self._blend_lut is None:
+            gray = np.arange(256, dtype=np.float32)[None, :, None]
+            rgb = self.lut[:, None, :3].astype(np.float32)
+            alpha = self.lut[:, None, 3:4].astype(np.float32) / 255.0
+            blended = np.full((len(self.lut), 256, 4), 255, dtype=np.uint8)
+            blended[..., :3] = np.round(gray * (1.0 - alpha) + rgb * alpha)
+            self._blend_lut = blended
+        return self._blend_lut
+
+    def blend(self, img, label_plane):
+        """
+        Grey image (autoscaled to its own min/max) with the overlay blended
+        on top, as one RGBA uint8 image ready for a single imshow.
+        """
+        img = np.ascontiguousarray(img, dtype=np.float32)
+        lo, hi = float(img.min()), float(img.max())
+        scale = 255.0 / (hi - lo) if hi > lo else 0.0
+        gray = ((img - lo) * scale).astype(np.uint8)
+        return self.blend_lut()[label_plane, gray]
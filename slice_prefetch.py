@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def prefetch_executor():
+    """Thread pool shared by all slice viewers."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 2), thread_name_prefix="slice-prefetch")
+        return _executor
+
+
+class SlicePrefetcher:
+    """
+    Prepares slices around the current slider position on a thread pool and
+    keeps them in a bounded ring buffer. The window leans in the direction
+    the user is scrubbing: `ahead` slices forward, `behind` slices back.
+    produce(idx) must be thread-safe and return whatever the viewer draws.
+    """
+    def __init__(self, produce, max_idx, ahead=8, behind=2, capacity=32, executor=None):
+        self.produce = produce
+        self.max_idx = max_idx
+        self.ahead = ahead
+        self.behind = behind
+        self.capacity = max(capacity, ahead + behind + 1)
+        self.executor = executor or prefetch_executor()
+        self.buffer = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_idx = None
+        self.direction = 1
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, idx):
+        """Slice at idx, from the buffer when it is ready, and re-centre the prefetch window."""
+        if self.last_idx is not None and idx != self.last_idx:
+            self.direction = 1 if idx > self.last_idx else -1
+        self.last_idx = idx
+        with self.lock:
+            future = self.buffer.get(idx)
+            if future is not None:
+                # Asked for again, so it is the last slice the ring should drop
+                self.buffer.move_to_end(idx)
+        if future is not None and (future.done() or future.running()):
+            try:
+                result = future.result()
+                self.hits += 1
+            except Exception:
+                result = self.produce(idx)
+                self.misses += 1
+        else:
+            # Not started yet (or never queued): doing it here is faster than waiting in line
+            if future is not None:
+                future.cancel()
+            result = self.produce(idx)
+            self.misses += 1
+            self._store(idx, self._done_future(result))
+        self.schedule(idx)
+        return result
+
+    def schedule(self, idx):
+        forward = range(1, self.ahead + 1)
+        backward = range(1, self.behind + 1)
+        if self.direction < 0:
+            forward, backward = backward, forward
+        wanted = [idx + d for d in forward] + [idx - d for d in backward]
+        for i in wanted:
+            if 0 <= i <= self.max_idx:
+                with self.lock:
+                    if i in self.buffer:
+                        self.buffer.move_to_end(i)
+                        continue
+                self._store(i, self.executor.submit(self.produce, i))
+
+    def _store(self, idx, future):
+        with self.lock:
+            self.buffer[idx] = future
+            self.buffer.move_to_end(idx)
+            # Ring buffer: drop the slices least recently asked for
+            while len(self.buffer) > self.capacity:
+                _, old = self.buffer.popitem(last=False)
+                old.cancel()
+
+    @staticmethod
+    def _done_future(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def invalidate(self):
+        with self.lock:
+            for future in self.buffer.values():
+                future.cancel()
+            self.buffer.clear()
@@ -0,0 +1,408 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+import matplotlib.image
+import numpy as np
+
+from catalog import VIEW_FOLDERS, get_catalog
+from evaluate import ROOT
+from label_volume import LabelVolume
+from mesh_builder import load_lods
+from mesh_cache import CACHE_DIR, MeshCache
+from mesh_lod import MeshLOD
+from slice_overlay import ORIENTATION_AXES, OverlayCompositor, level_planes
+from snapshots import DEFAULT_SCAN, scan_for, structure_colors
+from volume_registry import get_registry
+
+SERVER_URL = os.environ.get("MIS_SERVER_URL", "http://127.0.0.1:8765")
+# Encoded responses kept by the server, newest last
+CACHE_BYTES = int(float(os.environ.get("MIS_SERVER_CACHE_MB", 256)) * 2 ** 20)
+SLICE_FORMATS = ("raw", "png")
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses {key: (body, content type)}, bounded by their total size."""
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, content_type):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old[0])
+            self.entries[key] = (body, content_type)
+            self.nbytes += len(body)
+            while self.nbytes > self.max_bytes:
+                _, (dropped, _) = self.entries.popitem(last=False)
+                self.nbytes -= len(dropped)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.nbytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+def file_signature(paths):
+    """(path, size, mtime) of every file, changes whenever one of them is rewritten."""
+    signature = []
+    for path in sorted(set(paths)):
+        st = os.stat(path)
+        signature.append((path, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def encode_arrays(**arrays):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+class Segmentation:
+    """One model's segmentation of a case with its scan, opened the way SegmentationViewer opens it."""
+    def __init__(self, scan_file, sources):
+        registry = get_registry()
+        self.scan_file = scan_file
+        self.sources = sources
+        self.signature = file_signature([scan_file] + [path for path, _ in sources.values()])
+        scan = registry.lazy(scan_file)
+        if not scan.random_access:
+            scan.full()
+        packed = {path for path, label in sources.values() if label is not None}
+        if packed:
+            # Labels go by their catalog entry, which may be an alias of the name stored with the volume
+            self.table = {label: entry for entry, (_, label) in sources.items()}
+            labels = LabelVolume.load(packed.pop(), lazy=True, table=self.table)
+            if not labels.labels.random_access:
+                labels.labels.full()
+            self.level = (scan, {}, labels, {}, 1)
+        else:
+            masks = {entry: registry.compact_mask(path) for entry, (path, _) in sources.items()}
+            indices = {entry: registry.index(path) for entry, (path, _) in sources.items()}
+            self.table = {i: entry for i, entry in enumerate(sources, start=1)}
+            self.level = (scan, masks, None, indices, 1)
+        self.shape = tuple(scan.shape)
+        self.affine = np.asarray(scan.affine)
+        self.compositor = OverlayCompositor(self.table, structure_colors(sources))
+        # So a mesh is never built twice at once
+        self.mesh_locks = {entry: threading.Lock() for entry in sources}
+
+    def current(self):
+        try:
+            return file_signature([self.scan_file] + [path for path, _ in self.sources.values()]) == self.signature
+        except OSError:
+            return False
+
+    def planes(self, orientation, idx):
+        if orientation not in ORIENTATION_AXES:
+            raise ValueError(f"orientation must be one of {', '.join(ORIENTATION_AXES)}")
+        if not 0 <= idx < self.shape[ORIENTATION_AXES[orientation]]:
+            raise ValueError(f"{orientation} slice {idx} is outside 0..{self.shape[ORIENTATION_AXES[orientation]] - 1}")
+        return level_planes(self.level, orientation, idx, self.compositor)
+
+
+class SliceService:
+    """
+    The data behind the slice server: segmentations of the catalog opened
+    on first use and kept while their files are unchanged, slices and
+    meshes encoded once and then served from a ResponseCache. A case is a
+    catalog collection such as 'liver', the scan comes from scan_template.
+    """
+    def __init__(self, root=ROOT, scan_template=DEFAULT_SCAN, cache_dir=CACHE_DIR, cache_bytes=CACHE_BYTES):
+        self.root = root
+        self.scan_template = scan_template
+        self.catalog = get_catalog(root)
+        self.catalog.refresh([os.path.join(root, folder) for folder in VIEW_FOLDERS], decode=False)
+        self.mesh_cache = MeshCache(cache_dir) if cache_dir else None
+        self.responses = ResponseCache(cache_bytes)
+        self.segmentations = {}
+        self.lock = threading.Lock()
+        # One lock per segmentation of the catalog, so a volume is never opened twice at once
+        self.loading = {}
+
+    def _segmentation_lock(self, case, model):
+        with self.lock:
+            return self.loading.setdefault((case, model), threading.Lock())
+
+    def cases(self):
+        return {case: self.catalog.models(case) for case in VIEW_FOLDERS if self.catalog.models(case)}
+
+    def segmentation(self, case, model):
+        # Checked before taking a lock, so requests for unknown segmentations leave nothing behind
+        if model not in self.catalog.models(case):
+            raise KeyError(f"no segmentation of {case} by {model}")
+        with self._segmentation_lock(case, model):
+            seg = self.segmentations.get((case, model))
+            if seg is not None and seg.current():
+                return seg
+            sources = self.catalog.sources(case, model)
+            if not sources:
+                raise KeyError(f"no segmentation of {case} by {model}")
+            scan_file = scan_for(self.scan_template, case)
+            if scan_file is None:
+                raise KeyError(f"no scan for {case}: {self.scan_template.format(case=case)}")
+            seg = Segmentation(scan_file, sources)
+            self.segmentations[case, model] = seg
+            return seg
+
+    def cached(self, key, build):
+        """(body, content type, hit) of a response, built and cached on a miss."""
+        entry = self.responses.get(key)
+        if entry is not None:
+            return entry[0], entry[1], True
+        body, content_type = build()
+        self.responses.put(key, body, content_type)
+        return body, content_type, False
+
+    def info(self, case, model):
+        seg = self.segmentation(case, model)
+        info = {
+            "shape": seg.shape,
+            "affine": seg.affine.tolist(),
+            "table": {str(i): name for i, name in seg.table.items()},
+            "entries": list(seg.sources),
+        }
+        return json.dumps(info).encode(), "application/json", False
+
+    def slice(self, case, model, orientation, idx, fmt="raw"):
+        if fmt not in SLICE_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(SLICE_FORMATS)}")
+        seg = self.segmentation(case, model)
+
+        def build():
+            img, labels = seg.planes(orientation, idx)
+            if fmt == "raw":
+                return encode_arrays(image=img, labels=labels), "application/octet-stream"
+            buffer = io.BytesIO()
+            matplotlib.image.imsave(buffer, seg.compositor.blend(img, labels), format="png", origin="lower")
+            return buffer.getvalue(), "image/png"
+
+        return self.cached(("slice", case, model, seg.signature, orientation, idx, fmt), build)
+
+    def mesh(self, case, model, entry):
+        seg = self.segmentation(case, model)
+        if entry not in seg.sources:
+            raise KeyError(f"{model} has no {entry} in {case}")
+
+        def build():
+            with seg.mesh_locks[entry]:
+                lods = load_lods({entry: seg.sources[entry]}, self.mesh_cache)
+            if entry not in lods:
+                raise KeyError(f"{entry} of {model} in {case} is empty")
+            lod = lods[entry]
+            arrays = {"fractions": np.asarray(lod.fractions)}
+            for i, (points, faces) in enumerate(lod.to_arrays()):
+                arrays[f"points_{i}"] = points
+                arrays[f"faces_{i}"] = faces.astype(np.int32)
+            return encode_arrays(**arrays), "application/octet-stream"
+
+        return self.cached(("mesh", case, model, seg.signature, entry), build)
+
+    def stats(self):
+        stats = {"responses": self.responses.stats(), "segmentations": len(self.segmentations), "volumes": get_registry().stats()}
+        return json.dumps(stats, default=str).encode(), "application/json", False
+
+    def handle(self, path, query):
+        """(body, content type, cache hit) of a GET request."""
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        route, args = parts[0], parts[1:]
+        if route == "cases" and not args:
+            return json.dumps(self.cases()).encode(), "application/json", False
+        if route == "volume" and len(args) == 2:
+            return self.info(*args)
+        if route == "slice" and len(args) == 4:
+            case, model, orientation, idx = args
+            return self.slice(case, model, orientation, int(idx), query.get("format", ["raw"])[0])
+        if route == "mesh" and len(args) == 3:
+            return self.mesh(*args)
+        if route == "stats" and not args:
+            return self.stats()
+        raise KeyError(f"unknown request {path}")
+
+
+class SliceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            body, content_type, hit = self.server.service.handle(url.path, parse_qs(url.query))
+            status = 200
+        except KeyError as e:
+            status, body, content_type, hit = 404, str(e.args[0] if e.args else e).encode(), "text/plain", False
+        except ValueError as e:
+            status, body, content_type, hit = 400, str(e).encode(), "text/plain", False
+        except Exception as e:
+            print(f"[warn] {self.path} failed: {e}")
+            status, body, content_type, hit = 500, str(e).encode(), "text/plain", False
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", "hit" if hit else "miss")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per slice would drown the console
+        pass
+
+
+def start_server(service, host="127.0.0.1", port=0):
+    """Serve service on a background thread; port 0 picks a free port. Returns (server, thread)."""
+    server = ThreadingHTTPServer((host, port), SliceRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, name="slice-server", daemon=True)
+    thread.start()
+    return server, thread
+
+
+class SliceClient:
+    """Talks to a slice server over one keep-alive connection per thread."""
+    def __init__(self, url=SERVER_URL, timeout=60):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get(self, *parts, **query):
+        """Body of GET /part/part/...?query."""
+        path = "/" + "/".join(quote(str(part), safe="") for part in parts)
+        if query:
+            path += "?" + urlencode(query)
+        for attempt in range(2):
+            conn = getattr(self.local, "conn", None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server drops idle keep-alive connections, try once more on a new one
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+        if response.status == 404:
+            raise KeyError(body.decode(errors="replace"))
+        if response.status != 200:
+            raise ValueError(f"{path}: {response.status} {body.decode(errors='replace')}")
+        return body
+
+    def cases(self):
+        return json.loads(self.get("cases"))
+
+    def info(self, case, model):
+        info = json.loads(self.get("volume", case, model))
+        info["shape"] = tuple(info["shape"])
+        info["affine"] = np.array(info["affine"])
+        info["table"] = {int(i): name for i, name in info["table"].items()}
+        return info
+
+    def planes(self, case, model, orientation, idx):
+        """Display-oriented image plane and label-id plane, as SliceViewer.slice_planes returns them."""
+        with np.load(io.BytesIO(self.get("slice", case, model, orientation, int(idx), format="raw"))) as arrays:
+            return arrays["image"], arrays["labels"]
+
+    def png(self, case, model, orientation, idx):
+        return self.get("slice", case, model, orientation, int(idx), format="png")
+
+    def mesh(self, case, model, entry):
+        with np.load(io.BytesIO(self.get("mesh", case, model, entry))) as arrays:
+            fractions = tuple(arrays["fractions"])
+            levels = [(arrays[f"points_{i}"], arrays[f"faces_{i}"]) for i in range(len(fractions))]
+        return MeshLOD.from_arrays(levels, fractions)
+
+
+class RemoteSegmentation:
+    """One model's segmentation of a case on a slice server, what SegmentationViewer(remote=...) reads from."""
+    def __init__(self, client, case, model):
+        self.client = client
+        self.case = case
+        self.model = model
+        info = client.info(case, model)
+        self.shape = info["shape"]
+        self.affine = info["affine"]
+        self.table = info["table"]
+        self.entries = info["entries"]
+
+    def planes(self, orientation, idx):
+        return self.client.planes(self.case, self.model, orientation, idx)
+
+    def meshes(self, entries=None):
+        """{entry: MeshLOD} of entries (all by default); structures the server has no surface for are left out."""
+        lods = {}
+        for entry in self.entries if entries is None else entries:
+            try:
+                lods[entry] = self.client.mesh(self.case, self.model, entry)
+            except (KeyError, ValueError) as e:
+                print(f"[warn] no mesh for {entry}: {e}")
+        return lods
+
+
+def view(url, case, model):
+    from PySide6 import QtWidgets
+    from slicer import SegmentationViewer
+
+    app = QtWidgets.QApplication(sys.argv)
+    remote = RemoteSegmentation(SliceClient(url), case, model)
+    viewer = SegmentationViewer(None, None, {entry: (*color, 0.45) for entry, color in structure_colors(remote.entries).items()}, remote=remote)
+    viewer.setWindowTitle(f"{case} - {model} ({url})")
+    viewer.resize(1200, 900)
+    viewer.show()
+    sys.exit(app.exec())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve slices and meshes of the segmentations over HTTP, or view them from a running server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=urlsplit(SERVER_URL).port or 8765)
+    parser.add_argument("--root", default=ROOT, help="folder holding the segmented_organs_by_* and organ folders")
+    parser.add_argument("--scan", default=DEFAULT_SCAN, help="CT of a case, may contain {case}")
+    parser.add_argument("--cache-mb", type=float, default=CACHE_BYTES / 2 ** 20, help="memory for encoded responses")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the mesh cache")
+    parser.add_argument("--view", nargs=2, metavar=("CASE", "MODEL"), help="instead open a viewer on a running server")
+    parser.add_argument("--url", default=SERVER_URL, help="server the viewer connects to")
+    args = parser.parse_args()
+    if args.view:
+        view(args.url, *args.view)
+        return
+    service = SliceService(args.root, args.scan, None if args.no_cache else CACHE_DIR, int(args.cache_mb * 2 ** 20))
+    server, thread = start_server(service, args.host, args.port)
+    print(f"Serving {', '.join(service.cases()) or 'nothing'} on http://{args.host}:{server.server_address[1]}")
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        server.shutdown()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
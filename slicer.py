@@ -1,38 +1,60 @@
 # seg_viewer_pyside.py
+import os
 import sys
 import nibabel as nib
 import numpy as np
-import pyvista as pv
 from pyvistaqt import QtInteractor
 from PySide6 import QtWidgets, QtCore
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from catalog import get_catalog
+from label_volume import LabelVolume
+from volume_registry import get_registry
+from slice_overlay import ORIENTATION_AXES, OverlayCompositor, level_planes
+from slice_prefetch import SlicePrefetcher, prefetch_executor
+from mesh_lod import LODSwitcher, MeshLOD
+from mesh_builder import build_lods, mesh_params
+from surface_builder import extract_surfaces
+from volume_pyramid import VolumePyramid, level_affine
+import tracing
 
 class SliceViewer(QtWidgets.QWidget):
     """
     Widget to display one slice view (axial/sagittal/coronal) with a slider.
-    Displays full slice and overlays RGBA masks.
+    Displays full slice and overlays RGBA masks, given either as separate
+    binary masks or as a packed LabelVolume. The data may be a pyramid level
+    downsampled by factor; the slider always runs over full_shape, and
+    set_level swaps in finer data once it is loaded. With remote (a
+    slice_server.RemoteSegmentation) the planes come from a slice server
+    instead and volume may be None.
     """
-    def __init__(self, volume, masks=None, mask_colors=None, orientation="axial", parent=None):
+    def __init__(self, volume, masks=None, mask_colors=None, orientation="axial", labels=None, mask_indices=None, factor=1, full_shape=None, parent=None, remote=None):
         super().__init__(parent)
-        self.volume = volume
-        self.masks = masks or {}
         self.mask_colors = mask_colors or {}
         self.orientation = orientation
+        if orientation not in ORIENTATION_AXES:
+            raise ValueError("orientation must be 'axial'|'sagittal'|'coronal'")
+        self.remote = remote
+        self._set_data(volume, masks, labels, mask_indices, factor)
+        if remote is not None:
+            full_shape = remote.shape
+        self.max_idx = (full_shape or volume.shape)[ORIENTATION_AXES[orientation]] - 1
+
+        # Overlay colours live in one LUT indexed by label id
+        if remote is not None:
+            self.compositor = OverlayCompositor(remote.table, self.mask_colors)
+        elif labels is not None:
+            self.compositor = OverlayCompositor(labels.table, self.mask_colors)
+        else:
+            self.compositor = OverlayCompositor.for_masks(list(self.masks), self.mask_colors)
 
         self.fig = Figure(figsize=(4, 3), dpi=100)
         self.canvas = FigureCanvas(self.fig)
         self.ax = self.fig.add_subplot(111)
+        self.ax.set_position([0, 0, 1, 1])
         self.ax.axis("off")
-
-        if orientation == "axial":
-            self.max_idx = volume.shape[2] - 1
-        elif orientation == "sagittal":
-            self.max_idx = volume.shape[0] - 1
-        elif orientation == "coronal":
-            self.max_idx = volume.shape[1] - 1
-        else:
-            raise ValueError("orientation must be 'axial'|'sagittal'|'coronal'")
+        # The image artist is created once and then only gets new data
+        self.image_artist = None
 
         self.slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
         self.slider.setMinimum(0)
@@ -41,6 +63,8 @@ class SliceViewer(QtWidgets.QWidget):
         self.slider.setFixedHeight(18)
         self.slider.setMaximumWidth(340)
         self.slider.valueChanged.connect(self.update_slice)
+        # Neighbouring slices are prepared in the background while the user scrubs
+        self.prefetcher = SlicePrefetcher(self.slice_planes, self.max_idx)
 
         layout = QtWidgets.QVBoxLayout(self)
         layout.setContentsMargins(4, 4, 4, 4)
@@ -52,68 +76,182 @@ class SliceViewer(QtWidgets.QWidget):
 
         self.update_slice(self.slider.value())
 
+    def _set_data(self, volume, masks, labels, mask_indices, factor):
+        self.volume = volume
+        self.masks = masks or {}
+        # Optional MaskIndex per mask, lets a slice skip masks that are absent there
+        self.mask_indices = mask_indices or {}
+        self.labels = labels
+        self.factor = factor
+        # Read as one tuple by the prefetch threads, so a swap is never seen half done
+        self.level = (volume, self.masks, labels, self.mask_indices, factor)
+
+    def set_level(self, volume, masks=None, labels=None, mask_indices=None, factor=1):
+        """Show another resolution of the same data and redraw the current slice."""
+        self._set_data(volume, masks, labels, mask_indices, factor)
+        self.prefetcher.invalidate()
+        self.update_slice(self.slider.value())
+
+    def slice_planes(self, idx):
+        """Display-oriented image plane and label-id plane at idx."""
+        if self.remote is not None:
+            return self.remote.planes(self.orientation, idx)
+        return level_planes(self.level, self.orientation, idx, self.compositor)
+
     def update_slice(self, idx):
-        if isinstance(idx, (QtCore.QModelIndex, object)):
-            try:
-                idx = int(self.slider.value())
-            except Exception:
-                idx = int(idx)
-
-        self.ax.clear()
-
-        if self.orientation == "axial":
-            img = self.volume[:, :, idx]
-            mask_slices = {name: mask[:, :, idx] for name, mask in self.masks.items()}
-        elif self.orientation == "sagittal":
-            img = self.volume[idx, :, :]
-            mask_slices = {name: mask[idx, :, :] for name, mask in self.masks.items()}
+        if not isinstance(idx, (int, np.integer)):
+            idx = int(self.slider.value())
+        with tracing.span("SliceViewer.update_slice", cat="frame", orientation=self.orientation, idx=idx):
+            with tracing.span("slice planes", cat="slice"):
+                img, label_plane = self.prefetcher.get(idx)
+            self.draw_planes(img, label_plane)
+
+    def draw_planes(self, img, label_plane):
+        # Grey slice and mask overlay are blended up front so matplotlib draws a single image
+        rgba = self.compositor.blend(img, label_plane)
+        if self.image_artist is None or self.image_artist.get_array().shape != rgba.shape:
+            self.ax.clear()
+            self.image_artist = self.ax.imshow(rgba, origin="lower", aspect="auto", interpolation="none")
+            self.ax.set_position([0, 0, 1, 1])
+            self.ax.axis("off")
         else:
-            img = self.volume[:, idx, :]
-            mask_slices = {name: mask[:, idx, :] for name, mask in self.masks.items()}
-
-        img = np.rot90(img)
-        self.ax.imshow(img, cmap="gray", origin="lower", aspect="auto")
-
-        h, w = img.shape
-        overlay = np.zeros((h, w, 4), dtype=float)
-
-        for name, mask_slice in mask_slices.items():
-            ms = np.rot90(mask_slice)
-            if ms.shape != (h, w):
-                mh, mw = ms.shape
-                new_ms = np.zeros((h, w), dtype=bool)
-                copy_h = min(h, mh)
-                copy_w = min(w, mw)
-                new_ms[:copy_h, :copy_w] = ms[:copy_h, :copy_w] > 0.5
-                ms = new_ms
-            else:
-                ms = ms > 0.5
-            if not np.any(ms):
-                continue
-            color = self.mask_colors.get(name, (1.0, 0.0, 0.0, 0.35))
-            overlay[ms, :3] = color[:3]
-            overlay[ms, 3] = np.maximum(overlay[ms, 3], color[3])
+            self.image_artist.set_data(rgba)
+        self.canvas.draw_idle()
 
-        if overlay[..., 3].sum() > 0:
-            self.ax.imshow(overlay, origin="lower", aspect="auto", interpolation="none")
+    def set_mask_color(self, name, rgba):
+        """Change one structure's overlay colour, only the LUT is touched."""
+        self.mask_colors[name] = rgba
+        self.compositor.set_color(name, rgba)
+        self.update_slice(self.slider.value())
 
-        self.ax.set_position([0, 0, 1, 1])
-        self.ax.axis("off")
-        self.canvas.draw_idle()
+
+def emit_result(signal):
+    """Future done callback that emits signal, unless its viewer was closed in the meantime."""
+    def emit(future):
+        try:
+            signal.emit(future)
+        except RuntimeError:
+            pass
+    return emit
+
+
+def load_full_level(scan_file, organ_files, label_table=None):
+    """The scan and segmentation at full resolution, decoding whatever cannot be read slice by slice."""
+    with tracing.span("load full level", cat="io", scan=scan_file):
+        registry = get_registry()
+        # Opening may write the chunk cache of the file first, a full decode
+        scan = registry.lazy(scan_file)
+        if not scan.random_access:
+            scan.full()
+        if isinstance(organ_files, str):
+            label_volume = LabelVolume.load(organ_files, lazy=True, table=label_table)
+            if not label_volume.labels.random_access:
+                label_volume.labels.full()
+            return {"volume": scan, "masks": {}, "labels": label_volume, "mask_indices": {}, "factor": 1}
+        # Masks are indexed up front anyway; small structures stay run-length encoded, the rest are shared bool arrays
+        masks = {organ: registry.compact_mask(path) for organ, path in organ_files.items()}
+        indices = {organ: registry.index(path) for organ, path in organ_files.items()}
+    return {"volume": scan, "masks": masks, "labels": None, "mask_indices": indices, "factor": 1}
+
+
+def coarse_level(scan_pyramid, seg_pyramids, label_volume=None):
+    """Coarsest cached pyramid level of the scan and segmentation, or None unless all are cached."""
+    factor, volume = scan_pyramid.coarsest()
+    if volume is None:
+        return None
+    masks = {}
+    labels = None
+    for organ, pyramid in seg_pyramids.items():
+        f, data = pyramid.coarsest()
+        if data is None or f != factor or data.shape != volume.shape:
+            return None
+        if organ is None:
+            lv = label_volume
+            labels = LabelVolume(data, level_affine(lv.affine, f), tuple(z * f for z in lv.zooms), lv.table, path=lv.path)
+        else:
+            masks[organ] = data
+    return {"volume": volume, "masks": masks, "labels": labels, "mask_indices": {}, "factor": factor}
+
+
+def load_coarse_level(scan_file, organ_files, label_table, scan_pyramid, seg_pyramids, label_volume):
+    """Decode a scan opened for the first time, cache its pyramids and return their coarsest level (or None)."""
+    build_pyramids(scan_pyramid, seg_pyramids, load_full_level(scan_file, organ_files, label_table))
+    return coarse_level(scan_pyramid, seg_pyramids, label_volume)
+
+
+def build_pyramids(scan_pyramid, seg_pyramids, level):
+    """Cache the pyramids of a full resolution level that are not cached yet."""
+    try:
+        if not scan_pyramid.complete():
+            scan_pyramid.build(level["volume"])
+        for organ, pyramid in seg_pyramids.items():
+            if not pyramid.complete():
+                pyramid.build(level["labels"].labels if organ is None else level["masks"][organ])
+    except Exception as e:
+        print(f"[warn] could not cache the pyramid of {scan_pyramid.path}: {e}")
 
 
 class SegmentationViewer(QtWidgets.QWidget):
-    def __init__(self, scan_file, organ_files, colors, opacities=None, meshes=None, mesh_properties=None, parent=None):
+    """
+    Axial, sagittal and coronal slices plus a 3D view of one model's
+    segmentation. When the scan was opened before, the views paint from its
+    cached coarsest pyramid level at once and switch to full resolution as
+    soon as that has been decoded in the background. The first time, they
+    start out blank while the background decode also caches the pyramid,
+    then show its coarsest level and then full resolution. Given remote (a
+    slice_server.RemoteSegmentation), slices and meshes come from a slice
+    server and scan_file and organ_files are not used. label_table
+    ({label: name}) names the structures of a packed label volume, by
+    default those of the table stored with it.
+    """
+    _coarse_level_loaded = QtCore.Signal(object)
+    _full_level_loaded = QtCore.Signal(object)
+    _meshes_built = QtCore.Signal(object)
+
+    def __init__(self, scan_file, organ_files, colors, opacities=None, meshes=None, mesh_properties=None, mesh_cache=None, parent=None, remote=None, label_table=None):
         super().__init__(parent)
+        stages = tracing.stages("SegmentationViewer.__init__")
+        if remote is not None:
+            self._init_remote(remote, colors, opacities, meshes, mesh_properties)
+            self._layout()
+            stages.done()
+            return
 
-        self.scan = nib.load(scan_file).get_fdata()
-        self.organs = {organ: nib.load(path).get_fdata() for organ, path in organ_files.items()}
+        # Only headers are read here: the full resolution volumes are opened by load_full_level,
+        # in the background whenever a cached pyramid level can be painted first
+        self.scan_file = scan_file
+        self.organ_files = organ_files
+        self.label_table = label_table
+        self.mesh_cache = mesh_cache
+        self.full_shape = tuple(nib.load(scan_file).shape[:3])
+        # organ_files is either {name: mask path} or the path of a packed label volume
+        if isinstance(organ_files, str):
+            self.label_volume = LabelVolume.load_header(organ_files, table=label_table)
+            organ_names = self.label_volume.names
+            self.seg_pyramids = {None: VolumePyramid(organ_files, "labels")}
+        else:
+            self.label_volume = None
+            organ_names = list(organ_files)
+            self.seg_pyramids = {organ: VolumePyramid(path, "mask") for organ, path in organ_files.items()}
+        self.scan_pyramid = VolumePyramid(scan_file, "image")
+        self._coarse_level_loaded.connect(self.on_coarse_level)
+        self._full_level_loaded.connect(self.on_full_level)
+        self._meshes_built.connect(self.on_meshes_built)
+        self.pending_meshes = {}
+        stages.mark("open volumes")
+
+        # Nothing is decoded on the GUI thread: without a cached level the views start out blank
+        self.coarse = coarse_level(self.scan_pyramid, self.seg_pyramids, self.label_volume)
+        level = self.coarse if self.coarse is not None else self.blank_level()
+        stages.mark("load level", factor=level["factor"], cached=self.coarse is not None)
+        self.organs = level["masks"]
+        self.mask_indices = level["mask_indices"]
 
         self.colors = {k: (v[0], v[1], v[2], 0.45) if len(v) == 3 else v for k, v in colors.items()}
-        self.opacities = opacities or {name: 0.5 for name in self.organs.keys()}
+        self.opacities = opacities or {name: 0.5 for name in organ_names}
 
         mask_colors = {}
-        for name in organ_files.keys():
+        for name in organ_names:
             if name in self.colors:
                 mask_colors[name] = self.colors[name]
             else:
@@ -125,46 +263,102 @@ class SegmentationViewer(QtWidgets.QWidget):
                 mask_colors[name] = found if found is not None else (1.0, 0.0, 0.0, 0.35)
 
         # Slice viewers with reduced width for axial/sagittal
-        self.axial_view = SliceViewer(self.scan, self.organs, mask_colors, orientation="axial")
-        self.sagittal_view = SliceViewer(self.scan, self.organs, mask_colors, orientation="sagittal")
-        self.coronal_view = SliceViewer(self.scan, self.organs, mask_colors, orientation="coronal")
+        self.axial_view = SliceViewer(level["volume"], level["masks"], mask_colors, orientation="axial", labels=level["labels"], mask_indices=level["mask_indices"], factor=level["factor"], full_shape=self.full_shape)
+        self.sagittal_view = SliceViewer(level["volume"], level["masks"], mask_colors, orientation="sagittal", labels=level["labels"], mask_indices=level["mask_indices"], factor=level["factor"], full_shape=self.full_shape)
+        self.coronal_view = SliceViewer(level["volume"], level["masks"], mask_colors, orientation="coronal", labels=level["labels"], mask_indices=level["mask_indices"], factor=level["factor"], full_shape=self.full_shape)
 
         self.axial_view.canvas.setMinimumSize(250, 180)     # narrower axial
         self.sagittal_view.canvas.setMinimumSize(250, 180)  # narrower sagittal
         self.coronal_view.setMaximumWidth(360)   # keep coronal bigger (ok already)
+        stages.mark("slice viewers")
 
-        # If meshes and mesh_properties are provided, use them for 3D view
-        if meshes is not None and mesh_properties is not None:
-            self.plotter = QtInteractor(self)
-            self.plotter.set_background("white")
-            self.plotter.interactor.setMinimumWidth(100)
-            self.actors = {}
-            for organ, mesh in meshes.items():
-                props = mesh_properties.get(organ, {})
-                color = props.get('color', self.colors.get(organ, (1.0, 0.5, 0.0, 0.5))[:3])
-                opacity = props.get('opacity', self.opacities.get(organ, 0.5))
-                actor = self.plotter.add_mesh(
-                    mesh, color=color, opacity=opacity, name=organ
-                )
-                self.actors[organ] = actor
+        self.plotter = QtInteractor(self)
+        self.plotter.set_background("white")
+        self.plotter.interactor.setMinimumWidth(100)
+        self.lod_switcher = LODSwitcher(self.plotter)
+        self.actors = {}
+        # Meshes handed over are shown as they are, the other structures are contoured here
+        lods = self.given_meshes(meshes, mesh_properties)
+        # Surfaces share the mesh builder's cache entries; missing ones are built in one pass
+        sources = {}
+        for organ in organ_names:
+            if organ in lods:
+                continue
+            if self.label_volume is not None:
+                sources[organ] = (self.label_volume.path, self.label_volume.ids[organ])
+            else:
+                sources[organ] = (organ_files[organ], None)
+        missing = {}
+        for organ, (source, label) in sources.items():
+            lod = mesh_cache.get_lod(source, label=label, **mesh_params()) if mesh_cache is not None else None
+            if lod is not None:
+                lods[organ] = lod
+            else:
+                missing[organ] = (source, label)
+        stages.mark("mesh cache", hits=len(sources) - len(missing), misses=len(missing))
+        # Coarse surfaces once a coarse level is there, the full ones follow with the full resolution level
+        if missing and self.coarse is not None:
+            lods.update(self.coarse_surfaces(self.coarse, missing))
+        self.pending_meshes = missing
+        stages.mark("coarse meshes")
+        self.add_meshes(lods, render=False)
+
+        stages.mark("3D view")
+        self._layout()
+
+        # Background jobs get plain data rather than the widget, so it is never released on a pool thread
+        if self.coarse is not None:
+            future = prefetch_executor().submit(load_full_level, scan_file, organ_files, label_table)
+            future.add_done_callback(emit_result(self._full_level_loaded))
         else:
-            self.plotter = QtInteractor(self)
-            self.plotter.set_background("white")
-            self.plotter.interactor.setMinimumWidth(100)
-            self.actors = {}
-            for organ, mask in self.organs.items():
-                try:
-                    mask_bool = (mask > 0.5).astype(np.uint8)
-                    grid = pv.wrap(mask_bool)
-                    surf = grid.contour([0.5])
-                    color = self.colors.get(organ, (1.0, 0.5, 0.0, 0.5))[:3]
-                    actor = self.plotter.add_mesh(
-                        surf, color=color, opacity=self.opacities.get(organ, 0.5), name=organ
-                    )
-                    self.actors[organ] = actor
-                except Exception as e:
-                    print(f"[warn] mesh failed for {organ}: {e}")
+            # First time this scan is opened: cache its pyramid, which also gives the coarse level to paint first
+            future = prefetch_executor().submit(load_coarse_level, scan_file, organ_files, label_table, self.scan_pyramid, self.seg_pyramids, self.label_volume)
+            future.add_done_callback(emit_result(self._coarse_level_loaded))
+        stages.mark("layout")
+        stages.done()
+
+    def _init_remote(self, remote, colors, opacities, meshes, mesh_properties):
+        """Slice views and 3D view fed by a slice server, nothing is read or meshed locally."""
+        self.remote = remote
+        self.scan_file = self.organ_files = self.label_table = self.mesh_cache = None
+        self.label_volume = self.coarse = None
+        self.organs, self.mask_indices, self.pending_meshes = {}, {}, {}
+        self._meshes_built.connect(self.on_meshes_built)
+        self.colors = {k: (v[0], v[1], v[2], 0.45) if len(v) == 3 else v for k, v in colors.items()}
+        self.opacities = opacities or {name: 0.5 for name in remote.entries}
+        mask_colors = {name: self.colors.get(name, (1.0, 0.0, 0.0, 0.35)) for name in remote.entries}
+        self.axial_view = SliceViewer(None, mask_colors=mask_colors, orientation="axial", remote=remote)
+        self.sagittal_view = SliceViewer(None, mask_colors=mask_colors, orientation="sagittal", remote=remote)
+        self.coronal_view = SliceViewer(None, mask_colors=mask_colors, orientation="coronal", remote=remote)
+        self.axial_view.canvas.setMinimumSize(250, 180)
+        self.sagittal_view.canvas.setMinimumSize(250, 180)
+        self.coronal_view.setMaximumWidth(360)
+        self.plotter = QtInteractor(self)
+        self.plotter.set_background("white")
+        self.plotter.interactor.setMinimumWidth(100)
+        self.lod_switcher = LODSwitcher(self.plotter)
+        self.actors = {}
+        lods = self.given_meshes(meshes, mesh_properties)
+        self.add_meshes(lods, render=False)
+        missing = [entry for entry in remote.entries if entry not in lods]
+        if missing:
+            future = prefetch_executor().submit(remote.meshes, missing)
+            future.add_done_callback(emit_result(self._meshes_built))
+
+    def given_meshes(self, meshes, mesh_properties):
+        """{organ: MeshLOD} of the meshes handed to the viewer, taking over their colour and opacity."""
+        lods = {}
+        mesh_properties = mesh_properties or {}
+        for organ, mesh in (meshes or {}).items():
+            props = mesh_properties.get(organ, {})
+            if "color" in props:
+                self.colors[organ] = (*props["color"][:3], 0.45)
+            if "opacity" in props:
+                self.opacities[organ] = props["opacity"]
+            lods[organ] = mesh if isinstance(mesh, MeshLOD) else MeshLOD([mesh], (1.0,))
+        return lods
 
+    def _layout(self):
         grid = QtWidgets.QGridLayout(self)
         grid.setSpacing(6)
         grid.setContentsMargins(6, 6, 6, 6)
@@ -182,6 +376,100 @@ class SegmentationViewer(QtWidgets.QWidget):
 
         self.setLayout(grid)
 
+    def blank_level(self):
+        """An empty level at the coarsest pyramid factor, shown until the scan has been decoded."""
+        factor = self.scan_pyramid.factors[-1]
+        blank = np.zeros(tuple(-(-n // factor) for n in self.full_shape), dtype=np.uint8)
+        labels = None
+        masks = {}
+        if self.label_volume is not None:
+            lv = self.label_volume
+            labels = LabelVolume(blank, level_affine(lv.affine, factor), tuple(z * factor for z in lv.zooms), lv.table, path=lv.path)
+        else:
+            # Every structure needs a mask, the overlay colours are set up from them
+            masks = dict.fromkeys(self.seg_pyramids, blank.view(bool))
+        return {"volume": blank, "masks": masks, "labels": labels, "mask_indices": {}, "factor": factor}
+
+    def on_coarse_level(self, future):
+        try:
+            level = future.result()
+        except Exception as e:
+            print(f"[warn] could not load {self.scan_file}: {e}")
+            return
+        if level is not None:
+            self.coarse = level
+            for view in (self.axial_view, self.sagittal_view, self.coronal_view):
+                view.set_level(**level)
+            if self.pending_meshes:
+                self.add_meshes(self.coarse_surfaces(level, self.pending_meshes))
+        # Already decoded, so this only gathers the shared full resolution volumes
+        future = prefetch_executor().submit(load_full_level, self.scan_file, self.organ_files, self.label_table)
+        future.add_done_callback(emit_result(self._full_level_loaded))
+
+    def on_full_level(self, future):
+        try:
+            level = future.result()
+        except Exception as e:
+            print(f"[warn] could not load {self.scan_file} at full resolution: {e}")
+            return
+        self.organs = level["masks"]
+        self.mask_indices = level["mask_indices"]
+        if level["labels"] is not None:
+            self.label_volume = level["labels"]
+        for view in (self.axial_view, self.sagittal_view, self.coronal_view):
+            view.set_level(**level)
+        if self.pending_meshes:
+            future = prefetch_executor().submit(build_lods, self.pending_meshes, self.mesh_cache)
+            future.add_done_callback(emit_result(self._meshes_built))
+            self.pending_meshes = {}
+
+    def coarse_surfaces(self, level, organs):
+        """Quick single-level surfaces of organs from a coarse pyramid level."""
+        try:
+            if level["labels"] is not None:
+                lv = level["labels"]
+                labels, ids, affine, zooms = lv.labels, {organ: lv.ids[organ] for organ in organs}, lv.affine, lv.zooms
+            else:
+                ids = {organ: i for i, organ in enumerate(organs, start=1)}
+                labels = np.zeros(level["volume"].shape, dtype=np.uint8 if len(ids) < 256 else np.uint16)
+                for organ, label_id in ids.items():
+                    labels[level["masks"][organ]] = label_id
+                path = organs[next(iter(organs))][0]
+                # The catalog has the header unless the file changed since it was read
+                header = get_catalog().header(os.path.abspath(path))
+                if header is None:
+                    img = nib.load(path)
+                    header = {"affine": img.affine, "spacing": img.header.get_zooms()[:3]}
+                affine = level_affine(header["affine"], level["factor"])
+                zooms = tuple(z * level["factor"] for z in header["spacing"])
+            surfaces = extract_surfaces(labels, ids, affine, zooms, preset="fast")
+        except Exception as e:
+            print(f"[warn] coarse mesh extraction failed: {e}")
+            return {}
+        return {organ: MeshLOD([mesh], (1.0,)) for organ, mesh in surfaces.items()}
+
+    def on_meshes_built(self, future):
+        try:
+            lods = future.result()
+        except Exception as e:
+            print(f"[warn] mesh extraction failed: {e}")
+            return
+        self.add_meshes(lods)
+
+    def add_meshes(self, lods, render=True):
+        """Show {organ: MeshLOD}, replacing the surfaces of organs that are already shown."""
+        for organ, lod in lods.items():
+            actor = self.actors.get(organ)
+            if actor is None:
+                color = self.colors.get(organ, (1.0, 0.5, 0.0, 0.5))[:3]
+                actor = self.plotter.add_mesh(lod.full, color=color, opacity=self.opacities.get(organ, 0.5), name=organ)
+                self.actors[organ] = actor
+            else:
+                actor.GetMapper().SetInputData(lod.full)
+            self.lod_switcher.add(organ, actor, lod)
+        if render:
+            self.plotter.render()
+
 
 if __name__ == "__main__":
     scan_file = "scan.nii.gz"
@@ -0,0 +1,216 @@
+import argparse
+import csv
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+import numpy as np
+import pyvista as pv
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from catalog import get_catalog
+from evaluate import MODEL_FOLDERS, ROOT
+from mesh_builder import load_lods
+from mesh_cache import CACHE_DIR, MeshCache
+from slice_overlay import ORIENTATION_AXES, OverlayCompositor, take_plane, to_display
+from volume_registry import get_registry
+
+SNAPSHOT_DIR = os.path.join(ROOT, "snapshots")
+DEFAULT_SCAN = os.path.join(ROOT, "scan.nii.gz")
+INDEX_COLUMNS = ["Model", "Patient_ID", "Organ", "Image", "Voxels", "Triangles", "Status"]
+SLICE_ORIENTATIONS = ("axial", "coronal", "sagittal")
+VIEW_SIZE = 480
+# Overlay opacity of the structure a sheet is about, and of everything around it
+FOCUS_ALPHA = 0.6
+CONTEXT_ALPHA = 0.2
+
+
+def structure_colors(names):
+    cmap = matplotlib.colormaps["tab20"]
+    return {name: cmap(i % 20)[:3] for i, name in enumerate(sorted(names))}
+
+
+def collect_cases(root, models, default_case=None, organs=None):
+    """{(model, case): {organ: mask path}} over the segmentation folders."""
+    catalog = get_catalog(root)
+    cases = {}
+    for model in models:
+        folder = os.path.join(root, MODEL_FOLDERS[model])
+        if not os.path.isdir(folder):
+            print(f"[warn] no segmentation folder for {model}: {folder}")
+            continue
+        catalog.refresh([folder], decode=False)
+        for case, organ, path in catalog.predictions(model, default_case):
+            if organs and organ not in organs:
+                continue
+            cases.setdefault((model, case), {})[organ] = path
+    return cases
+
+
+def scan_for(template, case):
+    """Scan of a case from a path template such as 'scans/{case}.nii.gz', or None."""
+    path = template.format(case=case)
+    return path if os.path.exists(path) else None
+
+
+def render_3d(plotter, actors, colors, organ, bounds):
+    """Screenshot with organ in colour and the rest of the case faded around it."""
+    for name, actor in actors.items():
+        prop = actor.GetProperty()
+        if name == organ:
+            prop.SetColor(colors[name])
+            prop.SetOpacity(1.0)
+        else:
+            prop.SetColor(0.75, 0.75, 0.75)
+            prop.SetOpacity(0.12)
+    plotter.view_isometric()
+    plotter.reset_camera(bounds=bounds)
+    return plotter.screenshot(None, return_img=True)
+
+
+def slice_images(scan, masks, indices, compositor, organ):
+    """Blended RGBA slices through the centre of organ's bounding box, per orientation."""
+    center = [(lo + hi) // 2 for lo, hi in indices[organ].bbox]
+    images = {}
+    for orientation in SLICE_ORIENTATIONS:
+        axis = ORIENTATION_AXES[orientation]
+        idx = center[axis]
+        mask_planes = {}
+        regions = {}
+        for name, mask in masks.items():
+            if indices[name].present(axis, idx):
+                mask_planes[name] = take_plane(mask, orientation, idx)
+                regions[name] = indices[name].plane_region(axis)
+        plane_shape = tuple(n for a, n in enumerate(masks[organ].shape) if a != axis)
+        img = take_plane(scan, orientation, idx) if scan is not None else np.zeros(plane_shape, dtype=np.float32)
+        label_plane = compositor.label_plane(mask_planes, plane_shape, regions)
+        images[orientation] = (idx, compositor.blend(to_display(img), to_display(label_plane)))
+    return images
+
+
+def render_case(model, case, masks, scan_path, out_dir, cache_dir=CACHE_DIR, size=VIEW_SIZE):
+    """
+    Worker entry point: one PNG sheet (3D view plus axial, coronal and
+    sagittal overlays) per structure of one model's segmentation of a case.
+    Returns the index rows.
+    """
+    registry = get_registry()
+    cache = MeshCache(cache_dir) if cache_dir else None
+    case_dir = os.path.join(out_dir, model, case)
+    os.makedirs(case_dir, exist_ok=True)
+    colors = structure_colors(masks)
+    indices = {organ: registry.index(path) for organ, path in masks.items()}
+    mask_arrays = {organ: registry.compact_mask(path) for organ, path in masks.items()}
+    scan = None
+    if scan_path is not None:
+        scan = registry.lazy(scan_path)
+        if scan.shape != next(iter(mask_arrays.values())).shape:
+            print(f"[warn] {scan_path} has shape {scan.shape}, the {model} masks of {case} do not match, drawing masks only")
+            scan = None
+    # Same mesh pipeline and cache entries as the OrgansViewer
+    present = {organ: (path, None) for organ, path in masks.items() if not indices[organ].empty}
+    lods = load_lods(present, cache)
+
+    plotter = pv.Plotter(off_screen=True, window_size=(size, size))
+    plotter.set_background("white")
+    actors = {organ: plotter.add_mesh(lod.full, name=organ, smooth_shading=True) for organ, lod in lods.items()}
+    compositor = OverlayCompositor.for_masks(list(masks), {name: (*c, CONTEXT_ALPHA) for name, c in colors.items()})
+
+    rows = []
+    for organ in sorted(masks):
+        row = {"Model": model, "Patient_ID": case, "Organ": organ, "Image": "", "Voxels": indices[organ].voxel_count, "Triangles": 0}
+        if organ not in lods:
+            rows.append({**row, "Status": "empty"})
+            continue
+        try:
+            row["Triangles"] = lods[organ].triangle_counts[0]
+            fig = Figure(figsize=(4 * size / 100, size / 100 + 0.6), dpi=100)
+            FigureCanvasAgg(fig)
+            axes = fig.subplots(1, 4)
+            axes[0].imshow(render_3d(plotter, actors, colors, organ, lods[organ].full.bounds))
+            axes[0].set_title("3D")
+            compositor.set_color(organ, (*colors[organ], FOCUS_ALPHA))
+            for ax, (orientation, (idx, rgba)) in zip(axes[1:], slice_images(scan, mask_arrays, indices, compositor, organ).items()):
+                ax.imshow(rgba, origin="lower", aspect="auto", interpolation="none")
+                ax.set_title(f"{orientation.capitalize()} {idx}")
+            compositor.set_color(organ, (*colors[organ], CONTEXT_ALPHA))
+            for ax in axes:
+                ax.axis("off")
+            fig.suptitle(f"{model}  case {case}  {organ}")
+            image = os.path.join(case_dir, f"{organ}.png")
+            fig.savefig(image)
+            rows.append({**row, "Image": os.path.relpath(image, out_dir), "Status": "ok"})
+        except Exception as e:
+            rows.append({**row, "Status": f"failed: {e}"})
+    plotter.close()
+    return rows
+
+
+def write_index(out_dir, rows):
+    """index.csv plus an index.html contact sheet of every snapshot."""
+    rows = sorted(rows, key=lambda r: (r["Organ"], r["Patient_ID"], r["Model"]))
+    with open(os.path.join(out_dir, "index.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    lines = ["<!DOCTYPE html>", "<meta charset='utf-8'><title>Segmentation snapshots</title>", "<table border='1' cellpadding='4'>",
+             "<tr>" + "".join(f"<th>{c}</th>" for c in INDEX_COLUMNS) + "</tr>"]
+    for row in rows:
+        cells = [html.escape(str(row[c])) for c in INDEX_COLUMNS]
+        if row["Image"]:
+            cells[INDEX_COLUMNS.index("Image")] = f"<a href='{html.escape(row['Image'])}'><img src='{html.escape(row['Image'])}' width='640'></a>"
+        lines.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+    lines.append("</table>")
+    with open(os.path.join(out_dir, "index.html"), "w") as f:
+        f.write("\n".join(lines))
+
+
+def snapshot_all(root, out_dir=SNAPSHOT_DIR, models=tuple(MODEL_FOLDERS), scan_template=DEFAULT_SCAN, default_case=None, organs=None, workers=None, cache_dir=CACHE_DIR, size=VIEW_SIZE):
+    cases = collect_cases(root, models, default_case, organs)
+    if not cases:
+        print("Nothing to render")
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_case, model, case, masks, scan_for(scan_template, case), out_dir, cache_dir, size): (model, case)
+            for (model, case), masks in cases.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            model, case = futures[future]
+            try:
+                case_rows = future.result()
+            except Exception as e:
+                print(f"[warn] {model} {case} failed: {e}")
+                continue
+            rows.extend(case_rows)
+            print(f"[{done}/{len(futures)}] {model} {case}: {sum(r['Status'] == 'ok' for r in case_rows)} sheets")
+    write_index(out_dir, rows)
+    elapsed = time.perf_counter() - start
+    sheets = sum(r["Status"] == "ok" for r in rows)
+    print(f"{sheets} sheets in {elapsed:.0f} s ({sheets * 3600 / max(elapsed, 1e-9):.0f}/h), index in {os.path.join(out_dir, 'index.html')}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render 3D and slice overlay snapshots of every segmented structure without a display")
+    parser.add_argument("--root", default=ROOT, help="folder holding the segmented_organs_by_* folders")
+    parser.add_argument("--out", default=SNAPSHOT_DIR, help="folder for the PNG sheets and index.csv / index.html")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FOLDERS), choices=list(MODEL_FOLDERS))
+    parser.add_argument("--case", help="case id for files without a case prefix, e.g. 0005")
+    parser.add_argument("--organs", nargs="+", help="only these structures, e.g. liver spleen")
+    parser.add_argument("--scan", default=DEFAULT_SCAN, help="CT of a case, may contain {case}; masks only when it is missing")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--size", type=int, default=VIEW_SIZE, help="pixel size of each panel")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the mesh cache")
+    args = parser.parse_args()
+    snapshot_all(args.root, args.out, args.models, args.scan, args.case, args.organs, args.workers, None if args.no_cache else CACHE_DIR, args.size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+
+from mask_index import MaskIndex
+
+# Masks filling less of their grid than this are kept run-length encoded
+SPARSE_DENSITY = float(os.environ.get("MIS_SPARSE_DENSITY", 0.05))
+
+
+class SparsePlane:
+    """
+    One decoded plane of a SparseMask: voxel positions (axial) or row runs
+    (sagittal/coronal), painted straight into a label buffer.
+    """
+    def __init__(self, shape, rows, starts, stops=None):
+        self.shape = shape
+        self.rows = rows
+        self.starts = starts
+        # Without stops, starts are column positions of single voxels
+        self.stops = stops
+
+    def paint(self, buffer, value):
+        """Write value wherever the plane is set; parts outside buffer are cut off, as for dense planes."""
+        h, w = buffer.shape
+        keep = self.rows < h
+        rows, starts = self.rows[keep], self.starts[keep]
+        if self.stops is None:
+            keep = starts < w
+            buffer[rows[keep], starts[keep]] = value
+            return
+        stops = np.minimum(self.stops[keep], w)
+        # Each run adds one at its start and removes it at its stop, the running sum marks the voxels inside
+        rows = rows.astype(np.intp) * (w + 1)
+        size = h * (w + 1)
+        edges = np.bincount(rows + np.minimum(starts, w), minlength=size) - np.bincount(rows + stops, minlength=size)
+        buffer[np.cumsum(edges.reshape(h, w + 1)[:, :w], axis=1) > 0] = value
+
+    def __array__(self, dtype=None, copy=None):
+        plane = np.zeros(self.shape, dtype=bool)
+        self.paint(plane, True)
+        return plane if dtype is None else plane.astype(dtype)
+
+
+class SparseMask:
+    """
+    Binary mask stored as runs along the last axis, one (x, y, start, stop)
+    per run sorted by x then y. A structure that fills a small part of the
+    grid takes kilobytes instead of one byte per voxel. Voxel count,
+    bounding box and occupied slices come from the runs, and single planes
+    decode without touching the rest of the volume.
+    """
+    def __init__(self, shape, x, y, start, stop):
+        self.shape = tuple(shape)
+        self.x, self.y, self.start, self.stop = x, y, start, stop
+        self.voxel_count = int(np.sum(stop.astype(np.int64) - start))
+
+    @classmethod
+    def from_mask(cls, mask):
+        mask = np.asarray(mask)
+        if mask.dtype != bool:
+            mask = mask > 0.5
+        index = MaskIndex.from_mask(mask)
+        coord = np.uint16 if max(mask.shape) < 2 ** 16 else np.uint32
+        if index.empty:
+            empty = np.zeros(0, dtype=coord)
+            return cls(mask.shape, empty, empty, empty, empty)
+        crop = index.crop()
+        ox, oy, oz = (s.start for s in crop)
+        # +1 where a run starts and -1 one past where it ends, along z
+        edges = np.diff(mask[crop].view(np.int8), axis=2, prepend=0, append=0)
+        sx, sy, sz = np.nonzero(edges == 1)
+        ez = np.nonzero(edges == -1)[2]
+        return cls(mask.shape, (sx + ox).astype(coord), (sy + oy).astype(coord), (sz + oz).astype(coord), (ez + oz).astype(coord))
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def dtype(self):
+        return np.dtype(bool)
+
+    @property
+    def runs(self):
+        return len(self.x)
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.start.nbytes + self.stop.nbytes
+
+    @property
+    def density(self):
+        return self.voxel_count / float(np.prod(self.shape))
+
+    def occupied(self, axis):
+        """Does slice i along axis contain the mask, for every i."""
+        occupied = np.zeros(self.shape[axis], dtype=bool)
+        if axis == 0:
+            occupied[self.x] = True
+        elif axis == 1:
+            occupied[self.y] = True
+        else:
+            depth = np.zeros(self.shape[2] + 1, dtype=np.int32)
+            np.add.at(depth, self.start, 1)
+            np.add.at(depth, self.stop, -1)
+            occupied[:] = np.cumsum(depth[:-1]) > 0
+        return occupied
+
+    def index(self):
+        """MaskIndex of the mask, built from the runs."""
+        return MaskIndex(self.shape, [self.occupied(axis) for axis in range(3)], self.voxel_count)
+
+    def plane(self, axis, idx):
+        """SparsePlane at idx along axis, oriented like mask[idx, :, :], mask[:, idx, :] or mask[:, :, idx]."""
+        if axis == 2:
+            hit = (self.start <= idx) & (self.stop > idx)
+            return SparsePlane(self.shape[:2], self.x[hit], self.y[hit])
+        if axis == 0:
+            # Runs are sorted by x, a plane along x is one contiguous block
+            lo, hi = np.searchsorted(self.x, [idx, idx + 1])
+            sel = slice(lo, hi)
+            return SparsePlane((self.shape[1], self.shape[2]), self.y[sel], self.start[sel], self.stop[sel])
+        hit = self.y == idx
+        return SparsePlane((self.shape[0], self.shape[2]), self.x[hit], self.start[hit], self.stop[hit])
+
+    def fill(self, volume, value):
+        """Write value into a full-size, C-contiguous volume wherever the mask is set."""
+        lengths = self.stop.astype(np.int64) - self.start
+        first = np.ravel_multi_index((self.x, self.y, self.start), self.shape)
+        # Flat index of every voxel: the run's first voxel plus its offset inside the run
+        offsets = np.arange(self.voxel_count) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        volume.reshape(-1)[np.repeat(first, lengths) + offsets] = value
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 3:
+            ints = [i for i, k in enumerate(key) if isinstance(k, (int, np.integer))]
+            if len(ints) == 1 and all(k == slice(None) for i, k in enumerate(key) if i != ints[0]):
+                idx = int(key[ints[0]])
+                if idx < 0:
+                    idx += self.shape[ints[0]]
+                return np.asarray(self.plane(ints[0], idx))
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        # Full decode, only for callers that need a dense volume
+        volume = np.zeros(self.shape, dtype=bool)
+        self.fill(volume, True)
+        return volume if dtype is None else volume.astype(dtype)
+
+
+def compact(mask, density=SPARSE_DENSITY):
+    """mask as a SparseMask when it fills less than density of its grid, else unchanged."""
+    mask = np.asarray(mask)
+    if mask.dtype != bool:
+        mask = mask > 0.5
+    if np.count_nonzero(mask) >= density * mask.size:
+        return mask
+    return SparseMask.from_mask(mask)
@@ -0,0 +1,127 @@
+import os
+
+import nibabel as nib
+import numpy as np
+import pyvista as pv
+
+from mask_index import MaskIndex
+from sparse_mask import SparseMask
+from volume_registry import get_registry
+
+# Quality presets: constrained SurfaceNets smoothing, plus a windowed-sinc
+# pass per structure for figures
+SURFACE_PRESETS = {
+    "fast": {"smoothing_iterations": 4, "smoothing_relaxation": 0.5, "sinc_iterations": 0},
+    "balanced": {"smoothing_iterations": 16, "smoothing_relaxation": 0.5, "sinc_iterations": 0},
+    "publication": {"smoothing_iterations": 32, "smoothing_relaxation": 0.5, "sinc_iterations": 20},
+}
+# Can be overridden with MIS_MESH_PRESET
+DEFAULT_PRESET = os.environ.get("MIS_MESH_PRESET", "balanced")
+
+
+def label_map(path, packed=False):
+    """
+    Label map of one source file cropped to its structures (plus a one
+    voxel border): a packed volume with all of its labels, or a mask file
+    as label 1. Returns (labels, crop, affine, zooms), labels None when the
+    file is empty.
+    """
+    registry = get_registry()
+    img = nib.load(path)
+    affine, zooms = img.affine, img.header.get_zooms()[:3]
+    if packed:
+        # Every label stays, so a structure's surface does not depend on which others were asked for
+        labels = registry.array(path)
+        index = MaskIndex.from_mask(labels > 0)
+        if index.empty:
+            return None, None, affine, zooms
+        crop = index.crop(margin=1)
+        return labels[crop], crop, affine, zooms
+    mask, index = registry.compact_mask(path), registry.index(path)
+    if index.empty:
+        return None, None, affine, zooms
+    crop = index.crop(margin=1)
+    if isinstance(mask, SparseMask):
+        labels = np.zeros(mask.shape, dtype=np.uint8)
+        mask.fill(labels, 1)
+        return labels[crop], crop, affine, zooms
+    return mask[crop].astype(np.uint8), crop, affine, zooms
+
+
+def extract_surfaces(labels, ids, affine, zooms, crop=None, preset=DEFAULT_PRESET):
+    """
+    Surfaces of every label in ids ({entry: label id}) from one SurfaceNets
+    pass over the label map, in the scanner coordinates given by affine.
+    Structures that touch share their common boundary, so there are no gaps
+    or overlaps between neighbours. Returns {entry: PolyData}; labels that
+    are absent from the map are left out.
+    """
+    settings = SURFACE_PRESETS[preset]
+    zooms = np.asarray(zooms, dtype=float)
+    start = np.array([s.start for s in crop]) if crop is not None else np.zeros(3)
+    grid = pv.ImageData(dimensions=labels.shape, spacing=zooms, origin=start * zooms)
+    grid.point_data["labels"] = labels.ravel(order="F")
+    surface = grid.contour_labels(
+        "all",
+        output_mesh_type="triangles",
+        scalars="labels",
+        simplify_output=False,
+        smoothing=settings["smoothing_iterations"] > 0,
+        smoothing_iterations=settings["smoothing_iterations"],
+        smoothing_relaxation=settings["smoothing_relaxation"],
+    )
+    if surface.n_cells == 0:
+        return {}
+    # Back to voxel indices, then through the full affine so rotations and flips are kept
+    ijk = np.asarray(surface.points) / zooms
+    points = (ijk @ affine[:3, :3].T + affine[:3, 3]).astype(np.float32)
+    triangles = surface.faces.reshape(-1, 4)[:, 1:]
+    sides = np.asarray(surface.cell_data["boundary_labels"]).astype(np.int64)
+    # Every triangle belongs to the label on either side of it (not the background).
+    # Faces point from the first label towards the second, flip them for the second
+    # label so each structure's surface faces outward.
+    outward_flip = np.linalg.det(affine[:3, :3]) < 0
+    cell = np.concatenate([np.arange(len(sides)), np.arange(len(sides))])
+    owner = np.concatenate([sides[:, 0], sides[:, 1]])
+    flip = np.concatenate([np.zeros(len(sides), bool), np.ones(len(sides), bool)]) ^ outward_flip
+    keep = owner != 0
+    cell, owner, flip = cell[keep], owner[keep], flip[keep]
+    order = np.argsort(owner, kind="stable")
+    cell, owner, flip = cell[order], owner[order], flip[order]
+    found, starts = np.unique(owner, return_index=True)
+    groups = dict(zip(found.tolist(), np.split(np.arange(len(owner)), starts[1:])))
+    surfaces = {}
+    for entry, label_id in ids.items():
+        group = groups.get(label_id)
+        if group is None:
+            continue
+        tris = triangles[cell[group]].copy()
+        tris[flip[group]] = tris[flip[group]][:, ::-1]
+        used, local = np.unique(tris, return_inverse=True)
+        faces = np.column_stack([np.full(len(tris), 3), local.reshape(-1, 3)]).ravel()
+        mesh = pv.PolyData(points[used], faces)
+        if settings["sinc_iterations"]:
+            mesh = mesh.smooth_taubin(n_iter=settings["sinc_iterations"], pass_band=0.1)
+        surfaces[entry] = mesh
+    return surfaces
+
+
+def build_surfaces(sources, preset=DEFAULT_PRESET):
+    """
+    Surfaces of mesh sources {entry: (path, label)}, one pass per file: all
+    structures of a packed volume together, each mask file on its own. A
+    surface thus only depends on its own file, whatever is meshed along
+    with it, as the per-file mesh cache key assumes.
+    """
+    files = {}
+    for entry, (path, label) in sources.items():
+        files.setdefault(path, {})[entry] = label
+    surfaces = {}
+    for path, entries in files.items():
+        packed = any(label is not None for label in entries.values())
+        labels, crop, affine, zooms = label_map(path, packed)
+        if labels is None:
+            continue
+        ids = {entry: label if packed else 1 for entry, label in entries.items()}
+        surfaces.update(extract_surfaces(labels, ids, affine, zooms, crop, preset))
+    return surfaces
@@ -0,0 +1,53 @@
+import numpy as np
+from scipy import ndimage
+
+from mask_index import MaskIndex
+
+SURFACE_COLUMNS = ["HD95", "ASSD", "Surface_Dice"]
+# Tolerance in mm for surface Dice
+SURFACE_TOLERANCE = 2.0
+
+
+def union_crop(pred_index, gt_index, margin=1):
+    """Slices covering both masks' bounding boxes plus margin voxels."""
+    boxes = [index.crop(margin) for index in (pred_index, gt_index) if not index.empty]
+    return tuple(slice(min(b[a].start for b in boxes), max(b[a].stop for b in boxes)) for a in range(3))
+
+
+def boundary(mask):
+    """Voxels of mask that touch the background (6-connectivity)."""
+    if not mask.any():
+        return mask
+    return mask & ~ndimage.binary_erosion(mask, structure=ndimage.generate_binary_structure(3, 1), border_value=0)
+
+
+def surface_distances(pred, gt, spacing):
+    """
+    Distances (mm) from every pred boundary voxel to the gt boundary and
+    back. The distance transforms only run over the union bounding box,
+    which holds every boundary voxel, so the result is exact.
+    """
+    crop = union_crop(MaskIndex.from_mask(pred), MaskIndex.from_mask(gt))
+    # Pad by one voxel so masks touching the crop edge still get a closed boundary
+    pred = np.pad(pred[crop], 1)
+    gt = np.pad(gt[crop], 1)
+    pred_border = boundary(pred)
+    gt_border = boundary(gt)
+    dist_to_gt = ndimage.distance_transform_edt(~gt_border, sampling=spacing)
+    dist_to_pred = ndimage.distance_transform_edt(~pred_border, sampling=spacing)
+    return dist_to_gt[pred_border], dist_to_pred[gt_border]
+
+
+def surface_metrics(pred, gt, spacing, tolerance=SURFACE_TOLERANCE):
+    """HD95, ASSD (mm) and surface Dice at tolerance mm; NaN when either mask is empty."""
+    if pred.shape != gt.shape:
+        raise ValueError(f"shape mismatch {pred.shape} vs {gt.shape}")
+    if not pred.any() or not gt.any():
+        return {"HD95": float("nan"), "ASSD": float("nan"), "Surface_Dice": float("nan")}
+    pred_to_gt, gt_to_pred = surface_distances(pred, gt, tuple(float(s) for s in spacing))
+    n = len(pred_to_gt) + len(gt_to_pred)
+    return {
+        "HD95": float(max(np.percentile(pred_to_gt, 95), np.percentile(gt_to_pred, 95))),
+        "ASSD": float((pred_to_gt.sum() + gt_to_pred.sum()) / n),
+        "Surface_Dice": float((np.count_nonzero(pred_to_gt <= tolerance) + np.count_nonzero(gt_to_pred <= tolerance)) / n),
+    }
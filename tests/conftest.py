@@ -0,0 +1,33 @@
+import os
+import sys
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def ellipsoid(shape, center, radii):
+    coords = np.ogrid[tuple(slice(0, n) for n in shape)]
+    return sum(((x - c) / r) ** 2 for x, c, r in zip(coords, center, radii)) <= 1.0
+
+
+@pytest.fixture
+def write_mask(tmp_path):
+    """Writes a bool or label volume as NIfTI under tmp_path and returns its path."""
+    def write(relpath, data, zooms=(0.8, 0.8, 2.0)):
+        path = tmp_path / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        nib.save(nib.Nifti1Image(np.asarray(data).astype(np.uint8), np.diag([*zooms, 1.0])), str(path))
+        return str(path)
+    return write
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    """Volumes are shared process-wide, keep tests from seeing each other's files."""
+    from volume_registry import get_registry
+    get_registry().clear()
+    yield
+    get_registry().clear()
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from catalog import Catalog
+from conftest import ellipsoid
+from label_volume import PACKED_SUFFIX, LabelVolume, pack_masks
+
+SHAPE = (32, 32, 16)
+
+
+def write_packed(write_mask, folder, names):
+    masks = {
+        name: write_mask(f"masks/{folder}/{name}.nii.gz", ellipsoid(SHAPE, (8 + 6 * i, 16, 8), (4, 4, 3)))
+        for i, name in enumerate(names)
+    }
+    out = masks[names[0]].replace(f"masks/{folder}/{names[0]}.nii.gz", f"{folder}/labels{PACKED_SUFFIX}")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    return pack_masks(masks, out)
+
+
+def test_summary_counts_packed_file_once(write_mask, tmp_path):
+    write_packed(write_mask, "liver/Packed", ["liver", "spleen", "gall_bladder"])
+    write_mask("liver/Masks/liver.nii.gz", ellipsoid(SHAPE, (16, 16, 8), (6, 6, 4)))
+    write_mask("liver/Masks/spleen.nii.gz", ellipsoid(SHAPE, (24, 16, 8), (4, 4, 3)))
+    catalog = Catalog(str(tmp_path))
+    catalog.refresh(decode=True)
+    summary = {row["model"]: dict(row) for row in catalog.summary()}
+    assert summary["Packed"]["files"] == 1
+    assert summary["Packed"]["structures"] == 3
+    assert summary["Packed"]["indexed"] == 1
+    assert summary["Masks"]["files"] == 2
+    assert summary["Masks"]["structures"] == 2
+    assert summary["Masks"]["indexed"] == 2
+    catalog.close()
+
+
+def test_packed_labels_named_by_catalog_entry(write_mask, tmp_path):
+    path = write_packed(write_mask, "liver/Packed", ["Liver", "Gall Bladder"])
+    catalog = Catalog(str(tmp_path))
+    catalog.refresh(decode=False)
+    sources = catalog.sources("liver", "Packed")
+    assert set(sources) == {"liver", "gallbladder"}
+    volume = LabelVolume.load(path, table={label: entry for entry, (_, label) in sources.items()})
+    assert sorted(volume.names) == ["gallbladder", "liver"]
+    assert volume.mask("gallbladder").sum() == (np.asarray(volume.labels) == sources["gallbladder"][1]).sum() > 0
+    catalog.close()
+
+
+def test_refresh_rereads_changed_files_only(write_mask, tmp_path):
+    liver = write_mask("liver/Masks/liver.nii.gz", ellipsoid(SHAPE, (16, 16, 8), (6, 6, 4)))
+    spleen = write_mask("liver/Masks/spleen.nii.gz", ellipsoid(SHAPE, (24, 16, 8), (4, 4, 3)))
+    catalog = Catalog(str(tmp_path))
+    assert catalog.refresh(decode=False) == 2
+    assert catalog.structure(liver)["voxel_count"] is None
+    # Decoding later only fills in what the header pass left out
+    assert catalog.refresh() == 2
+    assert catalog.refresh() == 0
+    before = catalog.structure(liver)["voxel_count"]
+
+    st = os.stat(liver)
+    write_mask("liver/Masks/liver.nii.gz", ellipsoid(SHAPE, (16, 16, 8), (8, 8, 5)))
+    os.utime(liver, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert catalog.refresh() == 1
+    after = catalog.structure(liver)
+    assert after["voxel_count"] == ellipsoid(SHAPE, (16, 16, 8), (8, 8, 5)).sum() > before
+    assert after["bbox"] == [[8, 25], [8, 25], [3, 14]]
+
+    os.remove(spleen)
+    assert catalog.refresh() == 0
+    assert set(catalog.sources("liver", "Masks")) == {"liver.nii.gz"}
+    assert catalog.structure(spleen) is None
+    catalog.close()
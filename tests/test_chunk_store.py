@@ -0,0 +1,59 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from chunk_store import CODECS, ChunkedVolume, write_chunked
+from volume_registry import VolumeRegistry
+
+SHAPE = (40, 36, 20)
+
+
+def sample_volume():
+    rng = np.random.default_rng(0)
+    data = np.zeros(SHAPE, dtype=np.int16)
+    # A smooth block compresses, a noisy one is stored raw, the rest stays all zero and is not stored
+    data[:20, :20, :10] = np.arange(20 * 20 * 10, dtype=np.int16).reshape(20, 20, 10) % 300 - 100
+    data[24:, 20:, 12:] = rng.integers(-1000, 1000, size=(16, 16, 8), dtype=np.int16)
+    return data
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lz4", "zstd"])
+def test_round_trip(codec, tmp_path):
+    if codec not in CODECS:
+        pytest.skip(f"{codec} is not installed")
+    data = sample_volume()
+    path = write_chunked(data, str(tmp_path / "volume.chunks"), np.eye(4), nib.Nifti1Header(), chunk_size=8, codec=codec)
+    volume = ChunkedVolume(path)
+    assert volume.shape == SHAPE and volume.dtype == data.dtype
+    assert np.array_equal(volume[:, :, 5], data[:, :, 5])
+    assert np.array_equal(volume[30, :, :], data[30, :, :])
+    assert np.array_equal(volume[3:29, 7:31, 9:15], data[3:29, 7:31, 9:15])
+    assert np.array_equal(np.asarray(volume), data)
+    assert np.array_equal(volume.full(), data)
+    volume.close()
+
+
+def test_close_releases_file_until_next_read(tmp_path):
+    data = sample_volume()
+    path = write_chunked(data, str(tmp_path / "volume.chunks"), np.eye(4), nib.Nifti1Header(), chunk_size=8, codec="zlib")
+    volume = ChunkedVolume(path)
+    assert np.array_equal(volume[:, 25, :], data[:, 25, :])
+    volume.close()
+    assert volume.file is None and volume.cached_bytes == 0
+    assert np.array_equal(volume[:, 25, :], data[:, 25, :])
+    volume.close()
+
+
+def test_registry_closes_evicted_volumes(tmp_path, monkeypatch):
+    data = sample_volume()
+    paths = [write_chunked(data, str(tmp_path / f"{name}.chunks"), np.eye(4), nib.Nifti1Header(), chunk_size=8) for name in "ab"]
+    monkeypatch.setattr("volume_registry.open_chunked", ChunkedVolume)
+    # The first axial plane touches nine stored 8^3 int16 chunks, two volumes of those do not fit
+    registry = VolumeRegistry(budget_bytes=12 * 8 ** 3 * 2)
+    a, b = (registry.lazy(path) for path in paths)
+    a[:, :, 0]
+    b[:, :, 0]
+    assert registry.evictions == 1
+    assert a.file is None and b.file is not None
+    registry.clear()
+    assert b.file is None
@@ -0,0 +1,65 @@
+import csv
+
+import pytest
+
+from conftest import ellipsoid
+from evaluate import BASE_COLUMNS, COLUMNS, append_rows, evaluate, read_rows
+from surface_metrics import SURFACE_COLUMNS
+
+SHAPE = (32, 32, 16)
+
+
+@pytest.fixture
+def dataset(write_mask, tmp_path):
+    for case, shift in (("0005", 0), ("0006", 2)):
+        write_mask(f"gt/{case}/liver.nii.gz", ellipsoid(SHAPE, (16, 16, 8), (8, 7, 5)))
+        write_mask(f"gt/{case}/spleen.nii.gz", ellipsoid(SHAPE, (24, 16, 8), (4, 4, 3)))
+        write_mask(f"segmented_organs_by_ts/img{case}.nii.gz_liver.nii.gz", ellipsoid(SHAPE, (16 + shift, 16, 8), (8, 7, 5)))
+        write_mask(f"segmented_organs_by_ts/img{case}.nii.gz_spleen.nii.gz", ellipsoid(SHAPE, (24, 16 + shift, 8), (4, 4, 3)))
+    return str(tmp_path), str(tmp_path / "gt"), str(tmp_path / "evaluation.csv")
+
+
+def rows_by_key(csv_path):
+    rows, header = read_rows(csv_path)
+    keys = [(row["Model"], row["Patient_ID"], row["Organ"]) for row in rows]
+    assert len(keys) == len(set(keys)), "one row per model, case and organ"
+    return {key: row for key, row in zip(keys, rows)}, header
+
+
+def test_resumes_from_existing_rows(dataset):
+    root, gt, out = dataset
+    assert evaluate(root, gt, out, models=("ts",), workers=1) == 4
+    rows, header = rows_by_key(out)
+    assert header == COLUMNS
+    assert float(rows["ts", "0005", "liver"]["Dice"]) == 1.0
+    assert float(rows["ts", "0006", "liver"]["Dice"]) < 1.0
+    assert evaluate(root, gt, out, models=("ts",), workers=1) == 0
+    # A run interrupted before its last row picks up only that one
+    with open(out, newline="") as f:
+        lines = f.readlines()
+    with open(out, "w", newline="") as f:
+        f.writelines(lines[:-1])
+    assert evaluate(root, gt, out, models=("ts",), workers=1) == 1
+    assert rows_by_key(out)[0] == rows
+
+
+def test_fills_in_missing_surface_metrics(dataset):
+    root, gt, out = dataset
+    assert evaluate(root, gt, out, models=("ts",), workers=1, surface=False) == 4
+    assert rows_by_key(out)[1] == BASE_COLUMNS
+    # Every row is scored again for the new columns and the older copies are dropped
+    assert evaluate(root, gt, out, models=("ts",), workers=1) == 4
+    rows, header = rows_by_key(out)
+    assert header == COLUMNS
+    assert len(rows) == 4
+    assert all(row[c] != "" for row in rows.values() for c in SURFACE_COLUMNS)
+
+
+def test_append_replaces_rows_of_the_same_structure(tmp_path):
+    out = str(tmp_path / "evaluation.csv")
+    append_rows(out, [{"Model": "ts", "Patient_ID": "0005", "Organ": "liver", "Dice": 0.5}], surface=False)
+    append_rows(out, [{"Model": "ts", "Patient_ID": "img0005", "Organ": "liver", "Dice": 0.75},
+                      {"Model": "ts", "Patient_ID": "0005", "Organ": "spleen", "Dice": 0.25}], surface=False)
+    with open(out, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["Organ"], row["Dice"]) for row in rows] == [("liver", "0.75"), ("spleen", "0.25")]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from conftest import ellipsoid
+from label_volume import LabelVolume, PACKED_SUFFIX, case_id, pack_masks, read_label_table, structure_name
+
+SHAPE = (32, 32, 16)
+
+
+def test_structure_names_and_cases():
+    assert structure_name("/data/liver.nii.gz") == "liver"
+    assert structure_name("img0005.nii.gz_gall_bladder.nii.gz") == "gall_bladder"
+    assert structure_name("spleen.nii") == "spleen"
+    assert case_id("img0005.nii.gz_liver.nii.gz") == "img0005"
+    assert case_id("liver.nii.gz") is None
+
+
+def test_pack_round_trip(write_mask, tmp_path):
+    liver = ellipsoid(SHAPE, (14, 16, 8), (7, 7, 4))
+    # Overlaps the liver, the later mask wins there
+    spleen = ellipsoid(SHAPE, (20, 16, 8), (4, 4, 3))
+    masks = {"liver": write_mask("liver.nii.gz", liver), "spleen": write_mask("spleen.nii.gz", spleen)}
+    out = pack_masks(masks, str(tmp_path / f"case{PACKED_SUFFIX}"))
+    assert read_label_table(out) == {1: "liver", 2: "spleen"}
+    volume = LabelVolume.load(out)
+    assert volume.labels.dtype == np.uint8
+    assert volume.names == ["liver", "spleen"]
+    assert np.array_equal(volume.mask("spleen"), spleen)
+    assert np.array_equal(volume.mask("liver"), liver & ~spleen)
+    header = LabelVolume.load_header(out)
+    assert header.labels is None and header.ids == volume.ids
+    assert np.allclose(header.affine, volume.affine)
+
+
+def test_pack_rejects_other_grids(write_mask, tmp_path):
+    masks = {
+        "liver": write_mask("liver.nii.gz", ellipsoid(SHAPE, (14, 16, 8), (7, 7, 4))),
+        "spleen": write_mask("spleen.nii.gz", np.ones((8, 8, 8))),
+    }
+    with pytest.raises(ValueError):
+        pack_masks(masks, str(tmp_path / f"case{PACKED_SUFFIX}"))
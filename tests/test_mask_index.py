@@ -0,0 +1,24 @@
+import numpy as np
+
+from mask_index import MaskIndex
+
+SHAPE = (20, 16, 12)
+
+
+def test_extent_and_count():
+    mask = np.zeros(SHAPE, dtype=bool)
+    mask[3:7, 5:9, 2:4] = True
+    mask[10, 0, 11] = True
+    index = MaskIndex.from_mask(mask)
+    assert index.voxel_count == mask.sum()
+    assert index.bbox == ((3, 11), (0, 9), (2, 12))
+    assert list(index.occupied_slices(2)) == [2, 3, 11]
+    assert index.present(0, 10) and not index.present(0, 8) and not index.present(0, 99)
+    assert index.crop(margin=2) == (slice(1, 13), slice(0, 11), slice(0, 12))
+    assert index.plane_region(1) == (slice(3, 11), slice(2, 12))
+
+
+def test_empty_mask():
+    index = MaskIndex.from_mask(np.zeros(SHAPE, dtype=np.uint8))
+    assert index.empty and index.voxel_count == 0
+    assert not any(index.present(axis, 0) for axis in range(3))
@@ -0,0 +1,23 @@
+import mesh_cache
+import surface_builder
+from conftest import ellipsoid
+from mesh_builder import mesh_params
+from mesh_cache import MeshCache
+
+SHAPE = (32, 32, 16)
+
+
+def test_key_covers_every_geometry_input(write_mask, tmp_path, monkeypatch):
+    path = write_mask("kidney.nii.gz", ellipsoid(SHAPE, (16, 16, 8), (8, 7, 5)))
+    cache = MeshCache(str(tmp_path / "cache"))
+    key = cache.key(path, label=None, lod=1.0, **mesh_params("fast"))
+    assert key == cache.key(path, label=None, lod=1.0, **mesh_params("fast"))
+    assert key != cache.key(path, label=1, lod=1.0, **mesh_params("fast"))
+    assert key != cache.key(path, label=None, lod=0.25, **mesh_params("fast"))
+    assert key != cache.key(path, label=None, lod=1.0, **mesh_params("balanced"))
+    # Retuning a preset, or a new key version, does not reuse old entries
+    monkeypatch.setitem(surface_builder.SURFACE_PRESETS, "fast", {**surface_builder.SURFACE_PRESETS["fast"], "smoothing_iterations": 5})
+    assert key != cache.key(path, label=None, lod=1.0, **mesh_params("fast"))
+    monkeypatch.undo()
+    monkeypatch.setattr(mesh_cache, "KEY_VERSION", mesh_cache.KEY_VERSION + 1)
+    assert key != cache.key(path, label=None, lod=1.0, **mesh_params("fast"))
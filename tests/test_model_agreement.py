@@ -0,0 +1,40 @@
+import nibabel as nib
+import numpy as np
+
+import model_agreement
+from catalog import Catalog
+from conftest import ellipsoid
+from label_volume import PACKED_SUFFIX, read_label_table
+from model_agreement import AGREEMENT_LEVELS, agreement_masks, build_agreement, level_of
+from packed_mask import PackedMask
+
+SHAPE = (32, 32, 16)
+# Three models, each a slightly shifted liver
+CENTERS = [(14, 16, 8), (16, 16, 8), (18, 16, 8)]
+
+
+def test_levels_split_the_union():
+    masks = [ellipsoid(SHAPE, center, (8, 8, 5)) for center in CENTERS]
+    counts = sum(mask.astype(int) for mask in masks)
+    levels = agreement_masks(PackedMask.from_mask(mask) for mask in masks)
+    assert np.array_equal(levels["all models"].unpack(), counts == 3)
+    assert np.array_equal(levels["majority"].unpack(), counts == 2)
+    assert np.array_equal(levels["minority"].unpack(), counts == 1)
+
+
+def test_agreement_volume_labels(write_mask, tmp_path, monkeypatch):
+    monkeypatch.setattr(model_agreement, "get_catalog", lambda: Catalog(str(tmp_path)))
+    masks = [ellipsoid(SHAPE, center, (8, 8, 5)) for center in CENTERS]
+    structures = {"liver": {f"Model {i}": (write_mask(f"m{i}/liver.nii.gz", mask), None) for i, mask in enumerate(masks)}}
+    # A model on another grid is left out rather than breaking the volume
+    structures["liver"]["Other grid"] = (write_mask("other/liver.nii.gz", np.ones((8, 8, 8))), None)
+    out = str(tmp_path / f"liver{PACKED_SUFFIX}")
+    table = build_agreement(structures, out)
+    assert table == read_label_table(out)
+    assert [level_of(name) for name in table.values()] == list(AGREEMENT_LEVELS)
+    ids = {level_of(name): label for label, name in table.items()}
+    labels = np.asarray(nib.load(out).dataobj)
+    counts = sum(mask.astype(int) for mask in masks)
+    assert np.array_equal(labels == ids["all models"], counts == 3)
+    assert np.array_equal(labels == ids["minority"], counts == 1)
+    assert np.array_equal(labels == 0, counts == 0)
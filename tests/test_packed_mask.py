@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from packed_mask import PackedMask, _BYTE_COUNTS, at_least, majority, overlap, popcount, vote_counts
+
+# Not a multiple of 64 voxels, so the padding bits of the last word matter
+SHAPE = (13, 11, 7)
+
+
+def random_masks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.random(SHAPE) < p for p in np.linspace(0.2, 0.7, n)]
+
+
+def test_popcount_matches_numpy():
+    for mask in random_masks(3):
+        packed = PackedMask.from_mask(mask)
+        assert packed.voxel_count == popcount(packed.words) == mask.sum()
+        assert int(_BYTE_COUNTS[packed.words.view(np.uint8)].sum()) == mask.sum()
+        assert np.array_equal(packed.unpack(), mask)
+
+
+def test_invert_keeps_padding_clear():
+    mask = random_masks(1)[0]
+    inverted = ~PackedMask.from_mask(mask)
+    assert inverted.voxel_count == (~mask).sum()
+    assert np.array_equal(inverted.unpack(), ~mask)
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 8])
+def test_vote_counts_match_numpy(n):
+    masks = random_masks(n, seed=n)
+    packed = [PackedMask.from_mask(mask) for mask in masks]
+    counts = sum(mask.astype(np.int64) for mask in masks)
+    planes = vote_counts(packed)
+    bits = [PackedMask(SHAPE, plane).unpack() for plane in planes]
+    assert np.array_equal(sum(b.astype(np.int64) << i for i, b in enumerate(bits)), counts)
+    for k in range(n + 2):
+        assert np.array_equal(at_least(packed, k).unpack(), counts >= k), k
+    assert np.array_equal(majority(packed).unpack(), counts > n // 2)
+
+
+def test_overlap_matches_numpy():
+    a, b = random_masks(2)
+    metrics = overlap(PackedMask.from_mask(a), PackedMask.from_mask(b))
+    intersection = (a & b).sum()
+    assert metrics["Intersection"] == intersection
+    assert metrics["Dice"] == pytest.approx(2 * intersection / (a.sum() + b.sum()))
+    assert metrics["IoU"] == pytest.approx(intersection / (a | b).sum())
+    with pytest.raises(ValueError):
+        overlap(PackedMask.from_mask(a), PackedMask.from_mask(a[:-1]))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from conftest import ellipsoid
+from label_volume import LabelVolume
+from mask_index import MaskIndex
+from slice_overlay import OverlayCompositor, level_planes
+from sparse_mask import SparseMask
+
+SHAPE = (24, 20, 12)
+COLORS = {"liver": (0.0, 1.0, 0.0, 0.5), "spleen": (0.0, 0.0, 1.0, 0.5)}
+
+
+def sample():
+    image = np.arange(np.prod(SHAPE), dtype=np.int16).reshape(SHAPE) % 97
+    liver = ellipsoid(SHAPE, (10, 10, 6), (6, 5, 4))
+    spleen = ellipsoid(SHAPE, (15, 10, 6), (4, 4, 3))
+    return image, {"liver": liver, "spleen": spleen}
+
+
+@pytest.mark.parametrize("orientation", ["axial", "sagittal", "coronal"])
+def test_masks_sparse_masks_and_labels_agree(orientation):
+    image, masks = sample()
+    compositor = OverlayCompositor.for_masks(list(masks), COLORS)
+    labels = np.zeros(SHAPE, dtype=np.uint8)
+    for name, mask in masks.items():
+        labels[mask] = compositor.ids[name]
+    label_volume = LabelVolume(labels, np.eye(4), (1, 1, 1), compositor.table)
+    indices = {name: MaskIndex.from_mask(mask) for name, mask in masks.items()}
+    sparse = {name: SparseMask.from_mask(mask) for name, mask in masks.items()}
+    for idx in range(0, SHAPE[{"axial": 2, "sagittal": 0, "coronal": 1}[orientation]], 3):
+        dense_img, dense = level_planes((image, masks, None, indices, 1), orientation, idx, compositor)
+        _, from_sparse = level_planes((image, sparse, None, {}, 1), orientation, idx, compositor)
+        _, from_labels = level_planes((image, {}, label_volume, {}, 1), orientation, idx, compositor)
+        assert np.array_equal(dense, from_sparse)
+        assert np.array_equal(dense, from_labels)
+        assert dense_img.shape == dense.shape
+
+
+def test_blend_matches_float_alpha_blend():
+    image, masks = sample()
+    compositor = OverlayCompositor.for_masks(list(masks), COLORS)
+    img = image[:, :, 6].astype(np.float32)
+    label_plane = compositor.label_plane({name: mask[:, :, 6] for name, mask in masks.items()}, img.shape)
+    rgba = compositor.blend(img, label_plane)
+    gray = np.floor((img - img.min()) * 255.0 / (img.max() - img.min()))
+    color = compositor.lut[label_plane].astype(np.float32)
+    alpha = color[..., 3:] / 255.0
+    expected = gray[..., None] * (1 - alpha) + color[..., :3] * alpha
+    assert np.abs(rgba[..., :3].astype(np.float32) - expected).max() <= 1.0
+    assert (rgba[..., 3] == 255).all()
+
+
+def test_set_color_only_touches_its_label():
+    compositor = OverlayCompositor.for_masks(["liver", "spleen"], COLORS)
+    before = compositor.blend_lut().copy()
+    compositor.set_color("spleen", (1.0, 0.0, 0.0, 1.0))
+    after = compositor.blend_lut()
+    spleen = compositor.ids["spleen"]
+    assert np.array_equal(np.delete(after, spleen, axis=0), np.delete(before, spleen, axis=0))
+    assert (after[spleen, :, :3] == (255, 0, 0)).all()
+    compositor.set_color("unknown", (1.0, 1.0, 1.0))
@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from slice_prefetch import SlicePrefetcher
+
+
+class InlineExecutor:
+    """Runs every job at submit time, so the buffer contents are deterministic."""
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def recording_prefetcher(max_idx=40, **kwargs):
+    produced = []
+
+    def produce(idx):
+        produced.append(idx)
+        return f"slice {idx}"
+
+    return SlicePrefetcher(produce, max_idx, executor=InlineExecutor(), **kwargs), produced
+
+
+def test_window_leans_with_the_scrub_direction():
+    prefetcher, produced = recording_prefetcher(ahead=3, behind=1, capacity=5)
+    assert prefetcher.get(10) == "slice 10"
+    assert set(prefetcher.buffer) == {9, 10, 11, 12, 13}
+    assert prefetcher.get(11) == "slice 11"
+    assert prefetcher.hits == 1 and prefetcher.misses == 1
+    # Scrubbing back: three slices below, one above
+    prefetcher.get(6)
+    assert {5, 4, 3, 7} <= set(prefetcher.buffer)
+    assert produced.count(11) == 1
+
+
+def test_ring_drops_least_recently_wanted():
+    prefetcher, _ = recording_prefetcher(ahead=3, behind=1, capacity=5)
+    for idx in range(10, 20):
+        prefetcher.get(idx)
+        assert len(prefetcher.buffer) <= prefetcher.capacity
+    # The slice on screen is never the one dropped
+    assert set(prefetcher.buffer) == {18, 19, 20, 21, 22}
+
+
+def test_window_stays_inside_the_volume():
+    prefetcher, produced = recording_prefetcher(max_idx=4, ahead=3, behind=2)
+    prefetcher.get(3)
+    prefetcher.get(0)
+    assert sorted(set(produced)) == [0, 1, 2, 3, 4]
+
+
+def test_evicted_jobs_are_cancelled():
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    # Keeps the only worker busy, so the prefetched slices stay queued
+    executor.submit(release.wait)
+    try:
+        prefetcher = SlicePrefetcher(lambda idx: idx, 100, ahead=3, behind=1, capacity=5, executor=executor)
+        prefetcher.get(10)
+        queued = {idx: future for idx, future in prefetcher.buffer.items() if idx != 10}
+        prefetcher.get(30)
+        assert not set(queued) & set(prefetcher.buffer)
+        assert all(future.cancelled() for future in queued.values())
+        prefetcher.invalidate()
+        assert not prefetcher.buffer
+    finally:
+        release.set()
+        executor.shutdown(wait=True)
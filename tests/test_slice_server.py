@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from conftest import ellipsoid
+from label_volume import PACKED_SUFFIX, pack_masks
+from slice_server import SliceClient, SliceService, start_server
+
+SHAPE = (32, 32, 16)
+
+
+@pytest.fixture
+def server(write_mask, tmp_path):
+    scan = write_mask("scans/liver.nii.gz", np.arange(np.prod(SHAPE)).reshape(SHAPE) % 200)
+    write_mask("liver/Masks/liver.nii.gz", ellipsoid(SHAPE, (12, 16, 8), (6, 6, 4)))
+    write_mask("liver/Masks/spleen.nii.gz", ellipsoid(SHAPE, (24, 16, 8), (4, 4, 3)))
+    masks = {
+        "Liver": write_mask("masks/liver.nii.gz", ellipsoid(SHAPE, (12, 16, 8), (6, 6, 4))),
+        "Gall Bladder": write_mask("masks/gall_bladder.nii.gz", ellipsoid(SHAPE, (20, 16, 8), (3, 3, 2))),
+    }
+    (tmp_path / "liver" / "Packed").mkdir(parents=True)
+    pack_masks(masks, str(tmp_path / "liver" / "Packed" / f"labels{PACKED_SUFFIX}"))
+    service = SliceService(str(tmp_path), scan.replace("liver.nii.gz", "{case}.nii.gz"), cache_dir=None)
+    http, thread = start_server(service, port=0)
+    yield service, SliceClient(f"http://127.0.0.1:{http.server_address[1]}")
+    http.shutdown()
+    http.server_close()
+    service.catalog.close()
+
+
+def test_serves_slices_and_meshes(server):
+    service, client = server
+    assert client.cases() == {"liver": ["Masks", "Packed"]}
+    info = client.info("liver", "Masks")
+    assert info["shape"] == SHAPE
+    assert sorted(info["table"].values()) == ["liver.nii.gz", "spleen.nii.gz"]
+    image, labels = client.planes("liver", "Masks", "axial", 8)
+    assert image.shape == labels.shape
+    assert set(np.unique(labels)) == {0, *info["table"]}
+    assert client.mesh("liver", "Masks", "spleen.nii.gz").full.n_points > 0
+    with pytest.raises(ValueError):
+        client.planes("liver", "Masks", "axial", SHAPE[2])
+
+
+def test_packed_labels_keep_aliased_entries(server):
+    service, client = server
+    info = client.info("liver", "Packed")
+    # 'Gall Bladder' is catalogued as the 'gallbladder' entry and must still be drawn
+    assert sorted(info["table"].values()) == sorted(info["entries"]) == ["gallbladder", "liver"]
+    ids = {name: label for label, name in info["table"].items()}
+    _, labels = client.planes("liver", "Packed", "axial", 8)
+    assert ids["gallbladder"] in labels
+    assert client.mesh("liver", "Packed", "gallbladder").full.n_points > 0
+
+
+def test_unknown_segmentation_leaves_no_lock(server):
+    service, client = server
+    for model in ("Nope", "Other"):
+        with pytest.raises(KeyError):
+            client.info("liver", model)
+    with pytest.raises(KeyError):
+        client.mesh("liver", "Masks", "nope")
+    assert set(service.loading) == {("liver", "Masks")}
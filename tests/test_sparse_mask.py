@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from conftest import ellipsoid
+from mask_index import MaskIndex
+from sparse_mask import SparseMask, compact
+
+SHAPE = (30, 26, 18)
+
+
+def sample_mask():
+    mask = ellipsoid(SHAPE, (12, 13, 9), (7, 6, 5))
+    # A second piece and runs touching the edges of the grid
+    mask |= ellipsoid(SHAPE, (25, 5, 15), (3, 3, 3))
+    mask[0, 0, :] = True
+    mask[29, 25, 17] = True
+    return mask
+
+
+def test_round_trip():
+    mask = sample_mask()
+    sparse = SparseMask.from_mask(mask)
+    assert sparse.voxel_count == mask.sum()
+    assert np.array_equal(np.asarray(sparse), mask)
+    filled = np.zeros(SHAPE, dtype=np.uint8)
+    sparse.fill(filled, 3)
+    assert np.array_equal(filled == 3, mask)
+
+
+@pytest.mark.parametrize("axis", [0, 1, 2])
+def test_planes_and_index(axis):
+    mask = sample_mask()
+    sparse = SparseMask.from_mask(mask)
+    for idx in range(SHAPE[axis]):
+        key = [slice(None)] * 3
+        key[axis] = idx
+        assert np.array_equal(sparse[tuple(key)], mask[tuple(key)]), idx
+    dense_index = MaskIndex.from_mask(mask)
+    assert np.array_equal(sparse.index().occupied_slices(axis), dense_index.occupied_slices(axis))
+
+
+def test_plane_painted_into_smaller_buffer():
+    mask = sample_mask()
+    plane = SparseMask.from_mask(mask).plane(0, 0)
+    buffer = np.zeros((10, 12), dtype=np.uint8)
+    plane.paint(buffer, 1)
+    assert np.array_equal(buffer == 1, mask[0, :10, :12])
+
+
+def test_empty_and_dense_masks():
+    empty = SparseMask.from_mask(np.zeros(SHAPE, dtype=bool))
+    assert empty.voxel_count == 0 and not np.asarray(empty).any()
+    dense = np.ones(SHAPE, dtype=bool)
+    assert compact(dense) is dense
+    assert isinstance(compact(ellipsoid(SHAPE, (12, 13, 9), (3, 3, 2))), SparseMask)
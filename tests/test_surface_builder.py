@@ -0,0 +1,41 @@
+import numpy as np
+
+from conftest import ellipsoid
+from mesh_builder import build_lods, load_lods, mesh_params
+from mesh_cache import MeshCache
+from surface_builder import build_surfaces
+
+SHAPE = (48, 48, 24)
+
+
+def same_mesh(a, b):
+    return np.array_equal(a.points, b.points) and np.array_equal(a.faces, b.faces)
+
+
+def test_surface_does_not_depend_on_group(write_mask):
+    kidney = write_mask("kidney.nii.gz", ellipsoid(SHAPE, (20, 24, 12), (10, 8, 6)))
+    # Overlaps the kidney, so a shared label map would carve into it
+    neighbour = write_mask("neighbour.nii.gz", ellipsoid(SHAPE, (30, 24, 12), (9, 9, 6)))
+    alone = build_surfaces({"kidney": (kidney, None)}, "fast")["kidney"]
+    grouped = build_surfaces({"neighbour": (neighbour, None), "kidney": (kidney, None)}, "fast")["kidney"]
+    assert same_mesh(alone, grouped)
+
+
+def test_packed_surface_does_not_depend_on_selected_labels(write_mask):
+    labels = np.zeros(SHAPE, dtype=np.uint8)
+    labels[ellipsoid(SHAPE, (20, 24, 12), (10, 8, 6))] = 1
+    labels[ellipsoid(SHAPE, (30, 24, 12), (9, 9, 6))] = 2
+    path = write_mask("labels.nii.gz", labels)
+    alone = build_surfaces({"a": (path, 1)}, "fast")["a"]
+    grouped = build_surfaces({"a": (path, 1), "b": (path, 2)}, "fast")["a"]
+    assert same_mesh(alone, grouped)
+
+
+def test_cached_surface_matches_any_group(write_mask, tmp_path):
+    kidney = write_mask("kidney.nii.gz", ellipsoid(SHAPE, (20, 24, 12), (10, 8, 6)))
+    neighbour = write_mask("neighbour.nii.gz", ellipsoid(SHAPE, (30, 24, 12), (9, 9, 6)))
+    cache = MeshCache(str(tmp_path / "cache"))
+    build_lods({"neighbour": (neighbour, None), "kidney": (kidney, None)}, cache, "fast")
+    cached = cache.get_lod(kidney, label=None, **mesh_params("fast"))
+    fresh = load_lods({"kidney": (kidney, None)}, None, "fast")["kidney"]
+    assert same_mesh(cached.full, fresh.full)
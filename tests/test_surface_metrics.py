@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from conftest import ellipsoid
+from surface_metrics import boundary, surface_metrics
+
+SHAPE = (40, 40, 24)
+
+
+def cube(lo, hi, shape=SHAPE):
+    mask = np.zeros(shape, dtype=bool)
+    mask[lo:hi, lo:hi, lo:hi] = True
+    return mask
+
+
+def brute_force(pred, gt, spacing, tolerance=2.0):
+    """The metrics from every pair of boundary voxels, without distance transforms."""
+    a = np.argwhere(boundary(pred)) * spacing
+    b = np.argwhere(boundary(gt)) * spacing
+    d = cdist(a, b)
+    pred_to_gt, gt_to_pred = d.min(axis=1), d.min(axis=0)
+    n = len(a) + len(b)
+    return {
+        "HD95": max(np.percentile(pred_to_gt, 95), np.percentile(gt_to_pred, 95)),
+        "ASSD": (pred_to_gt.sum() + gt_to_pred.sum()) / n,
+        "Surface_Dice": (np.count_nonzero(pred_to_gt <= tolerance) + np.count_nonzero(gt_to_pred <= tolerance)) / n,
+    }
+
+
+def test_identical_masks():
+    mask = ellipsoid(SHAPE, (20, 20, 12), (9, 7, 5))
+    assert surface_metrics(mask, mask, (0.8, 0.8, 2.0)) == {"HD95": 0.0, "ASSD": 0.0, "Surface_Dice": 1.0}
+
+
+def test_empty_mask_gives_nan():
+    metrics = surface_metrics(np.zeros(SHAPE, dtype=bool), cube(5, 10), (1, 1, 1))
+    assert all(math.isnan(v) for v in metrics.values())
+
+
+def test_grown_cube():
+    # Every face of the inner cube lies exactly 2 voxels inside the outer one
+    inner, outer = cube(8, 16), cube(6, 18)
+    metrics = surface_metrics(inner, outer, (1, 1, 1))
+    assert metrics == pytest.approx(brute_force(inner, outer, np.ones(3)))
+    assert 2.0 <= metrics["HD95"] <= math.sqrt(12)
+    # Inner-to-outer distances are all 2 mm, only the outer edges and corners are further away
+    assert 0.5 < metrics["Surface_Dice"] < 1.0
+    assert surface_metrics(inner, outer, (1, 1, 1), tolerance=math.sqrt(12))["Surface_Dice"] == 1.0
+
+
+@pytest.mark.parametrize("spacing", [(1.0, 1.0, 1.0), (0.8, 0.8, 2.0)])
+def test_shifted_ellipsoid_matches_brute_force(spacing):
+    pred = ellipsoid(SHAPE, (18, 20, 12), (8, 7, 5))
+    gt = ellipsoid(SHAPE, (21, 19, 13), (9, 7, 4))
+    assert surface_metrics(pred, gt, spacing) == pytest.approx(brute_force(pred, gt, np.array(spacing)))
+
+
+def test_masks_at_the_grid_edge():
+    # Cut off by the grid, the masks still get a closed boundary, as if padded
+    pred, gt = cube(0, 8), cube(0, 10)
+    metrics = surface_metrics(pred, gt, (1, 1, 1))
+    assert metrics == pytest.approx(brute_force(np.pad(pred, 1), np.pad(gt, 1), np.ones(3)))
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ellipsoid
+from volume_pyramid import VolumePyramid, downsample, level_affine
+
+SHAPE = (17, 14, 9)
+
+
+def blocks(data, factor):
+    """Every factor^3 block of data padded with its edge values, as flat arrays."""
+    pad = [(0, -n % factor) for n in data.shape]
+    data = np.pad(data, pad, mode="edge")
+    out = {}
+    for i, j, k in np.ndindex(*(n // factor for n in data.shape)):
+        out[i, j, k] = data[i * factor:(i + 1) * factor, j * factor:(j + 1) * factor, k * factor:(k + 1) * factor].ravel()
+    return out
+
+
+@pytest.mark.parametrize("factor", [2, 4])
+def test_downsample_matches_blockwise_reference(factor):
+    rng = np.random.default_rng(factor)
+    image = rng.integers(-100, 100, size=SHAPE).astype(np.int16)
+    mask = ellipsoid(SHAPE, (8, 7, 4), (6, 5, 3))
+    labels = rng.integers(0, 4, size=SHAPE).astype(np.uint8)
+    small_image = downsample(image, factor, "image")
+    small_mask = downsample(mask, factor, "mask")
+    small_labels = downsample(labels, factor, "labels")
+    assert small_image.dtype == image.dtype and small_labels.dtype == labels.dtype
+    for index, block in blocks(image, factor).items():
+        assert small_image[index] == np.rint(block.mean())
+    for index, block in blocks(mask, factor).items():
+        assert small_mask[index] == (2 * block.sum() >= block.size)
+    for index, block in blocks(labels, factor).items():
+        # Most frequent label, ties to the smaller one
+        assert small_labels[index] == np.argmax(np.bincount(block))
+
+
+def test_level_affine_centres_blocks():
+    affine = np.diag([0.8, 0.8, 2.0, 1.0])
+    affine[:3, 3] = (-10, 5, 3)
+    coarse = level_affine(affine, 4)
+    # Voxel 0 of the level sits in the middle of voxels 0..3 of the full grid
+    assert np.allclose(coarse @ [0, 0, 0, 1], affine @ [1.5, 1.5, 1.5, 1])
+    assert np.allclose(coarse @ [1, 0, 0, 1], affine @ [5.5, 1.5, 1.5, 1])
+
+
+def test_levels_cached_per_file_version(write_mask, tmp_path):
+    mask = ellipsoid(SHAPE, (8, 7, 4), (6, 5, 3))
+    path = write_mask("liver.nii.gz", mask)
+    pyramid = VolumePyramid(path, "mask", cache_dir=str(tmp_path / "pyramids"))
+    assert pyramid.coarsest() == (None, None) and not pyramid.complete()
+    pyramid.build(mask)
+    assert pyramid.complete()
+    factor, level = pyramid.coarsest()
+    assert factor == 4 and np.array_equal(level, downsample(mask, 4, "mask"))
+    assert not level.flags.writeable
+    # A rewritten file has other levels
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert not VolumePyramid(path, "mask", cache_dir=pyramid.cache_dir).complete()
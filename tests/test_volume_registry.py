@@ -0,0 +1,28 @@
+import numpy as np
+
+from conftest import ellipsoid
+from volume_registry import VolumeRegistry
+
+SHAPE = (32, 32, 16)
+PLANE = SHAPE[0] * SHAPE[1]
+
+
+def test_budget_covers_growing_lazy_caches(write_mask):
+    first = write_mask("first.nii", ellipsoid(SHAPE, (16, 16, 8), (8, 8, 4)))
+    second = write_mask("second.nii", ellipsoid(SHAPE, (16, 16, 8), (6, 6, 3)))
+    registry = VolumeRegistry(budget_bytes=3 * PLANE)
+    a = registry.lazy(first)
+    for k in range(2):
+        a[:, :, k]
+    b = registry.lazy(second)
+    assert registry.memory_used() == 2 * PLANE
+    # Reading from b pushes the total past the budget, a is least recently used
+    for k in range(2):
+        b[:, :, k]
+    assert registry.memory_used() <= registry.budget_bytes
+    assert registry.evictions == 1
+    assert a.cached_bytes == 0
+    assert b.cached_bytes == 2 * PLANE
+    # An evicted volume can still be read, it is no longer counted
+    assert np.array_equal(a[:, :, 8], ellipsoid(SHAPE, (16, 16, 8), (8, 8, 4))[:, :, 8])
+    assert registry.memory_used() == 2 * PLANE
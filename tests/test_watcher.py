@@ -0,0 +1,36 @@
+import functools
+
+import numpy as np
+
+import watcher
+from conftest import ellipsoid
+from mesh_builder import load_lods, mesh_params
+from mesh_cache import MeshCache
+from volume_pyramid import VolumePyramid
+
+SHAPE = (48, 48, 24)
+
+
+def test_overlapping_cases_in_flat_folder(write_mask, tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "VolumePyramid", functools.partial(VolumePyramid, cache_dir=str(tmp_path / "pyramids")))
+    folder = "segmented_organs_by_Swin UNETR"
+    paths = [
+        write_mask(f"{folder}/img0005.nii.gz_liver.nii.gz", ellipsoid(SHAPE, (18, 24, 12), (10, 9, 6))),
+        write_mask(f"{folder}/img0005.nii.gz_spleen.nii.gz", ellipsoid(SHAPE, (36, 24, 12), (6, 6, 5))),
+        # The second case sits across both structures of the first one
+        write_mask(f"{folder}/img0006.nii.gz_liver.nii.gz", ellipsoid(SHAPE, (22, 24, 12), (11, 10, 7))),
+        write_mask(f"{folder}/img0006.nii.gz_spleen.nii.gz", ellipsoid(SHAPE, (33, 24, 12), (7, 7, 6))),
+    ]
+    files = [(path, *watcher.describe(path, str(tmp_path))) for path in paths]
+    assert {case for _, _, case in files} == {"0005", "0006"}
+
+    cache = MeshCache(str(tmp_path / "meshes"))
+    result = watcher.process_batch(files, str(tmp_path), cache_dir=cache.cache_dir)
+    assert result["errors"] == []
+    assert result["meshes"] == 4
+    for path in paths:
+        cached = cache.get_lod(path, label=None, **mesh_params())
+        assert cached is not None, path
+        alone = load_lods({path: (path, None)})[path]
+        assert np.array_equal(cached.full.points, alone.full.points)
+        assert np.array_equal(cached.full.faces, alone.full.faces)
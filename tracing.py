@@ -0,0 +1,191 @@
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+
+# MIS_TRACE=1 (or a .json path) records spans and writes a Chrome trace /
+# Perfetto file at exit; MIS_TRACE_OVERLAY=1 also shows them in the app
+_setting = os.environ.get("MIS_TRACE", "")
+ENABLED = _setting not in ("", "0")
+TRACE_FILE = _setting if _setting.endswith(".json") else "trace.json"
+OVERLAY = ENABLED and os.environ.get("MIS_TRACE_OVERLAY", "0") == "1"
+# Spans longer than this are reported as slow
+SLOW_MS = float(os.environ.get("MIS_TRACE_SLOW_MS", 100))
+MAX_EVENTS = 200000
+
+_events = deque(maxlen=MAX_EVENTS)
+_thread_names = {}
+# Recent frame times (spans of category "frame") and slow spans, for the overlay
+frame_times = deque(maxlen=120)
+slow_spans = deque(maxlen=5)
+_origin_ns = time.perf_counter_ns()
+
+
+class _NullSpan:
+    """Shared do-nothing span handed out while tracing is off."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, time.perf_counter_ns(), self.cat, self.args)
+        return False
+
+
+class _NullStages:
+    def mark(self, stage, **args):
+        pass
+
+    def done(self):
+        pass
+
+
+_NULL_STAGES = _NullStages()
+
+
+class _Stages:
+    __slots__ = ("name", "cat", "args", "start", "last")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = self.last = time.perf_counter_ns()
+
+    def mark(self, stage, **args):
+        """Close the stage that ran since the previous mark."""
+        t = time.perf_counter_ns()
+        record(stage, self.last, t, self.cat, args)
+        self.last = t
+
+    def done(self):
+        record(self.name, self.start, time.perf_counter_ns(), self.cat, self.args)
+
+
+def span(name, cat="app", **args):
+    """Context manager timing one named stage; a shared no-op while tracing is off."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def stages(name, cat="app", **args):
+    """
+    Lap timer for a long function: each mark(stage) records the time since
+    the previous mark, done() the whole function. A shared no-op while
+    tracing is off.
+    """
+    if not ENABLED:
+        return _NULL_STAGES
+    return _Stages(name, cat, args)
+
+
+def now():
+    return time.perf_counter_ns()
+
+
+def record(name, start_ns, end_ns, cat="app", args=None):
+    """Add a finished span, e.g. one measured across threads or callbacks."""
+    if not ENABLED:
+        return
+    thread = threading.current_thread()
+    _thread_names.setdefault(thread.ident, thread.name)
+    dur_ms = (end_ns - start_ns) / 1e6
+    _events.append({
+        "name": name,
+        "cat": cat,
+        "ph": "X",
+        "ts": (start_ns - _origin_ns) / 1000.0,
+        "dur": (end_ns - start_ns) / 1000.0,
+        "pid": os.getpid(),
+        "tid": thread.ident,
+        "args": args or {},
+    })
+    if cat == "frame":
+        frame_times.append(dur_ms)
+    if dur_ms > SLOW_MS:
+        slow_spans.append((name, dur_ms))
+        print(f"[slow] {name} took {dur_ms:.0f} ms")
+
+
+def enable(path=None):
+    """Turn tracing on at runtime (e.g. from a script), exporting to path at exit."""
+    global ENABLED, TRACE_FILE
+    if path is not None:
+        TRACE_FILE = path
+    if not ENABLED:
+        ENABLED = True
+        atexit.register(export)
+
+
+def export(path=None):
+    """Write the recorded spans as Chrome trace JSON (opens in chrome://tracing and Perfetto)."""
+    path = path or TRACE_FILE
+    pid = os.getpid()
+    meta = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in list(_thread_names.items())
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": meta + list(_events), "displayTimeUnit": "ms"}, f)
+    print(f"[trace] {len(_events)} spans written to {path}")
+    return path
+
+
+def overlay_text():
+    lines = []
+    times = list(frame_times)
+    if times:
+        ordered = sorted(times)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        mean = sum(times) / len(times)
+        lines.append(f"frame {times[-1]:5.1f} ms  mean {mean:5.1f}  p95 {p95:5.1f}  ({1000 / max(mean, 1e-3):4.0f} fps)")
+    for name, dur_ms in list(slow_spans):
+        lines.append(f"slow  {name}: {dur_ms:.0f} ms")
+    return "\n".join(lines) or "tracing"
+
+
+def install_overlay(window, interval_ms=250):
+    """Translucent label in the top right corner of window with frame times and the latest slow spans."""
+    from PySide6 import QtCore, QtWidgets
+    label = QtWidgets.QLabel(window)
+    label.setStyleSheet("background: rgba(0, 0, 0, 170); color: #7CFC00; font: 11px monospace; padding: 4px; border-radius: 4px;")
+    label.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+
+    def refresh():
+        label.setText(overlay_text())
+        label.adjustSize()
+        label.move(window.width() - label.width() - 8, 8)
+        label.raise_()
+
+    timer = QtCore.QTimer(label)
+    timer.timeout.connect(refresh)
+    timer.start(interval_ms)
+    label.show()
+    return label
+
+
+# Worker processes inherit MIS_TRACE, only the main process writes the file
+if ENABLED and multiprocessing.parent_process() is None:
+    atexit.register(export)
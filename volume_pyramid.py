@@ -0,0 +1,137 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+PYRAMID_DIR = os.path.join(os.path.dirname(__file__), ".pyramid_cache")
+MAX_PYRAMID_BYTES = 256 * 1024 * 1024
+# Downsampling factors cached next to full resolution, finest first
+PYRAMID_FACTORS = (2, 4)
+
+
+def _majority(blocks):
+    """Most frequent value along the last axis (ties go to the smaller value)."""
+    lo, hi = blocks.min(axis=1), blocks.max(axis=1)
+    mode = lo.copy()
+    # Most blocks hold a single label, only the mixed ones need sorting
+    mixed = np.flatnonzero(lo != hi)
+    if len(mixed):
+        s = np.sort(blocks[mixed], axis=1)
+        k = s.shape[1]
+        positions = np.arange(k)
+        starts = np.ones(s.shape, dtype=bool)
+        starts[:, 1:] = s[:, 1:] != s[:, :-1]
+        run_start = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+        # The longest run ends where the running length peaks
+        best = np.argmax(positions - run_start, axis=1)
+        mode[mixed] = s[np.arange(len(mixed)), best]
+    return mode
+
+
+def downsample(data, factor, kind="image"):
+    """
+    Block-downsample a volume by factor along every axis. Images keep the
+    block mean, masks ("mask") and label maps ("labels") the majority label
+    of each block.
+    """
+    data = np.asarray(data)
+    if factor == 1:
+        return data
+    pad = [(0, -n % factor) for n in data.shape[:3]]
+    if any(after for _, after in pad):
+        data = np.pad(data, pad, mode="edge")
+    nx, ny, nz = (n // factor for n in data.shape[:3])
+    blocks = data.reshape(nx, factor, ny, factor, nz, factor)
+    if kind == "image":
+        mean = blocks.mean(axis=(1, 3, 5), dtype=np.float32)
+        return np.rint(mean).astype(data.dtype) if np.issubdtype(data.dtype, np.integer) else mean
+    if kind == "mask":
+        return blocks.sum(axis=(1, 3, 5), dtype=np.int32) * 2 >= factor ** 3
+    blocks = blocks.transpose(0, 2, 4, 1, 3, 5).reshape(nx * ny * nz, factor ** 3)
+    return _majority(blocks).reshape(nx, ny, nz)
+
+
+def level_affine(affine, factor):
+    """Affine of a level downsampled by factor: each voxel sits at the centre of its block."""
+    scale = np.diag([factor, factor, factor, 1.0])
+    scale[:3, 3] = (factor - 1) / 2.0
+    return np.asarray(affine) @ scale
+
+
+class VolumePyramid:
+    """
+    Downsampled copies of one volume, cached on disk as .npy and keyed by
+    the source path, size and mtime, so a volume that was opened before can
+    be painted from a small level before the full one is decoded.
+    """
+    def __init__(self, path, kind="image", factors=PYRAMID_FACTORS, cache_dir=PYRAMID_DIR, max_bytes=MAX_PYRAMID_BYTES):
+        self.path = os.path.abspath(path)
+        self.kind = kind
+        self.factors = tuple(sorted(factors))
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        st = os.stat(self.path)
+        self.key = hashlib.sha1(f"{self.path}:{st.st_size}:{st.st_mtime_ns}:{kind}".encode()).hexdigest()
+
+    def level_path(self, factor):
+        return os.path.join(self.cache_dir, f"{self.key}_{factor}x.npy")
+
+    def level(self, factor):
+        """Cached level downsampled by factor, or None."""
+        path = self.level_path(factor)
+        if not os.path.exists(path):
+            return None
+        try:
+            data = np.load(path)
+        except (OSError, ValueError) as e:
+            print(f"[warn] dropping unreadable pyramid level {path}: {e}")
+            os.remove(path)
+            return None
+        os.utime(path)
+        data.flags.writeable = False
+        return data
+
+    def coarsest(self):
+        """(factor, array) of the coarsest cached level, or (None, None)."""
+        factor = self.factors[-1]
+        data = self.level(factor)
+        return (factor, data) if data is not None else (None, None)
+
+    def complete(self):
+        return all(os.path.exists(self.level_path(f)) for f in self.factors)
+
+    def build(self, data):
+        """Downsample the full volume into every level and cache them."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = np.asarray(data)
+        for factor in self.factors:
+            level = downsample(data, factor, self.kind)
+            # Write to a temp file first so a concurrent reader never sees a partial level
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, level)
+            os.replace(tmp, self.level_path(factor))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npy"):
+                continue
+            p = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, p = entries.pop(0)
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from chunk_store import ChunkedVolume, open_chunked, read_volume
+from lazy_volume import LazyVolume
+from mask_index import MaskIndex
+from packed_mask import PackedMask
+from sparse_mask import SparseMask, compact
+
+# Global RAM budget, can be overridden with MIS_VOLUME_BUDGET_MB
+DEFAULT_BUDGET_BYTES = int(os.environ.get("MIS_VOLUME_BUDGET_MB", 1024)) * 1024 * 1024
+
+
+def _nbytes(entry):
+    # Lazy volumes only cost what their slab cache currently holds
+    if isinstance(entry, (LazyVolume, ChunkedVolume)):
+        return entry.cached_bytes
+    return entry.nbytes
+
+
+class VolumeRegistry:
+    """
+    Process-wide store of loaded volumes shared by all viewers. Volumes are
+    kept in their on-disk dtype (uint8/bool masks, int16 CT), handed out
+    read-only and evicted least-recently-used once the RAM budget is exceeded,
+    which lazy volumes re-check whenever their decoded caches grow.
+    Entries are dropped automatically when the source file changes.
+    """
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, path, kind, loader):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (path, kind)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] == stamp:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        entry = loader(path)
+        if isinstance(entry, np.ndarray):
+            entry.flags.writeable = False
+        with self.lock:
+            self.entries[key] = (stamp, entry)
+            self.entries.move_to_end(key)
+            self.evict()
+        return entry
+
+    def array(self, path):
+        """Whole volume in its native dtype (scaled images come back as float)."""
+        return self._get(path, "array", read_volume)
+
+    def mask(self, path):
+        """Binary mask as a bool array, one byte per voxel."""
+        return self._get(path, "mask", lambda p: read_volume(p) > 0.5)
+
+    def compact_mask(self, path):
+        """Binary mask, run-length encoded (SparseMask) when it fills less than SPARSE_DENSITY of its grid."""
+        return self._get(path, "compact", lambda p: compact(read_volume(p)))
+
+    def packed(self, path):
+        """Binary mask bit-packed (PackedMask), 8 voxels per byte."""
+        return self._get(path, "packed", lambda p: PackedMask.from_mask(read_volume(p)))
+
+    def index(self, path):
+        """MaskIndex (bounding box, occupied slices, voxel count) of a binary mask."""
+        def load(p):
+            mask = self.compact_mask(p)
+            return mask.index() if isinstance(mask, SparseMask) else MaskIndex.from_mask(mask)
+        return self._get(path, "index", load)
+
+    def lazy(self, path):
+        """
+        Shared slice-on-demand volume, its decoded slabs count against the
+        budget: a ChunkedVolume for .nii.gz files (re-encoded into the chunk
+        cache on first use), a LazyVolume otherwise.
+        """
+        return self._get(path, "lazy", lambda p: self._watch((p, "lazy"), open_chunked(p) or LazyVolume(p)))
+
+    def _watch(self, key, volume):
+        """Re-check the budget whenever the caches of a lazy volume grow, it is the most recently used then."""
+        def grew():
+            with self.lock:
+                cached = self.entries.get(key)
+                if cached is not None and cached[1] is volume:
+                    self.entries.move_to_end(key)
+                    self.evict()
+        volume.on_grow = grew
+        return volume
+
+    def memory_used(self):
+        with self.lock:
+            return sum(_nbytes(entry) for _, entry in self.entries.values())
+
+    def evict(self):
+        with self.lock:
+            used = self.memory_used()
+            while used > self.budget_bytes and len(self.entries) > 1:
+                _, (_, entry) = self.entries.popitem(last=False)
+                used -= _nbytes(entry)
+                self.evictions += 1
+                if isinstance(entry, (LazyVolume, ChunkedVolume)):
+                    self._release(entry)
+
+    @staticmethod
+    def _release(volume):
+        # Whoever still holds it can go on reading, it only gives back what it decoded and its file
+        volume.on_grow = None
+        if isinstance(volume, ChunkedVolume):
+            volume.close()
+        else:
+            volume.clear()
+
+    def clear(self):
+        with self.lock:
+            for _, entry in self.entries.values():
+                if isinstance(entry, (LazyVolume, ChunkedVolume)):
+                    self._release(entry)
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_bytes": self.memory_used(),
+                "budget_bytes": self.budget_bytes,
+            }
+
+    def report(self):
+        s = self.stats()
+        return (f"volumes: {s['entries']} cached, {s['hits']} hits, {s['misses']} misses, "
+                f"{s['evictions']} evicted, {s['memory_bytes'] / 2**20:.1f}/{s['budget_bytes'] / 2**20:.0f} MB")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = VolumeRegistry()
+        return _registry
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import VIEW_FOLDERS, get_catalog, index_file, normalize_organ, snapshot, watched_folders
+from evaluate import EVALUATION_CSV, MODEL_ABBREVIATIONS, MODEL_FOLDERS, ROOT, append_rows, find_ground_truth, normalize_case, score_masks
+from label_volume import PACKED_SUFFIX, LabelVolume, case_id
+from mesh_builder import load_lods
+from mesh_cache import CACHE_DIR, MeshCache
+from volume_pyramid import VolumePyramid
+from volume_registry import get_registry
+
+WATCH_STATE = os.path.join(ROOT, ".watch_state.json")
+POLL_SECONDS = 2.0
+# A file counts as finished once it has not been written to for this long
+DEBOUNCE_SECONDS = float(os.environ.get("MIS_WATCH_DEBOUNCE", 5.0))
+
+
+def describe(path, root, default_case=None):
+    """(model abbreviation, case) of a segmentation file, either may be None."""
+    parts = os.path.relpath(path, root).split(os.sep)
+    folders = {folder: model for model, folder in MODEL_FOLDERS.items()}
+    if parts[0] in folders:
+        model = folders[parts[0]]
+    elif parts[0] in VIEW_FOLDERS and len(parts) == 3:
+        model = MODEL_ABBREVIATIONS.get(parts[1])
+    else:
+        return None, None
+    if parts[0] in folders and len(parts) == 3:
+        case = parts[1]
+    else:
+        case = case_id(path) or default_case
+    return model, normalize_case(case) if case is not None else None
+
+
+def process_batch(files, root=ROOT, gt_dir=None, cache_dir=CACHE_DIR, surface=True):
+    """
+    Worker entry point: catalog records, mesh cache entries, mask pyramids
+    and evaluation rows for the new or changed files [(path, model, case)]
+    of one folder. Returns {"records": [catalog records], "meshes": count,
+    "rows": [score rows], "errors": [messages]}.
+    """
+    registry = get_registry()
+    cache = MeshCache(cache_dir) if cache_dir else None
+    result = {"records": [], "meshes": 0, "rows": [], "errors": []}
+    sources = {}
+    for path, model, case in files:
+        try:
+            result["records"].append(index_file(path, root))
+            if path.endswith(PACKED_SUFFIX):
+                volume = LabelVolume.load(path)
+                masks = {normalize_organ(name): (lambda name=name: volume.mask(name)) for name in volume.names}
+                sources.update({(path, name): (path, label) for label, name in volume.table.items()})
+                pyramid = VolumePyramid(path, "labels")
+                if not pyramid.complete():
+                    pyramid.build(volume.labels)
+            else:
+                masks = {normalize_organ(path): lambda: registry.mask(path)}
+                sources[path] = (path, None)
+                pyramid = VolumePyramid(path, "mask")
+                if not pyramid.complete():
+                    pyramid.build(registry.mask(path))
+            if gt_dir is None or model is None or case is None:
+                continue
+            for organ, mask in masks.items():
+                gt_path = find_ground_truth(gt_dir, case, organ)
+                if gt_path is not None:
+                    result["rows"].append({"Model": model, "Patient_ID": case, "Organ": organ, **score_masks(mask(), gt_path, surface)})
+        except Exception as e:
+            result["errors"].append(f"{path}: {e}")
+    # Every file is meshed on its own, so the cases of a flat folder can share one call; cached ones are skipped
+    if cache is not None:
+        try:
+            result["meshes"] = len(load_lods(sources, cache))
+        except Exception as e:
+            result["errors"].append(f"meshes of {os.path.dirname(files[0][0])}: {e}")
+    # Pool workers live on, do not let them sit on decoded volumes
+    registry.clear()
+    return result
+
+
+class SegmentationWatcher:
+    """
+    Polls the segmentation folders for new or changed NIfTI files and gets
+    them ready for the viewer: catalog entries, cached meshes, mask pyramids
+    and evaluation rows. A folder is handed to the worker pool once none of its changed
+    files has been written to for debounce seconds, one job per folder at a
+    time. Processed files are remembered in state_path, so a restarted
+    watcher only picks up what changed in between.
+    """
+    def __init__(self, root=ROOT, gt_dir=None, out_csv=EVALUATION_CSV, cache_dir=CACHE_DIR, state_path=WATCH_STATE, debounce=DEBOUNCE_SECONDS, workers=None, surface=True, default_case=None):
+        self.root = root
+        self.folders = watched_folders(root)
+        self.gt_dir = gt_dir
+        self.out_csv = out_csv
+        self.cache_dir = cache_dir
+        self.state_path = state_path
+        self.debounce = debounce
+        self.surface = surface
+        self.default_case = default_case
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.executor = None
+        self.running = {}
+        self.processed = self._read_state()
+        self.catalog = get_catalog(root)
+
+    def _read_state(self):
+        try:
+            with open(self.state_path) as f:
+                return {path: tuple(sig) for path, sig in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.state_path)), suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.processed, f)
+        os.replace(tmp, self.state_path)
+
+    def changed(self):
+        """{folder: {path: signature}} of files that are new or changed since they were processed."""
+        current = snapshot(self.folders)
+        # Deleted files are forgotten, so they are processed again if they come back
+        for path in set(self.processed) - set(current):
+            del self.processed[path]
+        folders = {}
+        for path, sig in current.items():
+            if self.processed.get(path) != tuple(sig):
+                folders.setdefault(os.path.dirname(path), {})[path] = sig
+        return folders
+
+    def poll(self):
+        """Collect finished jobs and submit the folders whose changes have settled. Returns the number of files still waiting."""
+        self.collect()
+        waiting = 0
+        now_ns = time.time_ns()
+        for folder, files in self.changed().items():
+            settled = all(now_ns - mtime_ns >= self.debounce * 1e9 for _, mtime_ns in files.values())
+            if folder in {f for f, _ in self.running.values()} or not settled or len(self.running) >= 2 * self.workers:
+                waiting += len(files)
+                continue
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            batch = [(path, *describe(path, self.root, self.default_case)) for path in sorted(files)]
+            future = self.executor.submit(process_batch, batch, self.root, self.gt_dir, self.cache_dir, self.surface)
+            # The signatures seen at submit time: a file written again meanwhile is picked up on the next poll
+            self.running[future] = (folder, files)
+            waiting += len(files)
+            print(f"[watch] {len(files)} new or changed file(s) in {os.path.relpath(folder, self.root)}")
+        return waiting
+
+    def collect(self):
+        for future in [f for f in self.running if f.done()]:
+            folder, files = self.running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"records": [], "meshes": 0, "rows": [], "errors": [str(e)]}
+            for error in result["errors"]:
+                print(f"[warn] {error}")
+            for record in result["records"]:
+                self.catalog.put(record)
+            if result["rows"]:
+                append_rows(self.out_csv, result["rows"], self.surface)
+            # Failed files are not retried until they change again
+            self.processed.update(files)
+            self._write_state()
+            print(f"[watch] {os.path.relpath(folder, self.root)}: {result['meshes']} meshes, {len(result['rows'])} scores")
+
+    def run(self, interval=POLL_SECONDS, once=False):
+        """Poll until interrupted, or with once until everything present now has been processed."""
+        print(f"[watch] watching {len(self.folders)} folder(s) under {self.root}")
+        try:
+            while True:
+                waiting = self.poll()
+                if once and not waiting and not self.running:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the segmentation folders and cache meshes, pyramids and scores of new files")
+    parser.add_argument("--root", default=ROOT, help="folder holding the segmented_organs_by_* and organ folders")
+    parser.add_argument("--gt-dir", help="ground truth masks; without it nothing is scored")
+    parser.add_argument("--out", default=EVALUATION_CSV, help="CSV the scores are added to")
+    parser.add_argument("--case", help="case id for files without a case prefix, e.g. 0005")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--interval", type=float, default=POLL_SECONDS, help="seconds between polls")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="seconds a file must stay untouched before it is processed")
+    parser.add_argument("--state", default=WATCH_STATE, help="record of processed files")
+    parser.add_argument("--no-cache", action="store_true", help="do not write the mesh cache")
+    parser.add_argument("--no-surface", action="store_true", help="skip HD95, ASSD and surface Dice")
+    parser.add_argument("--once", action="store_true", help="process what is there now and exit")
+    args = parser.parse_args()
+    watcher = SegmentationWatcher(args.root, args.gt_dir, args.out, None if args.no_cache else CACHE_DIR, args.state, args.debounce, args.workers, not args.no_surface, args.case)
+    watcher.run(args.interval, args.once)
+
+
+if __name__ == "__main__":
+    main()